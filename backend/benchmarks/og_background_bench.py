@@ -0,0 +1,135 @@
+"""
+og_background_bench.py — peak RSS and time to turn a large feature image
+into the 1200×630 OG background, before and after draft-mode decoding.
+
+  * before — full decode, LANCZOS resize of the whole image, then crop
+             (the pipeline as it was)
+  * after  — og_card._load_background: JPEG draft decode, crop-box
+             resample with reducing_gap
+
+Fixtures are generated on first run into a temp dir: photo-like JPEGs at
+the sizes Ghost editors actually upload, plus one large PNG. Each
+(fixture, mode) runs in a fresh interpreter so its peak RSS (VmHWM) is
+that run's alone.
+
+    cd backend && python benchmarks/og_background_bench.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+FIXTURES = [
+    ('landscape-4000x2667.jpg', (4000, 2667)),
+    ('landscape-6000x4000.jpg', (6000, 4000)),
+    ('square-3000x3000.jpg', (3000, 3000)),
+    ('portrait-2400x3600.jpg', (2400, 3600)),
+    ('landscape-3000x2000.png', (3000, 2000)),
+]
+
+
+def make_fixtures(directory):
+    from PIL import Image, ImageFilter
+
+    os.makedirs(directory, exist_ok=True)
+    for name, size in FIXTURES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            continue
+        # Noise blurred into soft structure compresses like a photograph,
+        # unlike a flat fill which libjpeg decodes unrealistically fast.
+        img = Image.effect_noise((size[0] // 8, size[1] // 8), 64).convert('RGB')
+        img = img.resize(size, Image.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+        img = Image.merge('RGB', [img.getchannel(0), img.getchannel(1).rotate(180),
+                                  img.getchannel(2).transpose(Image.FLIP_LEFT_RIGHT)])
+        if name.endswith('.png'):
+            img.save(path, format='PNG')
+        else:
+            img.save(path, format='JPEG', quality=90)
+    return [os.path.join(directory, name) for name, _ in FIXTURES]
+
+
+def before(path):
+    from PIL import Image
+    import og_card
+
+    width, height = og_card.WIDTH, og_card.HEIGHT
+    bg_img = Image.open(path).convert('RGB')
+    img_ratio = bg_img.width / bg_img.height
+    if img_ratio > width / height:
+        new_width, new_height = int(height * img_ratio), height
+    else:
+        new_width, new_height = width, int(width / img_ratio)
+    bg_img = bg_img.resize((new_width, new_height), Image.LANCZOS)
+    left, top = (new_width - width) // 2, (new_height - height) // 2
+    return bg_img.crop((left, top, left + width, top + height))
+
+
+def after(path):
+    import og_card
+
+    try:
+        os.remove(og_card.derivative_path(path))  # measure the cold path
+    except FileNotFoundError:
+        pass
+    return og_card._load_background(path)
+
+
+def run_one(mode, path, runs):
+    """Child process: time `runs` conversions, report own peak RSS."""
+    fn = before if mode == 'before' else after
+    fn(path)  # warm imports and page cache
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        img = fn(path)
+        times.append(time.perf_counter() - t)
+    assert img.size == (1200, 630)
+    print(json.dumps({'ms': min(times) * 1000, 'rss_mib': peak_rss_kib() / 1024}))
+
+
+def peak_rss_kib():
+    # VmHWM resets on exec; ru_maxrss can carry the parent's peak over.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'tsop-og-bench'))
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_one(args.child[0], args.child[1], args.runs)
+
+    os.environ.setdefault('JWT_SECRET', 'bench')
+    paths = make_fixtures(args.fixtures)
+    print(f'{"fixture":28} {"before ms":>10} {"after ms":>9} {"before MiB":>11} {"after MiB":>10}')
+    for path in paths:
+        row = {}
+        for mode in ('before', 'after'):
+            out = subprocess.run(
+                [sys.executable, __file__, '--runs', str(args.runs), '--child', mode, path],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+            ).stdout
+            row[mode] = json.loads(out.strip().splitlines()[-1])
+        print(f'{os.path.basename(path):28} {row["before"]["ms"]:10.1f} {row["after"]["ms"]:9.1f} '
+              f'{row["before"]["rss_mib"]:11.1f} {row["after"]["rss_mib"]:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+caching.py — small in-process cache primitives shared by the backend.
+
+  * TTLCache — bounded LRU where every entry carries its own expiry, so one
+    cache can hold e.g. positive and negative lookups with different TTLs.
+  * SizedLRUCache — LRU bounded by a byte budget rather than an entry
+    count, for values whose size varies by orders of magnitude (article
+    bodies, rendered images).
+  * SingleFlight — request coalescing: concurrent callers asking for the
+    same key share one in-flight upstream call and its result.
+  * Generations — lets a fetch notice that its key was invalidated while it
+    was awaiting upstream, so it does not write the stale result back.
+
+Everything here is single-event-loop code: no locks, no awaits inside the
+critical sections. Each cache keeps hit/miss/eviction counters for
+/api/metrics.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU with per-entry TTL.
+
+    `get()` returns `default` for absent or expired keys; expired entries are
+    dropped lazily on access and from the LRU end when the cache is full.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SizedLRUCache:
+    """LRU bounded by total bytes, with an optional TTL.
+
+    Callers pass each value's size to `set()`; values larger than
+    `max_entry_bytes` are not cached at all so one huge item cannot flush
+    everything else.
+    """
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None,
+                 max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, size, value)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, _, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Like `get()` but leaves counters and LRU order alone."""
+        entry = self._data.get(key, _MISSING)
+        return default if entry is _MISSING else entry[2]
+
+    def set(self, key: Hashable, value: Any, size: int) -> bool:
+        self.pop(key)
+        if size > self.max_entry_bytes:
+            return False
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (expires_at, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+        return True
+
+    def pop(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls.
+
+    The first caller for a key starts `fn()` as a task; callers arriving
+    while it is in flight await the same task. Once it finishes the key is
+    forgotten, so results are never reused after the fact — pair with a
+    TTLCache for that. A cancelled waiter does not cancel the shared call.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable) -> None:
+        """Detach the in-flight call for `key`: callers arriving from now on
+        start a fresh one. Current waiters still get the old result."""
+        self._inflight.pop(key, None)
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._inflight),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+        }
+
+
+class Generations:
+    """Per-key invalidation counters, kept only while a fetch is running.
+
+        gen = generations.begin(key)
+        try:
+            value = await fetch()
+        finally:
+            fresh = generations.end(key, gen)
+        if fresh:
+            cache.set(key, value)
+
+    `invalidate(key)` during the await makes `end()` return False. Keys with
+    no fetch in flight are not tracked, so memory is bounded by concurrency.
+    """
+
+    def __init__(self):
+        self._active: dict = {}  # key -> [fetches in flight, generation]
+        self.discarded = 0
+
+    def begin(self, key: Hashable) -> int:
+        entry = self._active.setdefault(key, [0, 0])
+        entry[0] += 1
+        return entry[1]
+
+    def end(self, key: Hashable, generation: int) -> bool:
+        entry = self._active[key]
+        entry[0] -= 1
+        if entry[0] == 0:
+            del self._active[key]
+        fresh = entry[1] == generation
+        if not fresh:
+            self.discarded += 1
+        return fresh
+
+    def invalidate(self, key: Hashable) -> None:
+        entry = self._active.get(key)
+        if entry is not None:
+            entry[1] += 1
@@ -0,0 +1,279 @@
+"""
+geoip.py — in-process IP → country lookups for /api/geo/location.
+
+Pricing (INR vs USD) only needs the visitor's country, so instead of an
+outbound call to ip-api.com per visitor the backend answers from a local
+database configured with GEOIP_DB_PATH:
+
+  * `.mmdb` — a MaxMind-format database (GeoLite2-Country/City, DB-IP lite
+    mmdb, ...), read via the optional `maxminddb` package in mmap mode.
+  * `.csv`  — an IP-range CSV, one range per row:
+        start,end,country_code[,country_name]
+    with start/end either as addresses (DB-IP lite) or integers
+    (IP2Location LITE), IPv4 and IPv6 mixed. It is compiled once into a
+    sorted binary table next to it (`<csv>.bin`, rebuilt when the CSV is
+    newer) which is memory-mapped and binary-searched, so a lookup touches
+    a few pages and no parsing happens per request.
+  * `.bin`  — a table compiled ahead of time with
+        python geoip.py compile ranges.csv ranges.bin
+
+`reload()` (POST /api/geo/reload) re-opens the file after it has been
+replaced on disk; lookups keep using the old table until the new one is
+ready. When no database is configured or it fails to load, `available()`
+is False and the endpoint falls back to ip-api.com as before.
+
+Configuration (all optional):
+  - GEOIP_DB_PATH   .mmdb, .csv or .bin file (unset = remote fallback only)
+"""
+from __future__ import annotations
+
+import os
+import csv
+import sys
+import json
+import mmap
+import struct
+import asyncio
+import logging
+import ipaddress
+from array import array
+from bisect import bisect_right
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+GEOIP_DB_PATH = os.environ.get('GEOIP_DB_PATH', '')
+
+try:
+    import maxminddb
+    MAXMINDDB_AVAILABLE = True
+except ImportError:
+    maxminddb = None
+    MAXMINDDB_AVAILABLE = False
+
+# .bin layout: header, then v4 starts/ends (uint32, native order), v4
+# country codes (2 bytes each), v6 starts/ends (16-byte big-endian), v6
+# codes, then a JSON {code: name} map.
+_MAGIC = b'TSOPGEO1'
+_HEADER = struct.Struct('=8scxxxIII')  # magic, byteorder, n4, n6, names length
+
+
+# ─── Compiling CSV ranges ────────────────────────────────────────────────────
+def _parse_ip(value: str) -> ipaddress._BaseAddress:
+    value = value.strip().strip('"')
+    if value.isdigit():
+        n = int(value)
+        return ipaddress.IPv4Address(n) if n < 2 ** 32 else ipaddress.IPv6Address(n)
+    return ipaddress.ip_address(value)
+
+
+def compile_csv(csv_path: str, bin_path: str) -> tuple:
+    """Compile a range CSV into the binary table. Returns (v4 rows, v6 rows)."""
+    v4, v6, names = [], [], {}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            try:
+                start, end = _parse_ip(row[0]), _parse_ip(row[1])
+            except ValueError:
+                continue  # header line or junk
+            code = row[2].strip().upper()
+            if len(code) != 2 or code == '-':
+                continue
+            if len(row) > 3 and row[3].strip() and code not in names:
+                names[code] = row[3].strip()
+            if isinstance(start, ipaddress.IPv4Address) and isinstance(end, ipaddress.IPv4Address):
+                v4.append((int(start), int(end), code))
+            elif start.version == end.version:
+                v6.append((int(start), int(end), code))
+    v4.sort()
+    v6.sort()
+
+    names_blob = json.dumps(names).encode('utf-8')
+    tmp = f'{bin_path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, sys.byteorder[0].encode(), len(v4), len(v6), len(names_blob)))
+        array('I', (r[0] for r in v4)).tofile(f)
+        array('I', (r[1] for r in v4)).tofile(f)
+        f.write(''.join(r[2] for r in v4).encode('ascii'))
+        f.write(b''.join(r[0].to_bytes(16, 'big') for r in v6))
+        f.write(b''.join(r[1].to_bytes(16, 'big') for r in v6))
+        f.write(''.join(r[2] for r in v6).encode('ascii'))
+        f.write(names_blob)
+    os.replace(tmp, bin_path)
+    return len(v4), len(v6)
+
+
+# ─── Readers ─────────────────────────────────────────────────────────────────
+class _Keys16:
+    """Sequence view of packed 16-byte big-endian keys, for bisect."""
+
+    def __init__(self, buf: memoryview, count: int):
+        self.buf, self.count = buf, count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.buf[i * 16:(i + 1) * 16])
+
+
+class RangeTable:
+    """Memory-mapped .bin table; lookups are two binary searches' worth of
+    page reads."""
+
+    kind = 'ranges'
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, order, n4, n6, names_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or order != sys.byteorder[0].encode():
+            self._mm.close()
+            raise ValueError(f'{path} is not a geo table for this platform; recompile it')
+        view = memoryview(self._mm)
+        off = _HEADER.size
+        self._v4_starts = view[off:off + 4 * n4].cast('I'); off += 4 * n4
+        self._v4_ends = view[off:off + 4 * n4].cast('I'); off += 4 * n4
+        self._v4_codes = view[off:off + 2 * n4]; off += 2 * n4
+        self._v6_starts = _Keys16(view[off:off + 16 * n6], n6); off += 16 * n6
+        self._v6_ends = view[off:off + 16 * n6]; off += 16 * n6
+        self._v6_codes = view[off:off + 2 * n6]; off += 2 * n6
+        self.names = json.loads(bytes(view[off:off + names_len]) or b'{}')
+        self.size = (n4, n6)
+
+    def lookup(self, ip: ipaddress._BaseAddress) -> Optional[dict]:
+        if ip.version == 4:
+            key = int(ip)
+            i = bisect_right(self._v4_starts, key) - 1
+            if i < 0 or key > self._v4_ends[i]:
+                return None
+            code = bytes(self._v4_codes[2 * i:2 * i + 2]).decode('ascii')
+        else:
+            key = int(ip).to_bytes(16, 'big')
+            i = bisect_right(self._v6_starts, key) - 1
+            if i < 0 or key > bytes(self._v6_ends[16 * i:16 * i + 16]):
+                return None
+            code = bytes(self._v6_codes[2 * i:2 * i + 2]).decode('ascii')
+        return {'country_code': code, 'country': self.names.get(code, code), 'city': ''}
+
+    def close(self) -> None:
+        for attr in ('_v4_starts', '_v4_ends', '_v4_codes', '_v6_ends', '_v6_codes'):
+            getattr(self, attr).release()
+        self._v6_starts.buf.release()
+        self._mm.close()
+
+
+class MMDBReader:
+    """MaxMind-format database via the optional `maxminddb` package."""
+
+    kind = 'mmdb'
+
+    def __init__(self, path: str):
+        if not MAXMINDDB_AVAILABLE:
+            raise RuntimeError('maxminddb is not installed; cannot read .mmdb files')
+        self.path = path
+        self._reader = maxminddb.open_database(path, maxminddb.MODE_MMAP)
+        self.size = None
+
+    def lookup(self, ip: ipaddress._BaseAddress) -> Optional[dict]:
+        record = self._reader.get(str(ip))
+        if not record:
+            return None
+        country = record.get('country') or record.get('registered_country') or {}
+        code = country.get('iso_code')
+        if not code:
+            return None
+        return {
+            'country_code': code,
+            'country': (country.get('names') or {}).get('en', code),
+            'city': ((record.get('city') or {}).get('names') or {}).get('en', ''),
+        }
+
+    def close(self) -> None:
+        self._reader.close()
+
+
+# ─── Module state ────────────────────────────────────────────────────────────
+_reader = None
+stats_counters = {'lookups': 0, 'found': 0, 'not_found': 0, 'reloads': 0}
+
+
+def _open(path: str):
+    if path.endswith('.mmdb'):
+        return MMDBReader(path)
+    if path.endswith('.csv'):
+        bin_path = f'{path}.bin'
+        if not os.path.exists(bin_path) or os.path.getmtime(bin_path) < os.path.getmtime(path):
+            n4, n6 = compile_csv(path, bin_path)
+            logger.info(f'GeoIP: compiled {path} ({n4} IPv4 + {n6} IPv6 ranges)')
+        path = bin_path
+    return RangeTable(path)
+
+
+async def reload(path: Optional[str] = None) -> dict:
+    """(Re)open the database. The previous table keeps serving until the new
+    one is ready and stays in place if the new one fails to load."""
+    global _reader
+    path = path or GEOIP_DB_PATH
+    if not path:
+        return {'loaded': False, 'reason': 'GEOIP_DB_PATH not set'}
+    try:
+        new = await asyncio.to_thread(_open, path)
+    except Exception as e:
+        logger.error(f'GeoIP load failed for {path}: {e!r}')
+        return {'loaded': _reader is not None, 'error': str(e)}
+    old, _reader = _reader, new
+    stats_counters['reloads'] += 1
+    if old is not None:
+        try:
+            old.close()
+        except Exception:
+            pass
+    logger.info(f'GeoIP database loaded: {path} ({new.kind})')
+    return {'loaded': True, 'path': new.path, 'kind': new.kind}
+
+
+def available() -> bool:
+    return _reader is not None
+
+
+def lookup(ip: str) -> Optional[dict]:
+    """Country (and city, for city mmdbs) for a public IP; None if the
+    address is private/invalid, unknown, or no database is loaded."""
+    if _reader is None:
+        return None
+    stats_counters['lookups'] += 1
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        addr = None
+    if addr is not None and getattr(addr, 'ipv4_mapped', None):
+        addr = addr.ipv4_mapped
+    result = _reader.lookup(addr) if addr is not None and addr.is_global else None
+    stats_counters['found' if result else 'not_found'] += 1
+    return result
+
+
+async def startup() -> None:
+    if GEOIP_DB_PATH:
+        await reload()
+
+
+def stats() -> dict:
+    return {
+        **stats_counters,
+        'loaded': _reader is not None,
+        'kind': _reader.kind if _reader is not None else None,
+        'ranges': getattr(_reader, 'size', None),
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'compile':
+        sys.exit('usage: python geoip.py compile <ranges.csv> <out.bin>')
+    n4, n6 = compile_csv(sys.argv[2], sys.argv[3])
+    print(f'{sys.argv[3]}: {n4} IPv4 + {n6} IPv6 ranges')
@@ -0,0 +1,326 @@
+"""
+ghost_client.py — shared, pooled HTTP client for the Ghost Admin/Content APIs.
+
+Every Ghost call made by server.py and nominations.py goes through the single
+application-lifetime `httpx.AsyncClient` held here, so the TCP + TLS
+handshake to ghost.io is paid once per pooled connection rather than once per
+request.
+
+It also owns the Ghost Admin API JWT: one token is minted, cached in memory
+and re-minted shortly before it expires, instead of re-splitting the key and
+HS256-signing a fresh token on every request.
+
+Member lookups by email (`fetch_member`) are served from a bounded LRU with
+a TTL, with a shorter TTL for "no such member", and are invalidated
+explicitly when a payment is recorded for that email.
+
+Fetches of members by email, posts by slug and related posts are
+single-flighted: concurrent identical requests (a newsletter drop sends
+hundreds of readers to the same slug within seconds) share one upstream
+call. `inflight.stats()` reports how many calls were coalesced.
+
+Full posts fetched by slug are kept in a byte-budgeted LRU (`post_cache`).
+Each entry remembers the post's `updated_at`; Ghost post webhooks call
+`invalidate_post()` so an edit is visible on the next request.
+
+Lifecycle:
+  * startup()  — called from server.py's startup hook; builds the client
+  * shutdown() — called from server.py's shutdown hook; drains the pool
+  * get_client() lazily builds the client if startup() has not run yet
+    (scripts, ad-hoc imports), so callers never have to special-case it.
+
+Configuration (all optional):
+  - GHOST_HTTP_MAX_CONNECTIONS   total pooled connections       (default 20)
+  - GHOST_HTTP_MAX_KEEPALIVE     idle keep-alive connections    (default 10)
+  - GHOST_HTTP_KEEPALIVE_EXPIRY  seconds an idle conn is kept   (default 30)
+  - GHOST_HTTP_TIMEOUT           default per-call timeout, secs (default 10)
+  - GHOST_TOKEN_REFRESH_MARGIN   re-mint this many secs before exp (default 60)
+  - MEMBER_CACHE_SIZE            cached member lookups          (default 5000)
+  - MEMBER_CACHE_TTL             secs a found member is reused  (default 60)
+  - MEMBER_CACHE_NEGATIVE_TTL    secs a "not found" is reused   (default 15)
+  - ARTICLE_CACHE_MAX_BYTES      byte budget for cached posts   (default 32 MiB)
+  - ARTICLE_CACHE_TTL            safety-net TTL if a webhook is missed (default 900)
+
+HTTP/2 is negotiated when the optional `h2` package is installed; otherwise
+the client falls back to pooled HTTP/1.1 keep-alive.
+"""
+from __future__ import annotations
+
+import os
+import time
+import logging
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional
+
+import httpx
+import jwt
+
+from caching import Generations, SingleFlight, SizedLRUCache, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+GHOST_URL = os.environ.get('GHOST_URL', 'https://the-state-of-play.ghost.io')
+GHOST_ADMIN_API_KEY = os.environ.get('GHOST_ADMIN_API_KEY', '')
+
+MAX_CONNECTIONS = int(os.environ.get('GHOST_HTTP_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE = int(os.environ.get('GHOST_HTTP_MAX_KEEPALIVE', '10'))
+KEEPALIVE_EXPIRY = float(os.environ.get('GHOST_HTTP_KEEPALIVE_EXPIRY', '30'))
+DEFAULT_TIMEOUT = float(os.environ.get('GHOST_HTTP_TIMEOUT', '10'))
+
+ADMIN_TOKEN_LIFETIME = 5 * 60  # Ghost rejects Admin JWTs valid for > 5 min
+ADMIN_TOKEN_REFRESH_MARGIN = int(os.environ.get('GHOST_TOKEN_REFRESH_MARGIN', '60'))
+
+MEMBER_CACHE_SIZE = int(os.environ.get('MEMBER_CACHE_SIZE', '5000'))
+MEMBER_CACHE_TTL = float(os.environ.get('MEMBER_CACHE_TTL', '60'))
+MEMBER_CACHE_NEGATIVE_TTL = float(os.environ.get('MEMBER_CACHE_NEGATIVE_TTL', '15'))
+
+ARTICLE_CACHE_MAX_BYTES = int(os.environ.get('ARTICLE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+ARTICLE_CACHE_TTL = float(os.environ.get('ARTICLE_CACHE_TTL', '900'))
+
+try:
+    import h2  # noqa: F401 — only probing for HTTP/2 support
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# ─── Module state ────────────────────────────────────────────────────────────
+_client: Optional[httpx.AsyncClient] = None
+inflight = SingleFlight()
+
+
+class _NoCookies(DefaultCookiePolicy):
+    """Never store or send a cookie. The client is shared by every request,
+    so a member-session cookie Ghost sets while answering one reader must
+    not ride along on the next reader's call; the /members/api proxies pass
+    the caller's own cookies as an explicit header instead."""
+
+    def set_ok(self, cookie, request) -> bool:
+        return False
+
+    def return_ok(self, cookie, request) -> bool:
+        return False
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        cookies=CookieJar(policy=_NoCookies()),
+        http2=HTTP2_AVAILABLE,
+        timeout=DEFAULT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared pooled client. Pass `timeout=` per call to override the
+    default, and `follow_redirects=True` for Ghost CDN image URLs."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def startup() -> None:
+    get_client()
+    logger.info(
+        f'Ghost HTTP client ready: http2={HTTP2_AVAILABLE} '
+        f'max_connections={MAX_CONNECTIONS} max_keepalive={MAX_KEEPALIVE}'
+    )
+
+
+async def shutdown() -> None:
+    global _client
+    if _client is not None:
+        try:
+            await _client.aclose()
+        except Exception as e:
+            logger.warning(f'Ghost HTTP client close failed: {e!r}')
+        _client = None
+
+
+# ─── Admin API token ─────────────────────────────────────────────────────────
+class GhostAdminTokenProvider:
+    """Mints the Ghost Admin API JWT once and serves it from memory until
+    `refresh_margin` seconds before `exp`. The key is split and the secret
+    unhexlified a single time, at construction."""
+
+    def __init__(self, api_key: str, lifetime: int = ADMIN_TOKEN_LIFETIME,
+                 refresh_margin: int = ADMIN_TOKEN_REFRESH_MARGIN):
+        self.lifetime = lifetime
+        self.refresh_margin = min(refresh_margin, lifetime - 1)
+        self._kid: Optional[str] = None
+        self._secret: Optional[bytes] = None
+        self._token: Optional[str] = None
+        self._exp = 0
+        self.mints = 0
+        self.cache_hits = 0
+        if not api_key:
+            return
+        try:
+            kid, secret = api_key.split(':', 1)
+            self._kid, self._secret = kid, bytes.fromhex(secret)
+        except ValueError:
+            logger.error("Invalid GHOST_ADMIN_API_KEY format. Expected 'id:secret'")
+
+    def token(self) -> Optional[str]:
+        if self._secret is None:
+            return None
+        now = int(time.time())
+        if self._token and now < self._exp - self.refresh_margin:
+            self.cache_hits += 1
+            return self._token
+        try:
+            payload = {'iat': now, 'exp': now + self.lifetime, 'aud': '/admin/'}
+            self._token = jwt.encode(payload, self._secret, algorithm='HS256',
+                                     headers={'alg': 'HS256', 'typ': 'JWT', 'kid': self._kid})
+        except Exception as e:
+            logger.warning(f'Ghost JWT mint failed: {e!r}')
+            self._token, self._exp = None, 0
+            return None
+        self._exp = payload['exp']
+        self.mints += 1
+        return self._token
+
+    def stats(self) -> dict:
+        return {
+            'mints': self.mints,
+            'cache_hits': self.cache_hits,
+            'expires_in': max(0, self._exp - int(time.time())) if self._token else 0,
+        }
+
+
+admin_tokens = GhostAdminTokenProvider(GHOST_ADMIN_API_KEY)
+
+
+def admin_token() -> Optional[str]:
+    """Current Ghost Admin API JWT, or None if the key is missing/invalid."""
+    return admin_tokens.token()
+
+
+# ─── Members ─────────────────────────────────────────────────────────────────
+class GhostUpstreamError(Exception):
+    """Ghost answered with something other than 200, or could not be asked."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_NOT_FOUND = object()  # negative-cache sentinel; never handed to callers
+member_cache = TTLCache(MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL)
+member_generations = Generations()
+
+
+def normalise_email(email: str) -> str:
+    return (email or '').lower().strip()
+
+
+async def fetch_member(email: str) -> Optional[dict]:
+    """Ghost member (with subscriptions + labels) for this email, or None if
+    there is no such member. Served from `member_cache` when fresh.
+
+    Raises GhostUpstreamError if the Admin API is unavailable or returns a
+    non-200; transport errors propagate as-is. Neither is cached.
+    """
+    key = normalise_email(email)
+    cached = member_cache.get(key)
+    if cached is not None:
+        return None if cached is _NOT_FOUND else cached
+    return await inflight.do(('member', key), lambda: _fetch_member_uncached(key))
+
+
+async def _fetch_member_uncached(key: str) -> Optional[dict]:
+    token = admin_token()
+    if not token:
+        raise GhostUpstreamError('Ghost Admin API token unavailable')
+    generation = member_generations.begin(key)
+    try:
+        r = await get_client().get(
+            f'{GHOST_URL}/ghost/api/admin/members/',
+            params={'filter': f"email:'{key}'", 'include': 'subscriptions,labels'},
+            headers={'Authorization': f'Ghost {token}'},
+        )
+    finally:
+        # An invalidate_member() during the call (payment just recorded)
+        # means this answer may predate it: return it, don't cache it.
+        fresh = member_generations.end(key, generation)
+    if r.status_code != 200:
+        raise GhostUpstreamError(f'HTTP {r.status_code}', status_code=r.status_code)
+    members = r.json().get('members', [])
+    member = members[0] if members else None
+    if fresh:
+        if member is None:
+            member_cache.set(key, _NOT_FOUND, ttl=MEMBER_CACHE_NEGATIVE_TTL)
+        else:
+            member_cache.set(key, member)
+    return member
+
+
+def invalidate_member(email: str) -> None:
+    """Drop the cached lookup so the next request sees Ghost's current state
+    (e.g. a reader who has just paid, or was just created). A lookup already
+    in flight is detached and its result is not cached."""
+    key = normalise_email(email)
+    member_cache.pop(key)
+    member_generations.invalidate(key)
+    inflight.forget(('member', key))
+
+
+# ─── Posts ───────────────────────────────────────────────────────────────────
+post_cache = SizedLRUCache(ARTICLE_CACHE_MAX_BYTES, ttl=ARTICLE_CACHE_TTL)
+post_generations = Generations()
+
+
+def _post_size(post: dict) -> int:
+    # The body dominates; the flat 2 KiB covers title, tags, authors etc.
+    return len((post.get('html') or '').encode('utf-8')) + 2048
+
+
+async def fetch_post(slug: str) -> Optional[dict]:
+    """Full post (html, tags, authors) via the Admin API so paywalled bodies
+    are included. None if the key is missing or Ghost answers non-200;
+    transport errors propagate. Callers must not mutate the returned dict —
+    it is shared through `post_cache`."""
+    post = post_cache.get(slug)
+    if post is not None:
+        return post
+    return await inflight.do(('post', slug), lambda: _fetch_post_uncached(slug))
+
+
+def invalidate_post(slug: str, updated_at: Optional[str] = None) -> None:
+    """Drop the cached post unless it is already at `updated_at`. A fetch
+    already in flight is detached and its result is not cached."""
+    cached = post_cache.peek(slug)
+    if cached is not None and updated_at is not None and cached.get('updated_at') == updated_at:
+        return
+    post_cache.pop(slug)
+    post_generations.invalidate(slug)
+    inflight.forget(('post', slug))
+
+
+async def _fetch_post_uncached(slug: str) -> Optional[dict]:
+    token = admin_token()
+    if not token:
+        return None
+    generation = post_generations.begin(slug)
+    try:
+        r = await get_client().get(
+            f'{GHOST_URL}/ghost/api/admin/posts/slug/{slug}/',
+            params={'formats': 'html', 'include': 'tags,authors'},
+            headers={'Authorization': f'Ghost {token}'},
+        )
+    finally:
+        # A webhook that landed during the call may postdate this body.
+        fresh = post_generations.end(slug, generation)
+    if r.status_code != 200:
+        logger.warning(f'Ghost fetch post HTTP {r.status_code} for slug={slug}')
+        return None
+    posts = r.json().get('posts', [])
+    post = posts[0] if posts else None
+    if post is not None and fresh:
+        post_cache.set(slug, post, _post_size(post))
+    return post
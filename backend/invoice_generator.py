@@ -12,12 +12,30 @@ Compliance covered:
  - Inter-state (other Indian states) → IGST 18%
  - Export of services (non-IN) → 0% under LUT
  - Computer-generated, no signature required (declaration on invoice)
+
+Rendering is CPU-bound (canvas drawing + PDF serialisation), so the app
+calls `render()`, which runs `build_invoice_pdf` in a bounded executor off
+the event loop: at most INVOICE_RENDER_CONCURRENCY renders run at once and
+the rest wait their turn, so a month-end burst of downloads queues behind
+itself instead of delaying paywall responses. The pool is created on the
+first render. `render_stats()` reports counts, queue wait and render time.
+
+Configuration (all optional):
+  - INVOICE_RENDER_WORKERS       render processes (default 1; 0 = one thread)
+  - INVOICE_RENDER_CONCURRENCY   renders in flight at once (default 2)
 """
 
 from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone
 from io import BytesIO
+from typing import Optional
+import asyncio
+import multiprocessing
+import os
 import re
+import time
 
 from num2words import num2words
 from reportlab.lib.pagesizes import A4
@@ -46,6 +64,10 @@ SELLER = {
 SAC_CODE = "998431"                         # online news / journals
 DESCRIPTION = "The State of Play — Annual Subscription"
 
+# Bump whenever the PDF layout or the seller block changes, so invoices
+# stored by invoice_store.py are re-rendered rather than served stale.
+TEMPLATE_VERSION = 1
+
 
 # ───────────────────────────── helpers ─────────────────────────────
 def fiscal_year(d: datetime) -> str:
@@ -302,3 +324,91 @@ def build_invoice_pdf(invoice_data: dict) -> bytes:
     c.showPage()
     c.save()
     return buf.getvalue()
+
+
+# ───────────────────────────── render pool ─────────────────────────────
+INVOICE_RENDER_WORKERS = int(os.environ.get("INVOICE_RENDER_WORKERS", "1"))
+INVOICE_RENDER_CONCURRENCY = max(1, int(os.environ.get("INVOICE_RENDER_CONCURRENCY", "2")))
+
+_executor: Optional[Executor] = None
+_slots: Optional[asyncio.Semaphore] = None
+_waiting = 0
+_in_flight = 0
+_stats = {"rendered": 0, "failed": 0, "render_ms_total": 0.0, "render_ms_max": 0.0,
+          "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if INVOICE_RENDER_WORKERS <= 0:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invoice-render")
+        else:
+            # spawn, not fork: the parent has a running event loop and threads.
+            _executor = ProcessPoolExecutor(
+                max_workers=INVOICE_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _executor
+
+
+async def render(invoice_data: dict) -> bytes:
+    """`build_invoice_pdf` in the render pool, at most
+    INVOICE_RENDER_CONCURRENCY at a time."""
+    global _slots, _waiting, _in_flight
+    if _slots is None:
+        _slots = asyncio.Semaphore(INVOICE_RENDER_CONCURRENCY)
+    queued_at = time.perf_counter()
+    _waiting += 1
+    try:
+        await _slots.acquire()
+    finally:
+        _waiting -= 1
+    _in_flight += 1
+    try:
+        started = time.perf_counter()
+        wait_ms = (started - queued_at) * 1000
+        _stats["wait_ms_total"] += wait_ms
+        _stats["wait_ms_max"] = max(_stats["wait_ms_max"], wait_ms)
+        loop = asyncio.get_running_loop()
+        try:
+            pdf = await loop.run_in_executor(_get_executor(), build_invoice_pdf, invoice_data)
+        except BrokenProcessPool:
+            # A worker died; replace the pool for the next request.
+            _stats["failed"] += 1
+            shutdown()
+            raise
+        except Exception:
+            _stats["failed"] += 1
+            raise
+        render_ms = (time.perf_counter() - started) * 1000
+        _stats["rendered"] += 1
+        _stats["render_ms_total"] += render_ms
+        _stats["render_ms_max"] = max(_stats["render_ms_max"], render_ms)
+        return pdf
+    finally:
+        _in_flight -= 1
+        _slots.release()
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def render_stats() -> dict:
+    done = _stats["rendered"] or 1
+    return {
+        "workers": INVOICE_RENDER_WORKERS,
+        "concurrency": INVOICE_RENDER_CONCURRENCY,
+        "in_flight": _in_flight,
+        "waiting": _waiting,
+        "rendered": _stats["rendered"],
+        "failed": _stats["failed"],
+        "render_ms_avg": round(_stats["render_ms_total"] / done, 1),
+        "render_ms_max": round(_stats["render_ms_max"], 1),
+        "wait_ms_avg": round(_stats["wait_ms_total"] / done, 1),
+        "wait_ms_max": round(_stats["wait_ms_max"], 1),
+    }
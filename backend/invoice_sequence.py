@@ -0,0 +1,253 @@
+"""
+invoice_sequence.py — fiscal-year invoice serials for individual members.
+
+An invoice number is TSOP/<FY>/<seq>, where seq is the member's 1-based
+position among `paid-via-razorpay` members created in that fiscal year,
+ordered by created_at. Working that out used to mean paging through every
+such member in Ghost (100 per page) on every /api/invoice/generate call.
+
+With Mongo configured, positions are kept in the `invoice_sequence`
+collection (one document per member + FY) and answered with a single
+indexed read:
+
+  * the first lookup in a fiscal year backfills it from Ghost in exactly
+    the order the old scan used, so numbers already issued do not change;
+  * a member not yet indexed triggers a catch-up that lists only members
+    created since the newest indexed one and appends them in order;
+  * a labelled member Ghost lists out of order (labelled after later
+    members were indexed) is appended with the next serial rather than
+    renumbering everyone after them, as the old scan would have.
+
+Serials come from a per-FY counter (`invoice_sequence_fy`) incremented
+atomically, so concurrent workers never hand out the same one. Without
+Mongo the old full scan is used.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+import ghost_client
+from invoice_generator import fiscal_year
+
+logger = logging.getLogger(__name__)
+
+ENTRIES_COLLECTION = 'invoice_sequence'
+FY_COLLECTION = 'invoice_sequence_fy'
+LABEL = 'paid-via-razorpay'
+_GHOST_TIME = '%Y-%m-%d %H:%M:%S'
+APPEND_ATTEMPTS = 5
+
+# ─── Module state ────────────────────────────────────────────────────────────
+_db = None
+_indexed = False
+_fy_locks: dict = {}
+stats_counters = {'hits': 0, 'backfills': 0, 'backfilled_members': 0,
+                  'catch_ups': 0, 'appended': 0, 'seq_conflicts': 0,
+                  'scans': 0, 'errors': 0}
+
+
+def init(db_handle) -> None:
+    global _db
+    _db = db_handle
+
+
+def fy_bounds(d: datetime) -> tuple[datetime, datetime]:
+    """Return (fy_start, fy_end_exclusive) for the Indian fiscal year containing d."""
+    y = d.year if d.month >= 4 else d.year - 1
+    fy_start = datetime(y, 4, 1, tzinfo=timezone.utc)
+    fy_end = datetime(y + 1, 4, 1, tzinfo=timezone.utc)
+    return fy_start, fy_end
+
+
+def _parse_created(value: str) -> datetime:
+    return datetime.fromisoformat((value or '').replace('Z', '+00:00'))
+
+
+# ─── Ghost listing ───────────────────────────────────────────────────────────
+async def list_fy_members(fy_start: datetime, fy_end: datetime,
+                          since: Optional[datetime] = None) -> list[dict]:
+    """`paid-via-razorpay` members created in [since or fy_start, fy_end),
+    oldest first. Raises GhostUpstreamError rather than return a partial
+    list, which would be persisted with the wrong numbering."""
+    token = ghost_client.admin_token()
+    if not token:
+        raise ghost_client.GhostUpstreamError('Ghost Admin API token unavailable')
+    start = max(fy_start, since) if since else fy_start
+    members: list[dict] = []
+    page = 1
+    client = ghost_client.get_client()
+    while True:
+        r = await client.get(
+            f"{ghost_client.GHOST_URL}/ghost/api/admin/members/",
+            params={
+                "filter": (
+                    f"label:{LABEL}+"
+                    f"created_at:>='{start.strftime(_GHOST_TIME)}'+"
+                    f"created_at:<'{fy_end.strftime(_GHOST_TIME)}'"
+                ),
+                "limit": 100,
+                "page": page,
+                "order": "created_at asc",
+                "include": "labels",
+            },
+            headers={"Authorization": f"Ghost {token}"},
+            timeout=15.0,
+        )
+        if r.status_code != 200:
+            raise ghost_client.GhostUpstreamError(f'HTTP {r.status_code}', status_code=r.status_code)
+        payload = r.json()
+        members.extend(payload.get("members", []))
+        pages = (payload.get("meta", {}).get("pagination") or {}).get("pages") or 1
+        if page >= pages:
+            break
+        page += 1
+    return members
+
+
+async def _scan_position(member_id: str, created_at: datetime) -> int:
+    """The original O(members) lookup, for deployments without Mongo."""
+    stats_counters['scans'] += 1
+    members = await list_fy_members(*fy_bounds(created_at))
+    for i, m in enumerate(members):
+        if m.get("id") == member_id:
+            return i + 1
+    return 0
+
+
+# ─── Mongo index ─────────────────────────────────────────────────────────────
+async def _ensure_indexes() -> None:
+    global _indexed
+    if not _indexed:
+        await _db[ENTRIES_COLLECTION].create_index([('fy', 1), ('seq', 1)], unique=True)
+        _indexed = True
+
+
+async def _find(fy: str, member_id: str) -> Optional[int]:
+    doc = await _db[ENTRIES_COLLECTION].find_one({'_id': f'{fy}:{member_id}'}, projection={'seq': 1})
+    return doc['seq'] if doc else None
+
+
+async def _max_seq(fy: str) -> int:
+    doc = await _db[ENTRIES_COLLECTION].find_one({'fy': fy}, projection={'seq': 1}, sort=[('seq', -1)])
+    return doc['seq'] if doc else 0
+
+
+async def _backfill(fy: str, fy_start: datetime, fy_end: datetime) -> None:
+    from pymongo.errors import BulkWriteError
+
+    members = await list_fy_members(fy_start, fy_end)
+    docs = [{
+        '_id': f"{fy}:{m['id']}", 'fy': fy, 'member_id': m['id'], 'seq': i + 1,
+        'created_at': _parse_created(m.get('created_at')),
+    } for i, m in enumerate(members)]
+    if docs:
+        try:
+            await _db[ENTRIES_COLLECTION].insert_many(docs, ordered=False)
+        except BulkWriteError:
+            pass  # another worker backfilled the same (deterministic) rows first
+    # The counter follows what is stored, not what this call listed: rows
+    # may already exist beyond len(docs) (appended by another worker).
+    await _db[FY_COLLECTION].update_one(
+        {'_id': fy},
+        {'$max': {'last_seq': await _max_seq(fy),
+                  'last_created_at': docs[-1]['created_at'] if docs else fy_start},
+         '$setOnInsert': {'backfilled_at': datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    stats_counters['backfills'] += 1
+    stats_counters['backfilled_members'] += len(docs)
+    logger.info(f'Invoice sequence {fy}: backfilled {len(docs)} members from Ghost')
+
+
+def _clashed_on_id(e) -> bool:
+    """Whether a DuplicateKeyError came from `_id` rather than (fy, seq)."""
+    details = e.details or {}
+    if details.get('keyPattern'):
+        return '_id' in details['keyPattern']
+    return 'index: _id_' in (details.get('errmsg') or str(e))
+
+
+async def _append(fy: str, member_id: str, created_at: datetime) -> int:
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+
+    for _ in range(APPEND_ATTEMPTS):
+        state = await _db[FY_COLLECTION].find_one_and_update(
+            {'_id': fy},
+            {'$inc': {'last_seq': 1}, '$max': {'last_created_at': created_at}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        seq = state['last_seq']
+        try:
+            await _db[ENTRIES_COLLECTION].insert_one({
+                '_id': f'{fy}:{member_id}', 'fy': fy, 'member_id': member_id,
+                'seq': seq, 'created_at': created_at,
+            })
+        except DuplicateKeyError as e:
+            if _clashed_on_id(e):
+                # Another worker indexed this member first; theirs stands.
+                return await _find(fy, member_id) or 0
+            # (fy, seq) is taken — the counter is behind the stored rows.
+            # Catch it up, then take the next serial.
+            stats_counters['seq_conflicts'] += 1
+            await _db[FY_COLLECTION].update_one({'_id': fy}, {'$max': {'last_seq': await _max_seq(fy)}})
+            continue
+        stats_counters['appended'] += 1
+        return seq
+    raise RuntimeError(f'Invoice sequence {fy}: no free serial after {APPEND_ATTEMPTS} attempts')
+
+
+async def _catch_up(fy: str, fy_start: datetime, fy_end: datetime, since: datetime) -> None:
+    stats_counters['catch_ups'] += 1
+    members = await list_fy_members(fy_start, fy_end, since=since)
+    if not members:
+        return
+    known = {
+        doc['member_id'] async for doc in _db[ENTRIES_COLLECTION].find(
+            {'_id': {'$in': [f"{fy}:{m['id']}" for m in members]}}, projection={'member_id': 1})
+    }
+    for m in members:
+        if m['id'] not in known:
+            await _append(fy, m['id'], _parse_created(m.get('created_at')))
+
+
+async def seq_for_member(member_id: str, created_at: datetime, labelled: bool) -> int:
+    """1-based FY serial for this member; 0 if they have none (not a
+    `paid-via-razorpay` member) or Ghost could not be reached."""
+    if not member_id or not ghost_client.GHOST_ADMIN_API_KEY:
+        return 0
+    try:
+        if _db is None:
+            return await _scan_position(member_id, created_at)
+
+        fy = fiscal_year(created_at)
+        seq = await _find(fy, member_id)
+        if seq is not None:
+            stats_counters['hits'] += 1
+            return seq
+
+        lock = _fy_locks.setdefault(fy, asyncio.Lock())
+        async with lock:
+            await _ensure_indexes()
+            fy_start, fy_end = fy_bounds(created_at)
+            state = await _db[FY_COLLECTION].find_one({'_id': fy})
+            if state is None:
+                await _backfill(fy, fy_start, fy_end)
+            else:
+                since = state['last_created_at']
+                await _catch_up(fy, fy_start, fy_end, since if since.tzinfo else since.replace(tzinfo=timezone.utc))
+            seq = await _find(fy, member_id)
+            if seq is None and labelled:
+                seq = await _append(fy, member_id, created_at)
+            return seq or 0
+    except Exception as e:
+        stats_counters['errors'] += 1
+        logger.warning(f"Invoice sequence lookup failed for {member_id}: {e!r}")
+        return 0
+
+
+def stats() -> dict:
+    return {**stats_counters, 'backend': 'mongo' if _db is not None else 'ghost_scan'}
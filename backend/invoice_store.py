@@ -0,0 +1,134 @@
+"""
+invoice_store.py — rendered invoice PDFs, stored by content.
+
+A reader who downloads the same invoice again (same number, buyer details,
+period and amounts) gets the stored PDF instead of a fresh ReportLab
+render. The key is the SHA-256 of the `build_invoice_pdf` input, made
+canonical, plus the generator's TEMPLATE_VERSION, so:
+
+  * any change to what would be printed is a different key (a new
+    artifact), never a stale copy;
+  * identical requests from any worker land on the same artifact.
+
+Artifacts live in GridFS (bucket `invoice_pdfs`, filename = key) when Mongo
+is configured, otherwise as `<key>.pdf` files under INVOICE_STORE_DIR.
+Concurrent renders of the same key are single-flighted. A storage failure
+only costs a re-render next time; the PDF is still returned.
+
+Configuration (all optional):
+  - INVOICE_STORE_DIR   disk fallback directory (default /tmp/tsop-invoices)
+"""
+from __future__ import annotations
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Optional
+
+from caching import SingleFlight
+from invoice_generator import TEMPLATE_VERSION
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+INVOICE_STORE_DIR = os.environ.get('INVOICE_STORE_DIR', '/tmp/tsop-invoices')
+GRIDFS_BUCKET = 'invoice_pdfs'
+
+# ─── Module state ────────────────────────────────────────────────────────────
+_bucket = None
+inflight = SingleFlight()
+stats_counters = {'hits': 0, 'misses': 0, 'stored': 0, 'store_errors': 0}
+
+
+def init(db_handle) -> None:
+    global _bucket
+    if db_handle is None:
+        _bucket = None
+        return
+    from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+    _bucket = AsyncIOMotorGridFSBucket(db_handle, bucket_name=GRIDFS_BUCKET)
+
+
+def backend() -> str:
+    return 'gridfs' if _bucket is not None else 'disk'
+
+
+def artifact_key(invoice_data: dict) -> str:
+    """Content address of an invoice: stable across processes and key order."""
+    canonical = json.dumps(invoice_data, sort_keys=True, separators=(',', ':'),
+                           ensure_ascii=False, default=str)
+    return hashlib.sha256(f'v{TEMPLATE_VERSION}|{canonical}'.encode('utf-8')).hexdigest()
+
+
+# ─── Storage ─────────────────────────────────────────────────────────────────
+def _path(key: str) -> str:
+    return os.path.join(INVOICE_STORE_DIR, f'{key}.pdf')
+
+
+def _read_disk(key: str) -> Optional[bytes]:
+    try:
+        with open(_path(key), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_disk(key: str, pdf: bytes) -> None:
+    os.makedirs(INVOICE_STORE_DIR, exist_ok=True)
+    path = _path(key)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp, path)
+
+
+async def get(key: str) -> Optional[bytes]:
+    if _bucket is None:
+        return await asyncio.to_thread(_read_disk, key)
+    from gridfs.errors import NoFile
+    try:
+        stream = await _bucket.open_download_stream_by_name(key)
+    except NoFile:
+        return None
+    return await stream.read()
+
+
+async def put(key: str, pdf: bytes, metadata: Optional[dict] = None) -> None:
+    if _bucket is None:
+        await asyncio.to_thread(_write_disk, key, pdf)
+    else:
+        await _bucket.upload_from_stream(key, pdf, metadata=metadata or {})
+    stats_counters['stored'] += 1
+
+
+async def get_or_render(invoice_data: dict, render: Callable[[dict], Awaitable[bytes]],
+                        key: Optional[str] = None) -> bytes:
+    """The stored PDF for `invoice_data`, rendering and storing it on a miss."""
+    key = key or artifact_key(invoice_data)
+
+    async def load() -> bytes:
+        try:
+            pdf = await get(key)
+        except Exception as e:
+            stats_counters['store_errors'] += 1
+            logger.warning(f'Invoice artifact read failed for {key}: {e!r}')
+            pdf = None
+        if pdf is not None:
+            stats_counters['hits'] += 1
+            return pdf
+        stats_counters['misses'] += 1
+        pdf = await render(invoice_data)
+        try:
+            await put(key, pdf, metadata={'invoice_number': invoice_data.get('invoice_number')})
+        except Exception as e:
+            stats_counters['store_errors'] += 1
+            logger.warning(f'Invoice artifact write failed for {key}: {e!r}')
+        return pdf
+
+    return await inflight.do(key, load)
+
+
+def stats() -> dict:
+    return {**stats_counters, 'backend': backend(), 'coalesced': inflight.coalesced}
@@ -29,11 +29,12 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional
 
 import httpx
-import jwt
 from fastapi import APIRouter, HTTPException, Header, Request
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel, Field, EmailStr
 
+import ghost_client
+
 logger = logging.getLogger(__name__)
 
 # ─── Configuration ───────────────────────────────────────────────────────────
@@ -66,18 +67,8 @@ router = APIRouter()
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 def _create_ghost_admin_token() -> Optional[str]:
-    """JWT for Ghost Admin API; identical algorithm to server.py."""
-    if not GHOST_ADMIN_API_KEY or ':' not in GHOST_ADMIN_API_KEY:
-        return None
-    try:
-        kid, secret = GHOST_ADMIN_API_KEY.split(':', 1)
-        iat = int(datetime.now(timezone.utc).timestamp())
-        payload = {'iat': iat, 'exp': iat + 5 * 60, 'aud': '/admin/'}
-        return jwt.encode(payload, bytes.fromhex(secret), algorithm='HS256',
-                          headers={'kid': kid})
-    except Exception as e:
-        logger.warning(f'Ghost JWT mint failed: {e!r}')
-        return None
+    """JWT for Ghost Admin API; minted and cached by ghost_client."""
+    return ghost_client.admin_token()
 
 
 async def _ghost_create_free_member(email: str, name: str, label: str = 'nominated-reader') -> Optional[str]:
@@ -87,31 +78,26 @@ async def _ghost_create_free_member(email: str, name: str, label: str = 'nominat
     if not token:
         return None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.post(
-                f'{GHOST_URL}/ghost/api/admin/members/?send_email=false',
-                json={'members': [{
-                    'email': email,
-                    'name': name or '',
-                    'labels': [{'name': label}],
-                }]},
-                headers={'Authorization': f'Ghost {token}'},
-            )
+        client = ghost_client.get_client()
+        r = await client.post(
+            f'{GHOST_URL}/ghost/api/admin/members/?send_email=false',
+            json={'members': [{
+                'email': email,
+                'name': name or '',
+                'labels': [{'name': label}],
+            }]},
+            headers={'Authorization': f'Ghost {token}'},
+        )
         if r.status_code in (200, 201):
+            # Any cached "not found" for this email is now wrong.
+            ghost_client.invalidate_member(email)
             return r.json()['members'][0]['id']
         if r.status_code == 422:
             # Most common cause: member already exists. Look it up.
             try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    look = await client.get(
-                        f'{GHOST_URL}/ghost/api/admin/members/',
-                        params={'filter': f"email:'{email}'"},
-                        headers={'Authorization': f'Ghost {token}'},
-                    )
-                if look.status_code == 200:
-                    members = look.json().get('members', [])
-                    if members:
-                        return members[0].get('id')
+                member = await ghost_client.fetch_member(email)
+                if member:
+                    return member.get('id')
             except Exception:
                 pass
             logger.info(f'Ghost member 422 (likely exists) for {email}')
@@ -124,27 +110,16 @@ async def _ghost_create_free_member(email: str, name: str, label: str = 'nominat
 
 async def _ghost_fetch_post(slug: str) -> Optional[dict]:
     """Fetch full post via Ghost Admin API so paywalled bodies are returned."""
-    token = _create_ghost_admin_token()
-    if not token:
-        return None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(
-                f'{GHOST_URL}/ghost/api/admin/posts/slug/{slug}/',
-                params={'formats': 'html', 'include': 'tags,authors'},
-                headers={'Authorization': f'Ghost {token}'},
-            )
-        if r.status_code == 200:
-            posts = r.json().get('posts', [])
-            return posts[0] if posts else None
-        logger.warning(f'Ghost fetch post HTTP {r.status_code} for slug={slug}')
+        return await ghost_client.fetch_post(slug)
     except Exception as e:
         logger.warning(f'Ghost fetch post failed: {e!r}')
     return None
 
 
 async def _ghost_fetch_related(post: dict, limit: int = 3) -> list:
-    """Up to N related posts via Content API, filtered by primary tag."""
+    """Up to N related posts via Content API, filtered by primary tag.
+    Single-flighted per tag: every reader of a story shares one fetch."""
     if not GHOST_CONTENT_API_KEY:
         return []
     primary_tag = (post.get('primary_tag') or {}).get('slug')
@@ -153,21 +128,24 @@ async def _ghost_fetch_related(post: dict, limit: int = 3) -> list:
         primary_tag = (tags[0] or {}).get('slug') if tags else None
     if not primary_tag:
         return []
+
+    async def _fetch() -> list:
+        r = await ghost_client.get_client().get(
+            f'{GHOST_URL}/ghost/api/content/posts/',
+            params={
+                'key': GHOST_CONTENT_API_KEY,
+                'filter': f'tag:{primary_tag}',
+                'limit': str(limit + 1),
+                'include': 'tags',
+                'fields': 'id,slug,title,custom_excerpt,excerpt,feature_image,reading_time',
+            },
+        )
+        return r.json().get('posts', []) if r.status_code == 200 else []
+
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(
-                f'{GHOST_URL}/ghost/api/content/posts/',
-                params={
-                    'key': GHOST_CONTENT_API_KEY,
-                    'filter': f'tag:{primary_tag}',
-                    'limit': str(limit + 1),
-                    'include': 'tags',
-                    'fields': 'id,slug,title,custom_excerpt,excerpt,feature_image,reading_time',
-                },
-            )
-        if r.status_code == 200:
-            related = [p for p in r.json().get('posts', []) if p.get('slug') != post.get('slug')]
-            return related[:limit]
+        posts = await ghost_client.inflight.do(('related', primary_tag, limit), _fetch)
+        related = [p for p in posts if p.get('slug') != post.get('slug')]
+        return related[:limit]
     except Exception as e:
         logger.warning(f'Ghost related fetch failed: {e!r}')
     return []
@@ -0,0 +1,814 @@
+"""
+og_card.py — Open Graph card rendering and caching for /api/og-image/{slug}.
+
+Rendering (`render_card`) is pure CPU work — decode, resampling, alpha
+compositing, encoding — so it runs in a bounded process pool rather
+than on the event loop. At most OG_RENDER_MAX_PENDING renders may be queued
+or running; beyond that `render()` raises RenderQueueFull and the endpoint
+answers 503 + Retry-After instead of stalling the paywall endpoints.
+
+Fonts and the masthead logo are loaded once per worker, not per render: at
+startup the parent fetches LOGO_URL, and each pool worker's initializer
+builds an OGAssets registry (font objects per role with their variation axes
+applied, logo pre-scaled to RGBA). `reload_assets()` re-fetches the logo and,
+when it changed, swaps in a new pool (the old one finishes its queued
+renders first) so workers pick up new assets; the card key carries an
+asset tag, so cards rendered with the old assets are not served again. If
+the boot-time fetch failed, `render()` retries just the download in the
+background every LOGO_RETRY_SECONDS.
+
+Cards can be encoded as PNG, progressive JPEG, WebP or (when Pillow was
+built with libavif) AVIF. `negotiate_format()` picks one from a `?format=`
+parameter or the client's Accept header; each format is cached separately.
+
+Feature images are downloaded once into a disk source cache
+(SourceImageCache) and revalidated with ETag / Last-Modified only after
+OG_SOURCE_FRESH_SECONDS. Workers are handed the file path, not the bytes,
+and the first render of a source saves its 1200×630 cover crop next to it;
+later renders (title edits, template bumps, other formats) start from that
+crop and never decode or resize the multi-megabyte original again.
+
+Rendered cards are cached in two tiers:
+  * memory — byte-budgeted LRU of the hottest cards
+  * disk   — one file per card under OG_CACHE_DIR, size-bounded, evicting
+             the least recently read files first
+
+Keys combine the slug, the post's `updated_at` and TEMPLATE_VERSION, so an
+edited post or a changed card layout can never be served a stale render;
+old entries simply age out.
+
+Configuration (all optional):
+  - OG_CACHE_DIR             disk tier location   (default /tmp/tsop-og-cache)
+  - OG_CACHE_MEMORY_BYTES    memory tier budget   (default 16 MiB)
+  - OG_CACHE_DISK_BYTES      disk tier budget     (default 256 MiB)
+  - OG_RENDER_WORKERS        render processes     (default 2; 0 = one thread)
+  - OG_RENDER_MAX_PENDING    queued + running renders before 503 (default 8)
+  - OG_JPEG_QUALITY          JPEG quality         (default 82)
+  - OG_WEBP_QUALITY          WebP quality         (default 80)
+  - OG_AVIF_QUALITY          AVIF quality         (default 60)
+  - OG_SOURCE_DIR            feature-image cache  (default /tmp/tsop-og-sources)
+  - OG_SOURCE_DISK_BYTES     its disk budget      (default 512 MiB)
+  - OG_SOURCE_FRESH_SECONDS  reuse without revalidating (default 86400)
+  - OG_DEFAULT_FORMAT        format when the client states no preference (default png)
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Optional
+
+from caching import SingleFlight, SizedLRUCache
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the card layout, fonts or encoding change.
+TEMPLATE_VERSION = 1
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+OG_CACHE_DIR = os.environ.get('OG_CACHE_DIR', '/tmp/tsop-og-cache')
+OG_CACHE_MEMORY_BYTES = int(os.environ.get('OG_CACHE_MEMORY_BYTES', str(16 * 1024 * 1024)))
+OG_CACHE_DISK_BYTES = int(os.environ.get('OG_CACHE_DISK_BYTES', str(256 * 1024 * 1024)))
+OG_RENDER_WORKERS = int(os.environ.get('OG_RENDER_WORKERS', '2'))
+OG_RENDER_MAX_PENDING = int(os.environ.get('OG_RENDER_MAX_PENDING', '8'))
+
+OG_SOURCE_DIR = os.environ.get('OG_SOURCE_DIR', '/tmp/tsop-og-sources')
+OG_SOURCE_DISK_BYTES = int(os.environ.get('OG_SOURCE_DISK_BYTES', str(512 * 1024 * 1024)))
+OG_SOURCE_FRESH_SECONDS = float(os.environ.get('OG_SOURCE_FRESH_SECONDS', '86400'))
+
+OG_JPEG_QUALITY = int(os.environ.get('OG_JPEG_QUALITY', '82'))
+OG_WEBP_QUALITY = int(os.environ.get('OG_WEBP_QUALITY', '80'))
+OG_AVIF_QUALITY = int(os.environ.get('OG_AVIF_QUALITY', '60'))
+
+try:
+    from PIL import features as _pil_features
+    AVIF_AVAILABLE = bool(_pil_features.check('avif'))
+except Exception:
+    AVIF_AVAILABLE = False
+
+FONT_DIR = os.path.join(os.path.dirname(__file__), 'assets', 'fonts')
+FRAUNCES = os.path.join(FONT_DIR, 'Fraunces.ttf')
+DMSANS = os.path.join(FONT_DIR, 'DMSans.ttf')
+
+LOGO_URL = 'https://the-state-of-play.ghost.io/content/images/2025/09/TSOP-Logo-Final-Colour-4.png'
+LOGO_HEIGHT = 50
+LOGO_RETRY_SECONDS = 300  # how soon to retry a logo fetch that failed
+
+WIDTH, HEIGHT = 1200, 630  # standard OG size
+
+# role -> (font file, size, variation). Variation is ('name', str),
+# ('axes', [values]) or None.
+FONT_SPECS = {
+    'title': (FRAUNCES, 60, ('name', 'SemiBold')),
+    'badge': (DMSANS, 16, ('axes', [14, 700])),
+    'byline': (DMSANS, 16, None),
+}
+
+
+# fmt -> (Pillow format, media type, save options). PNG stays the default
+# for clients that state no preference; the lossy formats are a fraction of
+# its size for photographic feature images and much quicker to encode. The
+# og:image URL is negotiated, so the share page emits no og:image:type.
+ENCODERS = {
+    'png': ('PNG', 'image/png', {'optimize': True}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': OG_JPEG_QUALITY, 'progressive': True, 'optimize': True}),
+    'webp': ('WEBP', 'image/webp', {'quality': OG_WEBP_QUALITY, 'method': 4}),
+}
+if AVIF_AVAILABLE:
+    ENCODERS['avif'] = ('AVIF', 'image/avif', {'quality': OG_AVIF_QUALITY, 'speed': 8})
+
+DEFAULT_FORMAT = os.environ.get('OG_DEFAULT_FORMAT', 'png').lower()
+if DEFAULT_FORMAT not in ENCODERS:
+    DEFAULT_FORMAT = 'png'
+
+# Tie-break between types the client rates equally: cheapest to encode per
+# byte saved first. Wildcards never select a lossy format.
+_ACCEPT_PREFERENCE = ('webp', 'jpeg', 'avif', 'png')
+_FORMAT_ALIASES = {'jpg': 'jpeg'}
+
+
+def media_type(fmt: str) -> str:
+    return ENCODERS[fmt][1]
+
+
+def _accept_qualities(accept: Optional[str]) -> dict:
+    """media range -> q from an Accept header; malformed q counts as 0."""
+    qualities = {}
+    for part in (accept or '').split(','):
+        mime, *params = [p.strip() for p in part.split(';')]
+        if not mime:
+            continue
+        q = next((p[2:] for p in params if p.lower().startswith('q=')), '1')
+        try:
+            qualities[mime.lower()] = float(q)
+        except ValueError:
+            qualities[mime.lower()] = 0.0
+    return qualities
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Format from an explicit `?format=` if supported, else the one the
+    Accept header rates highest (ties broken by _ACCEPT_PREFERENCE)."""
+    if requested:
+        fmt = requested.lower()
+        fmt = _FORMAT_ALIASES.get(fmt, fmt)
+        if fmt in ENCODERS:
+            return fmt
+    qualities = _accept_qualities(accept)
+    wildcard = max(qualities.get('image/*', 0.0), qualities.get('*/*', 0.0))
+    best, best_q = DEFAULT_FORMAT, 0.0
+    for fmt in _ACCEPT_PREFERENCE:
+        if fmt not in ENCODERS:
+            continue
+        # Wildcards never select a lossy format, only the default.
+        q = qualities.get(media_type(fmt), wildcard if fmt == DEFAULT_FORMAT else 0.0)
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def card_key(slug: str, updated_at: Optional[str], fmt: str = DEFAULT_FORMAT) -> str:
+    return f'{slug}|{updated_at or "-"}|v{TEMPLATE_VERSION}.{asset_tag}|{fmt}'
+
+
+def _evict_lru(directory: str, max_bytes: int) -> tuple:
+    """Drop least-recently-used files until under 90% of `max_bytes`.
+    Returns (bytes still used, files removed)."""
+    entries = sorted(
+        (e for e in os.scandir(directory) if e.is_file() and not e.name.endswith('.tmp')),
+        key=lambda e: e.stat().st_mtime,
+    )
+    used = sum(e.stat().st_size for e in entries)
+    if used <= max_bytes:
+        return used, 0
+    target = int(max_bytes * 0.9)
+    removed = 0
+    for e in entries:
+        if used <= target:
+            break
+        try:
+            size = e.stat().st_size
+            os.remove(e.path)
+            used -= size
+            removed += 1
+        except OSError:
+            pass
+    return used, removed
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class OGCardCache:
+    """Memory tier in front of a size-bounded directory of rendered cards."""
+
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.memory = SizedLRUCache(memory_bytes)
+        self._disk_used: Optional[int] = None  # lazily measured on first write
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    # ── disk tier (blocking; always called via asyncio.to_thread) ──
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # mtime doubles as "last read" for eviction
+        except OSError:
+            pass
+        return data
+
+    def _write(self, key: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if self._disk_used is None:
+            self._disk_used = sum(e.stat().st_size for e in os.scandir(self.directory) if e.is_file())
+        _write_atomic(self._path(key), data)
+        self._disk_used += len(data)
+        if self._disk_used > self.disk_bytes:
+            self._disk_used, removed = _evict_lru(self.directory, self.disk_bytes)
+            self.disk_evictions += removed
+
+    # ── public API ──
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+        try:
+            data = await asyncio.to_thread(self._read, key)
+        except Exception as e:
+            logger.warning(f'OG disk cache read failed: {e!r}')
+            data = None
+        if data is None:
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, data, len(data))
+        return data
+
+    async def put(self, key: str, data: bytes) -> None:
+        self.memory.set(key, data, len(data))
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except Exception as e:
+            logger.warning(f'OG disk cache write failed (non-fatal): {e!r}')
+
+    def stats(self) -> dict:
+        return {
+            'memory': self.memory.stats(),
+            'disk_hits': self.disk_hits,
+            'disk_misses': self.disk_misses,
+            'disk_evictions': self.disk_evictions,
+            'disk_bytes': self._disk_used,
+        }
+
+
+card_cache = OGCardCache(OG_CACHE_DIR, OG_CACHE_MEMORY_BYTES, OG_CACHE_DISK_BYTES)
+
+
+# ─── Feature-image sources ───────────────────────────────────────────────────
+def derivative_path(source_path: str) -> str:
+    """Where the cover crop of a cached original lives."""
+    return f'{source_path}.{WIDTH}x{HEIGHT}.jpg'
+
+
+class SourceImageCache:
+    """Downloaded feature images on disk, keyed by URL.
+
+    Per URL: `<sha1>.orig` (the bytes as served), `<sha1>.json` (validators
+    and when they were last checked) and, once rendered, the cover crop at
+    derivative_path(). A failed revalidation serves the copy already held.
+    Every use touches the entry's files, so eviction drops the least
+    recently used sources. Disk use is a running total of what is stored
+    here; crops written by the render workers are picked up whenever an
+    eviction pass re-measures the directory.
+    """
+
+    def __init__(self, directory: str, disk_bytes: int, fresh_for: float):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.fresh_for = fresh_for
+        self._inflight = SingleFlight()
+        self._disk_used: Optional[int] = None  # lazily measured on first write
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def _base(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    # ── blocking helpers (always called via asyncio.to_thread) ──
+    def _read_meta(self, base: str) -> Optional[dict]:
+        try:
+            with open(f'{base}.json') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return meta if os.path.exists(f'{base}.orig') else None
+
+    def _write_meta(self, base: str, meta: dict) -> int:
+        data = json.dumps(meta).encode('utf-8')
+        _write_atomic(f'{base}.json', data)
+        return len(data)
+
+    def _touch(self, base: str) -> None:
+        # mtime doubles as "last used" for eviction, as in OGCardCache.
+        for path in (f'{base}.orig', f'{base}.json', derivative_path(f'{base}.orig')):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _store(self, base: str, data: bytes, meta: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if self._disk_used is None:
+            self._disk_used = sum(e.stat().st_size for e in os.scandir(self.directory) if e.is_file())
+        path = f'{base}.orig'
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        _write_atomic(path, data)
+        try:
+            os.remove(derivative_path(path))  # crop of the old bytes
+        except FileNotFoundError:
+            pass
+        self._disk_used += len(data) + self._write_meta(base, meta) - replaced
+        if self._disk_used > self.disk_bytes:
+            self._disk_used, removed = _evict_lru(self.directory, self.disk_bytes)
+            self.evictions += removed
+
+    # ── public API ──
+    async def fetch(self, url: str) -> Optional[str]:
+        """Path of the local copy of `url`, downloading or revalidating as
+        needed; None if it has never been fetched successfully."""
+        return await self._inflight.do(url, lambda: self._fetch(url))
+
+    async def _fetch(self, url: str) -> Optional[str]:
+        import ghost_client
+
+        base = self._base(url)
+        path = f'{base}.orig'
+        meta = await asyncio.to_thread(self._read_meta, base)
+        if meta and time.time() - meta.get('checked_at', 0) < self.fresh_for:
+            self.hits += 1
+            await asyncio.to_thread(self._touch, base)
+            return path
+
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            # Ghost CDN redirects /content/images/... to storage.ghost.io —
+            # must follow redirects or the feature image is silently dropped
+            # and the OG card renders on the plain dark background.
+            r = await ghost_client.get_client().get(url, headers=headers, follow_redirects=True)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f'Failed to fetch feature image: {e}')
+            return path if meta else None
+
+        if r.status_code == 304 and meta:
+            self.revalidated += 1
+            meta['checked_at'] = time.time()
+            await asyncio.to_thread(self._write_meta, base, meta)
+            await asyncio.to_thread(self._touch, base)
+            return path
+        if r.status_code != 200:
+            self.errors += 1
+            logger.error(f'Failed to fetch feature image: HTTP {r.status_code} for {url}')
+            return path if meta else None
+
+        self.downloads += 1
+        meta = {
+            'url': url,
+            'etag': r.headers.get('etag'),
+            'last_modified': r.headers.get('last-modified'),
+            'checked_at': time.time(),
+        }
+        try:
+            await asyncio.to_thread(self._store, base, r.content, meta)
+        except Exception as e:
+            logger.warning(f'OG source cache write failed: {e!r}')
+            return None
+        return path
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'downloads': self.downloads,
+            'errors': self.errors,
+            'evictions': self.evictions,
+            'disk_bytes': self._disk_used,
+        }
+
+
+source_cache = SourceImageCache(OG_SOURCE_DIR, OG_SOURCE_DISK_BYTES, OG_SOURCE_FRESH_SECONDS)
+
+
+# ─── Assets (loaded once per worker) ─────────────────────────────────────────
+class OGAssets:
+    """Ready-to-draw fonts keyed by role plus the pre-scaled RGBA logo."""
+
+    def __init__(self, fonts: dict, logo):
+        self.fonts = fonts
+        self.logo = logo
+
+    @classmethod
+    def load(cls, logo_bytes: Optional[bytes]) -> 'OGAssets':
+        from PIL import Image, ImageFont
+
+        # Load editorial fonts (Fraunces for title, DM Sans for UI). These
+        # are variable fonts shipped in backend/assets/fonts.
+        fonts = {}
+        try:
+            for role, (path, size, variation) in FONT_SPECS.items():
+                font = ImageFont.truetype(path, size)
+                try:
+                    if variation and variation[0] == 'name':
+                        font.set_variation_by_name(variation[1])
+                    elif variation:
+                        font.set_variation_by_axes(variation[1])
+                except Exception:
+                    pass
+                fonts[role] = font
+        except Exception as font_err:
+            logger.warning(f'Editorial fonts failed, falling back: {font_err}')
+            fonts = {role: ImageFont.load_default() for role in FONT_SPECS}
+
+        logo = None
+        if logo_bytes:
+            try:
+                logo = Image.open(BytesIO(logo_bytes)).convert('RGBA')
+                logo_width = int(LOGO_HEIGHT * logo.width / logo.height)
+                logo = logo.resize((logo_width, LOGO_HEIGHT), Image.LANCZOS)
+            except Exception as e:
+                logger.error(f'Failed to decode logo: {e}')
+                logo = None
+        return cls(fonts, logo)
+
+
+_assets: Optional[OGAssets] = None  # per worker process (or the thread fallback)
+
+
+def _init_worker(logo_bytes: Optional[bytes]) -> None:
+    global _assets
+    _assets = OGAssets.load(logo_bytes)
+
+
+# ─── Rendering (runs inside the pool) ────────────────────────────────────────
+def _load_background(source_path: str):
+    """The feature image scaled to cover WIDTH×HEIGHT and centre-cropped.
+    Reuses the crop saved next to the source; makes and saves it if absent."""
+    from PIL import Image
+
+    crop_path = derivative_path(source_path)
+    try:
+        with Image.open(crop_path) as cropped:
+            return cropped.convert('RGB')
+    except (FileNotFoundError, OSError):
+        pass
+
+    width, height = WIDTH, HEIGHT
+    bg_img = Image.open(source_path)
+
+    # Scale to cover. Only the header has been read so far, so the size is
+    # known before any pixels are decoded.
+    scale = max(width / bg_img.width, height / bg_img.height)
+
+    # JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale (DCT
+    # scaling), never below the size we need — a 4000px original decodes
+    # at ~1000px instead of in full. No-op for other formats, and skipped
+    # for images that are already no bigger than the card.
+    if scale < 1:
+        bg_img.draft('RGB', (int(bg_img.width * scale) + 1, int(bg_img.height * scale) + 1))
+    if bg_img.mode != 'RGB':
+        bg_img = bg_img.convert('RGB')
+
+    # Center crop, expressed in source pixels so only the visible region is
+    # resampled; reducing_gap makes it two-stage (cheap integer box
+    # reduction, then LANCZOS for the last <= 2x).
+    scale = max(width / bg_img.width, height / bg_img.height)
+    crop_w, crop_h = width / scale, height / scale
+    left = (bg_img.width - crop_w) / 2
+    top = (bg_img.height - crop_h) / 2
+    bg_img = bg_img.resize((width, height), Image.LANCZOS,
+                           box=(left, top, left + crop_w, top + crop_h), reducing_gap=2.0)
+
+    try:
+        out = BytesIO()
+        # q95 without chroma subsampling is visually lossless under the
+        # 0.4 darkening and several times cheaper to write and read than PNG.
+        bg_img.save(out, format='JPEG', quality=95, subsampling=0)
+        _write_atomic(crop_path, out.getvalue())
+    except OSError as e:
+        logger.warning(f'Could not save feature-image crop: {e!r}')
+    return bg_img
+
+
+def render_card(spec: dict, bg_path: Optional[str], fmt: str = DEFAULT_FORMAT) -> bytes:
+    """Composite the branded card and return it encoded as `fmt`.
+
+    `spec` carries only plain data (title, category, is_premium, author_name)
+    and `bg_path` points into the source cache, so nothing large is pickled
+    into the worker process. Fonts and logo come from
+    the worker's OGAssets, set up by the pool initializer.
+    """
+    from PIL import Image, ImageDraw, ImageEnhance
+
+    assets = _assets
+    if assets is None:  # called outside the pool (scripts, tests)
+        _init_worker(None)
+        assets = _assets
+
+    width, height = WIDTH, HEIGHT
+    title = spec.get('title') or 'The State of Play'
+    category = spec.get('category')
+    is_premium = spec.get('is_premium')
+
+    bg_img = None
+    if bg_path:
+        try:
+            bg_img = _load_background(bg_path)
+
+            # Darken for readability
+            enhancer = ImageEnhance.Brightness(bg_img)
+            bg_img = enhancer.enhance(0.4)
+        except Exception as e:
+            logger.error(f'Failed to decode feature image: {e}')
+            bg_img = None
+
+    # Fallback to solid color
+    if bg_img is None:
+        bg_img = Image.new('RGB', (width, height), (20, 50, 100))
+
+    img = bg_img.copy()
+
+    # Add dark overlay
+    overlay = Image.new('RGBA', (width, height), (0, 0, 0, 130))
+    img = img.convert('RGBA')
+    img = Image.alpha_composite(img, overlay)
+    draw = ImageDraw.Draw(img)
+
+    title_font = assets.fonts['title']
+    badge_font = assets.fonts['badge']
+    byline_font = assets.fonts['byline']
+
+    # Colors
+    white = (255, 255, 255)
+    coral = (255, 100, 100)
+    blue = (35, 75, 160)
+
+    # --- LOGO at top left ---
+    if assets.logo is not None:
+        img.paste(assets.logo, (50, 40), assets.logo)
+
+    # --- BADGES at top right ---
+    badge_y = 45
+    badge_x = width - 50
+
+    if category:
+        c_bbox = draw.textbbox((0, 0), category, font=badge_font)
+        c_w, c_h = c_bbox[2] - c_bbox[0], c_bbox[3] - c_bbox[1]
+        pad = 10
+        badge_x = badge_x - c_w - pad*2
+
+        draw.rounded_rectangle(
+            [badge_x, badge_y, badge_x + c_w + pad*2, badge_y + c_h + pad*2],
+            radius=5,
+            fill=white
+        )
+        draw.text((badge_x + pad, badge_y + pad), category, fill=blue, font=badge_font)
+        badge_x -= 12
+
+    if is_premium:
+        premium_text = 'PREMIUM'
+        p_bbox = draw.textbbox((0, 0), premium_text, font=badge_font)
+        p_w, p_h = p_bbox[2] - p_bbox[0], p_bbox[3] - p_bbox[1]
+        pad = 10
+        badge_x = badge_x - p_w - pad*2
+
+        draw.rounded_rectangle(
+            [badge_x, badge_y, badge_x + p_w + pad*2, badge_y + p_h + pad*2],
+            radius=5,
+            fill=coral
+        )
+        draw.text((badge_x + pad, badge_y + pad), premium_text, fill=white, font=badge_font)
+
+    # --- TITLE (pixel-measured wrap so Fraunces lays out cleanly) ---
+    max_text_width = width - 100  # 50px padding each side
+    words = title.split()
+    title_lines = []
+    current = ''
+    for w in words:
+        test = (current + ' ' + w).strip()
+        tb = draw.textbbox((0, 0), test, font=title_font)
+        if (tb[2] - tb[0]) <= max_text_width:
+            current = test
+        else:
+            if current:
+                title_lines.append(current)
+            current = w
+    if current:
+        title_lines.append(current)
+    # Cap at 4 lines, ellipsise the last if truncated
+    if len(title_lines) > 4:
+        title_lines = title_lines[:4]
+        last = title_lines[-1].rstrip('.,;:')
+        while last and (draw.textbbox((0, 0), last + '…', font=title_font)[2] > max_text_width):
+            last = last[:-1].rstrip()
+        title_lines[-1] = (last + '…') if last else '…'
+
+    title_line_height = 70
+    title_block_h = title_line_height * len(title_lines)
+    # vertically center the title in the middle band of the canvas
+    title_start_y = max(170, (height - title_block_h) // 2 - 20)
+
+    for i, line in enumerate(title_lines):
+        draw.text((50, title_start_y + i * title_line_height), line, fill=white, font=title_font)
+
+    # --- BYLINE (bottom-left) ---
+    author_name = spec.get('author_name') or 'The State of Play'
+    byline_text = f'{author_name.upper()}  ·  STATEOFPLAY.CLUB'
+    byline_y = height - 60
+    draw.text((50, byline_y), byline_text, fill=(220, 220, 220), font=byline_font)
+
+    # subtle accent rule above byline
+    draw.rectangle([50, byline_y - 14, 130, byline_y - 12], fill=coral)
+
+    # Convert to RGB and encode
+    img = img.convert('RGB')
+    out = BytesIO()
+    pil_format, _, options = ENCODERS[fmt]
+    img.save(out, format=pil_format, **options)
+    return out.getvalue()
+
+
+# ─── Render pool ─────────────────────────────────────────────────────────────
+class RenderQueueFull(Exception):
+    """More than OG_RENDER_MAX_PENDING renders are already queued/running."""
+
+
+_executor: Optional[Executor] = None
+_pending = 0
+render_stats = {'rendered': 0, 'rejected': 0, 'failed': 0, 'asset_reloads': 0}
+
+# Parent-side copy of the logo handed to each worker's initializer.
+_logo_bytes: Optional[bytes] = None
+_logo_attempted_at = 0.0
+_logo_retry: Optional[asyncio.Task] = None
+asset_tag = 'nologo'
+
+
+def _build_executor() -> Executor:
+    if OG_RENDER_WORKERS <= 0:
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix='og-render',
+                                  initializer=_init_worker, initargs=(_logo_bytes,))
+    # spawn, not fork: the parent has a running event loop and threads.
+    return ProcessPoolExecutor(
+        max_workers=OG_RENDER_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(_logo_bytes,),
+    )
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        _executor = _build_executor()
+    return _executor
+
+
+async def _fetch_logo() -> Optional[bytes]:
+    import ghost_client
+
+    global _logo_attempted_at
+    _logo_attempted_at = time.monotonic()
+    try:
+        # Ghost CDN redirects /content/images/... to storage.ghost.io —
+        # httpx does NOT follow redirects by default, which silently
+        # drops the logo. Explicitly enable follow_redirects.
+        r = await ghost_client.get_client().get(LOGO_URL, follow_redirects=True)
+        if r.status_code == 200:
+            return r.content
+        logger.error(f'Failed to fetch logo: HTTP {r.status_code}')
+    except Exception as e:
+        logger.error(f'Failed to fetch logo: {e}')
+    return None
+
+
+def _swap_executor() -> None:
+    """Point new renders at a fresh pool; the old one drains its queue."""
+    global _executor
+    old, _executor = _executor, _build_executor()
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+async def reload_assets(force: bool = False) -> str:
+    """Re-fetch the logo and, if it changed (or `force`, e.g. new font
+    files), swap the pool so every worker reloads its fonts and logo.
+    Returns the asset tag."""
+    global _logo_bytes, asset_tag
+    logo = await _fetch_logo()
+    if logo is None or logo == _logo_bytes:
+        if not force and _executor is not None:
+            return asset_tag
+    else:
+        _logo_bytes = logo
+    asset_tag = hashlib.sha1(_logo_bytes).hexdigest()[:8] if _logo_bytes else 'nologo'
+    _swap_executor()
+    render_stats['asset_reloads'] += 1
+    logger.info(f'OG assets loaded: asset_tag={asset_tag}')
+    return asset_tag
+
+
+def _maybe_retry_logo() -> None:
+    # The boot-time logo fetch failed. Retry it off the request path; the
+    # pool is only swapped once a logo actually arrives.
+    global _logo_retry
+    if _logo_bytes is not None or time.monotonic() - _logo_attempted_at <= LOGO_RETRY_SECONDS:
+        return
+    if _logo_retry is None or _logo_retry.done():
+        _logo_retry = asyncio.ensure_future(reload_assets())
+
+
+async def render(spec: dict, bg_path: Optional[str], fmt: str = DEFAULT_FORMAT) -> bytes:
+    """Render a card in the pool. Raises RenderQueueFull under backpressure."""
+    global _pending
+    if _pending >= OG_RENDER_MAX_PENDING:
+        render_stats['rejected'] += 1
+        raise RenderQueueFull()
+    _maybe_retry_logo()
+    _pending += 1
+    try:
+        executor = _get_executor()
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(executor, render_card, spec, bg_path, fmt)
+    except BrokenProcessPool:
+        # A worker died (OOM on a huge image, most likely). The pool is
+        # unusable from here on, so replace it for the next request.
+        render_stats['failed'] += 1
+        if executor is _executor:
+            _drop_executor()
+        raise
+    except Exception:
+        render_stats['failed'] += 1
+        raise
+    finally:
+        _pending -= 1
+    render_stats['rendered'] += 1
+    return data
+
+
+async def startup() -> None:
+    await reload_assets()
+
+
+def shutdown() -> None:
+    if _logo_retry is not None:
+        _logo_retry.cancel()
+    _drop_executor()
+
+
+def _drop_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def pool_stats() -> dict:
+    return {
+        'workers': OG_RENDER_WORKERS,
+        'pending': _pending,
+        'max_pending': OG_RENDER_MAX_PENDING,
+        'asset_tag': asset_tag,
+        **render_stats,
+    }
@@ -0,0 +1,140 @@
+"""
+payment_store.py — recent Razorpay payments, for the Welcome page's
+/api/check-recent-payment seamless login.
+
+The webhook records `email -> paid_at`; a record counts for
+PAYMENT_VALID_MINUTES. Two layers:
+
+  * in memory, an OrderedDict kept in payment order (re-recording an email
+    moves it to the end), so expiry pops from the front — amortised O(1)
+    per payment instead of a scan over every entry;
+  * in Mongo, when configured, the `recent_payments` collection, one
+    document per email with a TTL index on `expires_at`. Every worker reads
+    it, and it survives restarts, so a payment acknowledged by one worker is
+    visible to the worker that serves the check.
+
+Writes go to both; reads try memory first. The TTL monitor only runs about
+once a minute, so Mongo reads also compare `paid_at` against the window. A
+Mongo error degrades to the in-memory layer, never to an error response.
+
+Configuration (all optional):
+  - PAYMENT_VALID_MINUTES   how long a payment unlocks login (default 30)
+"""
+from __future__ import annotations
+
+import os
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+PAYMENT_VALID_MINUTES = float(os.environ.get('PAYMENT_VALID_MINUTES', '30'))
+MONGO_COLLECTION = 'recent_payments'
+
+
+def _window() -> timedelta:
+    return timedelta(minutes=PAYMENT_VALID_MINUTES)
+
+
+# ─── In-memory layer ─────────────────────────────────────────────────────────
+class MemoryPaymentStore:
+    """email -> paid_at, oldest first."""
+
+    def __init__(self):
+        self._payments: OrderedDict = OrderedDict()
+        self.expired = 0
+
+    def record(self, email: str, paid_at: datetime) -> None:
+        self._payments[email] = paid_at
+        self._payments.move_to_end(email)
+        self.expire(paid_at)
+
+    def expire(self, now: datetime) -> None:
+        cutoff = now - _window()
+        payments = self._payments
+        while payments:
+            email, paid_at = next(iter(payments.items()))
+            if paid_at >= cutoff:
+                break
+            del payments[email]
+            self.expired += 1
+
+    def get(self, email: str) -> Optional[datetime]:
+        return self._payments.get(email)
+
+    def __len__(self) -> int:
+        return len(self._payments)
+
+
+# ─── Module state ────────────────────────────────────────────────────────────
+_db = None
+_indexed = False
+_memory = MemoryPaymentStore()
+stats_counters = {'recorded': 0, 'hits_memory': 0, 'hits_mongo': 0, 'misses': 0, 'mongo_errors': 0}
+
+
+def init(db_handle) -> None:
+    global _db
+    _db = db_handle
+
+
+async def _ensure_indexes() -> None:
+    global _indexed
+    if not _indexed:
+        await _db[MONGO_COLLECTION].create_index('expires_at', expireAfterSeconds=0)
+        _indexed = True
+
+
+async def record(email: str) -> None:
+    """Remember that `email` has just paid. Always stamped with the current
+    time, which keeps the in-memory layer in payment order."""
+    paid_at = datetime.now(timezone.utc)
+    _memory.record(email, paid_at)
+    stats_counters['recorded'] += 1
+    if _db is None:
+        return
+    try:
+        await _ensure_indexes()
+        await _db[MONGO_COLLECTION].update_one(
+            {'_id': email},
+            {'$set': {'paid_at': paid_at, 'expires_at': paid_at + _window()}},
+            upsert=True,
+        )
+    except Exception as e:
+        stats_counters['mongo_errors'] += 1
+        logger.error(f'Recent payment write failed for {email}: {e!r}')
+
+
+async def is_recent(email: str) -> bool:
+    """True if `email` paid within the last PAYMENT_VALID_MINUTES."""
+    now = datetime.now(timezone.utc)
+    _memory.expire(now)
+    cutoff = now - _window()
+    paid_at = _memory.get(email)
+    if paid_at is not None and paid_at > cutoff:
+        stats_counters['hits_memory'] += 1
+        return True
+    if _db is not None:
+        try:
+            doc = await _db[MONGO_COLLECTION].find_one({'_id': email, 'paid_at': {'$gt': cutoff}})
+        except Exception as e:
+            stats_counters['mongo_errors'] += 1
+            logger.error(f'Recent payment read failed for {email}: {e!r}')
+            doc = None
+        if doc is not None:
+            stats_counters['hits_mongo'] += 1
+            return True
+    stats_counters['misses'] += 1
+    return False
+
+
+def stats() -> dict:
+    return {
+        **stats_counters,
+        'backend': 'mongo' if _db is not None else 'memory',
+        'in_memory': len(_memory),
+        'expired_in_memory': _memory.expired,
+    }
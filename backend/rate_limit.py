@@ -0,0 +1,220 @@
+"""
+rate_limit.py — token-bucket rate limiting with pluggable storage.
+
+Two backends share one interface (`await limiter.check(key) -> bool`,
+`limiter.stats()`), chosen by RATE_LIMIT_BACKEND through `create_limiter()`:
+
+  * `memory` (default) — per-process buckets, described below. Fine for a
+    single worker; with N uvicorn workers each one keeps its own buckets,
+    so the effective allowance is N times the configured one.
+  * `mongo` — one document per bucket in the `rate_limits` collection,
+    refilled and decremented in a single atomic findOneAndUpdate (an
+    aggregation-pipeline update), so every worker draws from the same
+    bucket. A TTL index drops idle buckets. If Mongo errors, the request is
+    decided by a local in-memory bucket instead of failing.
+
+In memory, buckets live in an OrderedDict kept in last-use order, each one a two-slot
+object (no per-key dict), so:
+
+  * a bucket idle for longer than `idle_ttl` is dropped from the cold end
+    as a side effect of ordinary calls — by then it has refilled to the
+    full burst, so forgetting it is indistinguishable from keeping it;
+  * the store never holds more than `max_entries` buckets; past that the
+    least recently used one is evicted, so a scraper rotating IPs cannot
+    grow memory without limit.
+
+Single-event-loop code: no locks, nothing awaited.
+
+Configuration (all optional):
+  - RATE_LIMIT_BACKEND   memory | mongo (default memory; mongo needs MONGO_URL)
+"""
+from __future__ import annotations
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory').strip().lower()
+MONGO_COLLECTION = 'rate_limits'
+
+
+# ─── In-memory backend ───────────────────────────────────────────────────────
+
+class _Bucket:
+    __slots__ = ('tokens', 'last')
+
+    def __init__(self, tokens: float, last: float):
+        self.tokens = tokens
+        self.last = last
+
+
+class TokenBucketLimiter:
+    """`burst` requests at once, refilled at `refill_per_sec`, per key."""
+
+    backend = 'memory'
+
+    def __init__(self, burst: float, refill_per_sec: float,
+                 max_entries: int = 100_000, idle_ttl: Optional[float] = None):
+        self.burst = burst
+        self.refill_per_sec = refill_per_sec
+        self.max_entries = max_entries
+        # Never expire a bucket before it could have refilled completely,
+        # otherwise expiry would hand a throttled client a fresh burst.
+        full_refill = burst / refill_per_sec
+        self.idle_ttl = max(idle_ttl or 0.0, full_refill)
+        self._buckets: OrderedDict = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        """Take one token for `key`. Returns True if the request is allowed."""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.burst, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.last) * self.refill_per_sec)
+            bucket.last = now
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            self.allowed += 1
+            return True
+        self.limited += 1
+        return False
+
+    async def check(self, key: str) -> bool:
+        return self.allow(key)
+
+    def _expire(self, now: float) -> None:
+        buckets = self._buckets
+        cutoff = now - self.idle_ttl
+        while buckets:
+            key, oldest = next(iter(buckets.items()))
+            if oldest.last > cutoff:
+                break
+            del buckets[key]
+            self.expired += 1
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def stats(self) -> dict:
+        return {
+            'backend': self.backend,
+            'live_buckets': len(self._buckets),
+            'max_entries': self.max_entries,
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
+
+
+# ─── MongoDB backend ─────────────────────────────────────────────────────────
+class MongoTokenBucketLimiter:
+    """Same bucket semantics, stored in a Mongo collection shared by every
+    worker. `name` namespaces the keys so several limiters can share it."""
+
+    backend = 'mongo'
+
+    def __init__(self, collection, name: str, burst: float, refill_per_sec: float,
+                 idle_ttl: Optional[float] = None, fallback: Optional[TokenBucketLimiter] = None):
+        self.collection = collection
+        self.name = name
+        self.burst = burst
+        self.refill_per_sec = refill_per_sec
+        self.idle_ttl = max(idle_ttl or 0.0, burst / refill_per_sec)
+        self.fallback = fallback or TokenBucketLimiter(burst, refill_per_sec, idle_ttl=idle_ttl)
+        self._indexed = False
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    def _update(self, now: float) -> list:
+        # Refill by elapsed wall-clock time (a new bucket starts full), then
+        # take a token if there is one — evaluated server-side in one step.
+        # Clock skew between workers only ever shortens `elapsed` to 0.
+        elapsed = {'$max': [0, {'$subtract': [now, {'$ifNull': ['$last', now]}]}]}
+        refilled = {'$min': [self.burst, {'$add': [
+            {'$ifNull': ['$tokens', self.burst]},
+            {'$multiply': [elapsed, self.refill_per_sec]},
+        ]}]}
+        return [
+            {'$set': {'tokens': refilled}},
+            {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+            {'$set': {
+                'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']},
+                'last': now,
+                'expires_at': datetime.fromtimestamp(now, timezone.utc) + timedelta(seconds=self.idle_ttl),
+            }},
+        ]
+
+    async def _ensure_indexes(self) -> None:
+        await self.collection.create_index('expires_at', expireAfterSeconds=0)
+        self._indexed = True
+
+    async def check(self, key: str) -> bool:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        doc_id = f'{self.name}:{key}'
+        try:
+            if not self._indexed:
+                await self._ensure_indexes()
+            update = self._update(time.time())
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {'_id': doc_id}, update, upsert=True, return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # Two workers upserted the same new bucket at once; the
+                # loser retries against the document the winner created.
+                doc = await self.collection.find_one_and_update(
+                    {'_id': doc_id}, update, upsert=True, return_document=ReturnDocument.AFTER,
+                )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f'Rate limit store unavailable, using local bucket: {e!r}')
+            return self.fallback.allow(key)
+        if doc.get('allowed'):
+            self.allowed += 1
+            return True
+        self.limited += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            'backend': self.backend,
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'errors': self.errors,
+            'fallback_buckets': len(self.fallback),
+        }
+
+
+def create_limiter(name: str, burst: float, refill_per_sec: float, db=None,
+                   backend: Optional[str] = None, max_entries: int = 100_000):
+    """Limiter for `name` on the configured backend. `mongo` without a
+    database configured falls back to memory with a warning."""
+    backend = (backend or RATE_LIMIT_BACKEND)
+    local = TokenBucketLimiter(burst, refill_per_sec, max_entries=max_entries)
+    if backend == 'mongo':
+        if db is not None:
+            return MongoTokenBucketLimiter(db[MONGO_COLLECTION], name, burst, refill_per_sec, fallback=local)
+        logger.warning(f'RATE_LIMIT_BACKEND=mongo but MongoDB is not configured; {name} limits are per-process')
+    elif backend != 'memory':
+        logger.warning(f'Unknown RATE_LIMIT_BACKEND {backend!r}; using memory')
+    return local
@@ -1,19 +1,32 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request
 from fastapi.responses import Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
+import asyncio
 import logging
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-import jwt
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+import ghost_client  # reads GHOST_* env, so must follow load_dotenv
+import og_card
+import sitemap
+import substack_feed
+import geoip
+import payment_store
+import webhook_queue
+import invoice_sequence
+import invoice_store
+from caching import TTLCache
+import rate_limit
+
 # MongoDB is optional - only initialize if URL is provided
 mongo_url = os.environ.get('MONGO_URL', '')
 client = None
@@ -30,10 +43,6 @@ JWT_SECRET = os.environ.get('JWT_SECRET')
 if not JWT_SECRET:
     raise RuntimeError("JWT_SECRET environment variable is required")
 
-# In-memory store for recent payments (email -> timestamp)
-# In production, you'd use Redis or MongoDB
-recent_payments = {}
-PAYMENT_VALID_MINUTES = 30  # Payment verification valid for 30 minutes
 
 # Razorpay is optional
 razorpay_client = None
@@ -72,36 +81,27 @@ class Subscription(BaseModel):
 
 @api_router.get("/substack/feed")
 async def get_substack_feed():
-    try:
-        import feedparser
-        feed = feedparser.parse('https://theleftfield.substack.com/feed')
-        
-        articles = []
-        for entry in feed.entries[:15]:
-            articles.append({
-                "id": entry.get('id', entry.link),
-                "title": entry.get('title', ''),
-                "subtitle": entry.get('summary', '')[:200],
-                "author": entry.get('author', 'The Left Field'),
-                "external_url": entry.get('link', ''),
-                "created_at": entry.get('published', ''),
-                "image_url": None
-            })
-        
-        return articles
-    except Exception as e:
-        logger.error(f"Substack feed error: {e}")
-        return []
+    """Latest Left Field posts, from the in-memory cache in substack_feed.py."""
+    return await substack_feed.articles()
 
 @api_router.get("/geo/location")
 async def get_geo_location(request: Request):
-    """Proxy endpoint to get user's geolocation based on IP"""
+    """Visitor's country for INR/USD pricing.
+
+    Answered in-process from the local GeoIP database (geoip.py); ip-api.com
+    is only asked when no database is loaded."""
     import httpx
     
     # Get client IP from headers (may be forwarded through proxy)
     client_ip = request.headers.get('x-forwarded-for', request.client.host if request.client else None)
     if client_ip:
         client_ip = client_ip.split(',')[0].strip()
+
+    if geoip.available():
+        found = geoip.lookup(client_ip) if client_ip else None
+        if found is None:
+            return {"country_code": "US", "status": "fallback"}
+        return {**found, "status": "success"}
     
     try:
         async with httpx.AsyncClient() as http_client:
@@ -131,32 +131,8 @@ GHOST_ADMIN_API_KEY = os.environ.get('GHOST_ADMIN_API_KEY', '')
 GHOST_CONTENT_API_KEY = os.environ.get('GHOST_CONTENT_API_KEY', '')
 
 def create_ghost_admin_token():
-    """Create JWT token for Ghost Admin API authentication"""
-    if not GHOST_ADMIN_API_KEY:
-        return None
-    
-    # Ghost Admin API key format: {id}:{secret}
-    try:
-        key_id, secret = GHOST_ADMIN_API_KEY.split(':')
-    except ValueError:
-        logger.error("Invalid GHOST_ADMIN_API_KEY format. Expected 'id:secret'")
-        return None
-    
-    # Create JWT token
-    iat = int(datetime.now(timezone.utc).timestamp())
-    header = {'alg': 'HS256', 'typ': 'JWT', 'kid': key_id}
-    payload = {
-        'iat': iat,
-        'exp': iat + 5 * 60,  # 5 minutes
-        'aud': '/admin/'
-    }
-    
-    # Decode the secret from hex
-    import binascii
-    secret_bytes = binascii.unhexlify(secret)
-    
-    token = jwt.encode(payload, secret_bytes, algorithm='HS256', headers=header)
-    return token
+    """JWT for Ghost Admin API authentication (cached by ghost_client)."""
+    return ghost_client.admin_token()
 
 class MemberVerifyRequest(BaseModel):
     email: EmailStr
@@ -175,69 +151,49 @@ class MemberVerifyResponse(BaseModel):
 @api_router.post("/ghost/verify-member", response_model=MemberVerifyResponse)
 async def verify_ghost_member(request: MemberVerifyRequest):
     """Verify if an email is a Ghost member and their subscription status"""
-    import httpx
-    from urllib.parse import quote
-    
     # Try Admin API first (most reliable)
     if GHOST_ADMIN_API_KEY:
-        token = create_ghost_admin_token()
-        if token:
-            try:
-                # Ghost filter with email - wrap in quotes and properly encode
-                # Ghost NQL filter syntax: email:'value'
-                encoded_email = quote(request.email, safe='')
-                url = f"{GHOST_URL}/ghost/api/admin/members/?filter=email:'{encoded_email}'"
-                
-                async with httpx.AsyncClient() as http_client:
-                    response = await http_client.get(
-                        url,
-                        headers={'Authorization': f'Ghost {token}'}
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        members = data.get('members', [])
-                        
-                        if members:
-                            member = members[0]
-                            # Check subscription status - comped members are also paid
-                            status = member.get('status', 'free')
-                            
-                            # Check for paid labels (Razorpay individual + corporate team seats + invoice-billed)
-                            # Also any label prefixed with "team-" (e.g. team-sportz-interactive)
-                            # so bespoke clients can be onboarded by Ghost label alone, no backend redeploy.
-                            labels = member.get('labels', [])
-                            label_names = [lbl.get('name', '').lower() for lbl in labels]
-                            has_paid_label = (
-                                any(label in label_names
-                                    for label in ['paid-via-razorpay', 'paid-via-invoice', 'premium-subscriber', 'paid', 'premium', 'corporate-member'])
-                                or any(name.startswith('team-') for name in label_names)
-                            )
-                            
-                            # User is paid if: status is paid/comped, OR has subscriptions, OR has paid labels
-                            is_paid = (
-                                status in ['paid', 'comped'] or 
-                                len(member.get('subscriptions', [])) > 0 or
-                                has_paid_label
-                            )
-                            
-                            return MemberVerifyResponse(
-                                is_member=True,
-                                is_paid=is_paid,
-                                email=member.get('email', request.email),
-                                name=member.get('name'),
-                                status=status if not has_paid_label else 'paid',
-                                id=member.get('id'),
-                            )
-                        else:
-                            return MemberVerifyResponse(
-                                is_member=False,
-                                is_paid=False,
-                                email=request.email,
-                                status='not_found'
-                            )
-            except Exception as e:
-                logger.error(f"Ghost Admin API error: {e}")
+        try:
+            member = await ghost_client.fetch_member(request.email)
+            if member:
+                # Check subscription status - comped members are also paid
+                status = member.get('status', 'free')
+
+                # Check for paid labels (Razorpay individual + corporate team seats + invoice-billed)
+                # Also any label prefixed with "team-" (e.g. team-sportz-interactive)
+                # so bespoke clients can be onboarded by Ghost label alone, no backend redeploy.
+                labels = member.get('labels', [])
+                label_names = [lbl.get('name', '').lower() for lbl in labels]
+                has_paid_label = (
+                    any(label in label_names
+                        for label in ['paid-via-razorpay', 'paid-via-invoice', 'premium-subscriber', 'paid', 'premium', 'corporate-member'])
+                    or any(name.startswith('team-') for name in label_names)
+                )
+
+                # User is paid if: status is paid/comped, OR has subscriptions, OR has paid labels
+                is_paid = (
+                    status in ['paid', 'comped'] or
+                    len(member.get('subscriptions', [])) > 0 or
+                    has_paid_label
+                )
+
+                return MemberVerifyResponse(
+                    is_member=True,
+                    is_paid=is_paid,
+                    email=member.get('email', request.email),
+                    name=member.get('name'),
+                    status=status if not has_paid_label else 'paid',
+                    id=member.get('id'),
+                )
+            else:
+                return MemberVerifyResponse(
+                    is_member=False,
+                    is_paid=False,
+                    email=request.email,
+                    status='not_found'
+                )
+        except Exception as e:
+            logger.error(f"Ghost Admin API error: {e}")
     
     # Fallback: Member is not found or Admin API not configured
     return MemberVerifyResponse(
@@ -270,109 +226,94 @@ async def get_member_details(request: MemberVerifyRequest):
       3. Ghost native subscription       → Stripe-billed (rare)
       4. Ghost status == 'paid'|'comped' → manual admin grant
     """
-    import httpx
 
     if not GHOST_ADMIN_API_KEY:
         raise HTTPException(status_code=503, detail="Admin API not configured")
 
-    token = create_ghost_admin_token()
-    if not token:
+    if not create_ghost_admin_token():
         raise HTTPException(status_code=503, detail="Failed to create admin token")
 
     try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(
-                f'{GHOST_URL}/ghost/api/admin/members/',
-                params={
-                    'filter': f'email:{request.email}',
-                    'include': 'subscriptions,labels',
-                },
-                headers={'Authorization': f'Ghost {token}'}
-            )
+        member = await ghost_client.fetch_member(request.email)
 
-            if response.status_code == 200:
-                data = response.json()
-                members = data.get('members', [])
-
-                if members:
-                    member = members[0]
-                    status = member.get('status', 'free')
-
-                    # 1. Label check — the canonical "real Razorpay subscriber" signal
-                    labels = member.get('labels', []) or []
-                    label_names = [(lbl.get('name') or '').lower() for lbl in labels]
-                    has_razorpay_label = 'paid-via-razorpay' in label_names
-                    has_paid_label = (
-                        has_razorpay_label
-                        or any(name in label_names for name in
-                               ['paid-via-invoice', 'premium-subscriber', 'paid', 'premium', 'corporate-member'])
-                        or any(name.startswith('team-') for name in label_names)
-                    )
+        if member:
+            status = member.get('status', 'free')
 
-                    # 2. Ghost-native subscriptions
-                    subscriptions = member.get('subscriptions', []) or []
+            # 1. Label check — the canonical "real Razorpay subscriber" signal
+            labels = member.get('labels', []) or []
+            label_names = [(lbl.get('name') or '').lower() for lbl in labels]
+            has_razorpay_label = 'paid-via-razorpay' in label_names
+            has_paid_label = (
+                has_razorpay_label
+                or any(name in label_names for name in
+                       ['paid-via-invoice', 'premium-subscriber', 'paid', 'premium', 'corporate-member'])
+                or any(name.startswith('team-') for name in label_names)
+            )
 
-                    is_paid = (
-                        has_paid_label
-                        or status in ['paid', 'comped']
-                        or len(subscriptions) > 0
-                    )
+            # 2. Ghost-native subscriptions
+            subscriptions = member.get('subscriptions', []) or []
 
-                    # Resolve dates with the right source:
-                    subscription_start = None
-                    subscription_end = None
-                    subscription_status = None
-
-                    if subscriptions:
-                        sub = subscriptions[0]
-                        subscription_start = sub.get('start_date') or sub.get('created_at')
-                        subscription_end = sub.get('current_period_end')
-                        subscription_status = sub.get('status', 'active')
-                    elif has_razorpay_label:
-                        # Razorpay subscriber: derive 12-month cycle from member created_at
-                        created_at = member.get('created_at')
-                        subscription_start = created_at
-                        subscription_status = 'active'
-                        if created_at:
-                            try:
-                                start_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                                subscription_end = (start_dt + timedelta(days=365)).isoformat().replace('+00:00', 'Z')
-                            except Exception as e:
-                                # Rare — Ghost created_at came back in an unexpected shape.
-                                # Log so we can spot format drift; account page will show
-                                # a blank expiry until this is fixed.
-                                logger.warning(
-                                    f"Razorpay subscription_end parse failed: "
-                                    f"email={request.email} created_at={created_at!r} err={e!r}"
-                                )
-                                subscription_end = None
-                    elif status == 'comped':
-                        subscription_start = member.get('created_at')
-                        subscription_status = 'comped'
-
-                    # Surface the canonical paid status to the client
-                    canonical_status = 'paid' if has_razorpay_label else status
-
-                    return MemberDetailsResponse(
-                        is_member=True,
-                        is_paid=is_paid,
-                        email=member.get('email', request.email),
-                        name=member.get('name'),
-                        status=canonical_status,
-                        created_at=member.get('created_at'),
-                        subscription_start=subscription_start,
-                        subscription_end=subscription_end,
-                        subscription_status=subscription_status,
-                        avatar_image=member.get('avatar_image'),
-                        note=member.get('note')
-                    )
-                else:
-                    return MemberDetailsResponse(
-                        is_member=False,
-                        is_paid=False,
-                        email=request.email,
-                        status='not_found'
-                    )
+            is_paid = (
+                has_paid_label
+                or status in ['paid', 'comped']
+                or len(subscriptions) > 0
+            )
+
+            # Resolve dates with the right source:
+            subscription_start = None
+            subscription_end = None
+            subscription_status = None
+
+            if subscriptions:
+                sub = subscriptions[0]
+                subscription_start = sub.get('start_date') or sub.get('created_at')
+                subscription_end = sub.get('current_period_end')
+                subscription_status = sub.get('status', 'active')
+            elif has_razorpay_label:
+                # Razorpay subscriber: derive 12-month cycle from member created_at
+                created_at = member.get('created_at')
+                subscription_start = created_at
+                subscription_status = 'active'
+                if created_at:
+                    try:
+                        start_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+                        subscription_end = (start_dt + timedelta(days=365)).isoformat().replace('+00:00', 'Z')
+                    except Exception as e:
+                        # Rare — Ghost created_at came back in an unexpected shape.
+                        # Log so we can spot format drift; account page will show
+                        # a blank expiry until this is fixed.
+                        logger.warning(
+                            f"Razorpay subscription_end parse failed: "
+                            f"email={request.email} created_at={created_at!r} err={e!r}"
+                        )
+                        subscription_end = None
+            elif status == 'comped':
+                subscription_start = member.get('created_at')
+                subscription_status = 'comped'
+
+            # Surface the canonical paid status to the client
+            canonical_status = 'paid' if has_razorpay_label else status
+
+            return MemberDetailsResponse(
+                is_member=True,
+                is_paid=is_paid,
+                email=member.get('email', request.email),
+                name=member.get('name'),
+                status=canonical_status,
+                created_at=member.get('created_at'),
+                subscription_start=subscription_start,
+                subscription_end=subscription_end,
+                subscription_status=subscription_status,
+                avatar_image=member.get('avatar_image'),
+                note=member.get('note')
+            )
+        else:
+            return MemberDetailsResponse(
+                is_member=False,
+                is_paid=False,
+                email=request.email,
+                status='not_found'
+            )
     except Exception as e:
         logger.error(f"Ghost member details error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -387,41 +328,39 @@ class ArticleContentResponse(BaseModel):
     title: str
     feature_image: Optional[str] = None
 
-# In-memory rate limiter for the article-content endpoint.
+# Rate limiter for the article-content endpoint.
 # Keyed by lower-cased email + client IP. A burst of 6 requests is allowed,
 # replenished at 1 token / 10s. A leaked subscriber email can therefore fetch
 # at most ~360 articles/hour from a single IP — fast enough for genuine
 # reading, slow enough that bulk-scraping the archive is impractical.
-from collections import defaultdict
-_ARTICLE_BUCKET: dict = defaultdict(lambda: {'tokens': 6.0, 'last': 0.0})
+# RATE_LIMIT_BACKEND=mongo shares the buckets between workers; the default
+# in-memory buckets are per process (see rate_limit.py).
 _ARTICLE_BUCKET_BURST = 6.0
 _ARTICLE_BUCKET_REFILL_PER_SEC = 0.1  # 1 token / 10s
+_article_limiter = rate_limit.create_limiter(
+    'article',
+    _ARTICLE_BUCKET_BURST,
+    _ARTICLE_BUCKET_REFILL_PER_SEC,
+    db=db,
+    max_entries=int(os.environ.get('ARTICLE_RATE_LIMIT_MAX_BUCKETS', '100000')),
+)
 
-def _check_article_rate_limit(key: str) -> bool:
+async def _check_article_rate_limit(key: str) -> bool:
     """Token-bucket. Returns True if the request is allowed."""
-    import time as _t
-    now = _t.monotonic()
-    bucket = _ARTICLE_BUCKET[key]
-    elapsed = now - bucket['last']
-    bucket['tokens'] = min(
-        _ARTICLE_BUCKET_BURST,
-        bucket['tokens'] + elapsed * _ARTICLE_BUCKET_REFILL_PER_SEC,
-    )
-    bucket['last'] = now
-    if bucket['tokens'] >= 1.0:
-        bucket['tokens'] -= 1.0
-        return True
-    return False
+    return await _article_limiter.check(key)
 
 @api_router.post("/ghost/article-content", response_model=ArticleContentResponse)
-async def get_full_article_content(request: ArticleContentRequest, http_request: Request):
+async def get_full_article_content(request: ArticleContentRequest, http_request: Request, response: Response):
     """Get full article content for verified paid members using Admin API.
 
     Rate-limited per (email, ip) to prevent a leaked subscriber email being
     used to scrape the entire premium archive.
-    """
-    import httpx
 
+    The membership check and the article fetch run concurrently, after the
+    rate limit (so repeats are bounded and mostly absorbed by post_cache);
+    the article is discarded (never returned) unless the member check
+    passes. Per-phase timings are reported in the `Server-Timing` header.
+    """
     if not GHOST_ADMIN_API_KEY:
         raise HTTPException(status_code=503, detail="Admin API not configured")
 
@@ -431,79 +370,83 @@ async def get_full_article_content(request: ArticleContentRequest, http_request:
         or (http_request.client.host if http_request.client else '0.0.0.0')
     )
     bucket_key = f"{(request.email or '').lower()}|{client_ip}"
-    if not _check_article_rate_limit(bucket_key):
+    if not await _check_article_rate_limit(bucket_key):
         raise HTTPException(
             status_code=429,
             detail="Too many requests. Please slow down.",
         )
 
-    token = create_ghost_admin_token()
-    if not token:
+    if not create_ghost_admin_token():
         raise HTTPException(status_code=503, detail="Failed to create admin token")
     
+    timings: dict = {}
+
+    async def _timed(phase, coro):
+        t0 = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            timings[phase] = (time.perf_counter() - t0) * 1000
+
+    started = time.perf_counter()
+    # Start the article fetch now; it is only awaited once the reader is
+    # confirmed paid, and cancelled otherwise. Cancelling only detaches
+    # this waiter: SingleFlight shields the shared fetch.
+    article_task = asyncio.ensure_future(_timed('article', ghost_client.fetch_post(request.slug)))
     try:
-        async with httpx.AsyncClient() as http_client:
-            # First verify the user is a paid member
-            member_response = await http_client.get(
-                f'{GHOST_URL}/ghost/api/admin/members/',
-                params={'filter': f'email:{request.email}'},
-                headers={'Authorization': f'Ghost {token}'}
-            )
-            
-            if member_response.status_code != 200:
-                raise HTTPException(status_code=401, detail="Failed to verify membership")
-            
-            members = member_response.json().get('members', [])
-            if not members:
-                raise HTTPException(status_code=401, detail="Not a member")
+        # Verify the user is a paid member
+        try:
+            member = await _timed('member', ghost_client.fetch_member(request.email))
+        except ghost_client.GhostUpstreamError:
+            raise HTTPException(status_code=401, detail="Failed to verify membership")
+        if not member:
+            raise HTTPException(status_code=401, detail="Not a member")
             
-            member = members[0]
-            # Member is paid if: Ghost status is paid/comped, OR has a Ghost subscription,
-            # OR carries a recognised paid label (covers Razorpay individual subscribers,
-            # corporate-team seats provisioned via Apps Script, bespoke invoice-billed
-            # accounts, AND any team-* identifier label for bespoke client cohorts).
-            labels = [(lbl.get('name') or '').lower() for lbl in member.get('labels', []) or []]
-            has_paid_label = (
-                any(l in labels for l in
-                    ['paid-via-razorpay', 'paid-via-invoice', 'premium-subscriber', 'paid', 'premium', 'corporate-member'])
-                or any(l.startswith('team-') for l in labels)
-            )
-            is_paid = (
-                member.get('status') in ('paid', 'comped')
-                or len(member.get('subscriptions', []) or []) > 0
-                or has_paid_label
-            )
+        # Member is paid if: Ghost status is paid/comped, OR has a Ghost subscription,
+        # OR carries a recognised paid label (covers Razorpay individual subscribers,
+        # corporate-team seats provisioned via Apps Script, bespoke invoice-billed
+        # accounts, AND any team-* identifier label for bespoke client cohorts).
+        labels = [(lbl.get('name') or '').lower() for lbl in member.get('labels', []) or []]
+        has_paid_label = (
+            any(l in labels for l in
+                ['paid-via-razorpay', 'paid-via-invoice', 'premium-subscriber', 'paid', 'premium', 'corporate-member'])
+            or any(l.startswith('team-') for l in labels)
+        )
+        is_paid = (
+            member.get('status') in ('paid', 'comped')
+            or len(member.get('subscriptions', []) or []) > 0
+            or has_paid_label
+        )
 
-            if not is_paid:
-                raise HTTPException(status_code=403, detail="Paid membership required")
-            
-            # Now fetch the full article using Admin API
-            article_response = await http_client.get(
-                f'{GHOST_URL}/ghost/api/admin/posts/slug/{request.slug}/',
-                params={'formats': 'html'},
-                headers={'Authorization': f'Ghost {token}'}
-            )
-            
-            if article_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Article not found")
+        if not is_paid:
+            raise HTTPException(status_code=403, detail="Paid membership required")
             
-            posts = article_response.json().get('posts', [])
-            if not posts:
-                raise HTTPException(status_code=404, detail="Article not found")
-            
-            post = posts[0]
-            return ArticleContentResponse(
-                slug=post.get('slug'),
-                html=post.get('html', ''),
-                title=post.get('title', ''),
-                feature_image=post.get('feature_image')
-            )
+        # Now collect the full article (Admin API) fetched alongside
+        post = await article_task
+        if not post:
+            raise HTTPException(status_code=404, detail="Article not found")
+
+        timings['total'] = (time.perf_counter() - started) * 1000
+        response.headers['Server-Timing'] = ', '.join(
+            f'{phase};dur={ms:.1f}' for phase, ms in timings.items())
+        return ArticleContentResponse(
+            slug=post.get('slug'),
+            html=post.get('html', ''),
+            title=post.get('title', ''),
+            feature_image=post.get('feature_image')
+        )
             
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error fetching article content: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not article_task.done():
+            article_task.cancel()
+        elif not article_task.cancelled():
+            article_task.exception()  # consumed even when the member check failed
+        logger.debug(f"article-content timings slug={request.slug}: {timings}")
 
 class MagicLinkRequest(BaseModel):
     email: EmailStr
@@ -511,23 +454,22 @@ class MagicLinkRequest(BaseModel):
 @api_router.get("/ghost/integrity-token")
 async def get_ghost_integrity_token():
     """Proxy endpoint to get Ghost integrity token"""
-    import httpx
     
     try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(
-                f'{GHOST_URL}/members/api/integrity-token/',
-                headers={
-                    'app-pragma': 'no-cache',
-                    'x-ghost-version': '5.98'
-                }
-            )
+        http_client = ghost_client.get_client()
+        response = await http_client.get(
+            f'{GHOST_URL}/members/api/integrity-token/',
+            headers={
+                'app-pragma': 'no-cache',
+                'x-ghost-version': '5.98'
+            }
+        )
             
-            if response.status_code == 200:
-                return {"token": response.text}
-            else:
-                logger.error(f"Failed to get integrity token: {response.status_code}")
-                return {"token": None, "error": "Failed to get integrity token"}
+        if response.status_code == 200:
+            return {"token": response.text}
+        else:
+            logger.error(f"Failed to get integrity token: {response.status_code}")
+            return {"token": None, "error": "Failed to get integrity token"}
     except Exception as e:
         logger.error(f"Integrity token error: {e}")
         return {"token": None, "error": str(e)}
@@ -535,48 +477,47 @@ async def get_ghost_integrity_token():
 @api_router.post("/ghost/send-magic-link")
 async def send_ghost_magic_link(request: MagicLinkRequest):
     """Proxy endpoint to send Ghost magic link"""
-    import httpx
     
     try:
-        async with httpx.AsyncClient() as http_client:
-            # First, get the integrity token
-            token_response = await http_client.get(
-                f'{GHOST_URL}/members/api/integrity-token/',
-                headers={
-                    'app-pragma': 'no-cache',
-                    'x-ghost-version': '5.98'
-                }
-            )
+        http_client = ghost_client.get_client()
+        # First, get the integrity token
+        token_response = await http_client.get(
+            f'{GHOST_URL}/members/api/integrity-token/',
+            headers={
+                'app-pragma': 'no-cache',
+                'x-ghost-version': '5.98'
+            }
+        )
             
-            integrity_token = token_response.text if token_response.status_code == 200 else None
+        integrity_token = token_response.text if token_response.status_code == 200 else None
             
-            # Now send the magic link request
-            payload = {
-                'email': request.email,
-                'emailType': 'signin'
-            }
+        # Now send the magic link request
+        payload = {
+            'email': request.email,
+            'emailType': 'signin'
+        }
             
-            if integrity_token:
-                payload['integrityToken'] = integrity_token
+        if integrity_token:
+            payload['integrityToken'] = integrity_token
             
-            response = await http_client.post(
-                f'{GHOST_URL}/members/api/send-magic-link/',
-                json=payload,
-                headers={'Content-Type': 'application/json'}
-            )
+        response = await http_client.post(
+            f'{GHOST_URL}/members/api/send-magic-link/',
+            json=payload,
+            headers={'Content-Type': 'application/json'}
+        )
             
-            if response.status_code == 201 or response.status_code == 200:
-                return {"success": True, "message": "Magic link sent successfully"}
-            else:
-                # Try to parse error response
-                try:
-                    error_data = response.json()
-                    error_message = error_data.get('errors', [{}])[0].get('message', 'Failed to send magic link')
-                except:
-                    error_message = f"Ghost returned status {response.status_code}"
+        if response.status_code == 201 or response.status_code == 200:
+            return {"success": True, "message": "Magic link sent successfully"}
+        else:
+            # Try to parse error response
+            try:
+                error_data = response.json()
+                error_message = error_data.get('errors', [{}])[0].get('message', 'Failed to send magic link')
+            except:
+                error_message = f"Ghost returned status {response.status_code}"
                 
-                logger.error(f"Ghost magic link error: {error_message}")
-                raise HTTPException(status_code=response.status_code, detail=error_message)
+            logger.error(f"Ghost magic link error: {error_message}")
+            raise HTTPException(status_code=response.status_code, detail=error_message)
     except HTTPException:
         raise
     except Exception as e:
@@ -586,265 +527,140 @@ async def send_ghost_magic_link(request: MagicLinkRequest):
 @api_router.get("/ghost/member")
 async def get_ghost_member(request: Request):
     """Proxy endpoint to get Ghost member details from session"""
-    import httpx
     
-    # Forward the cookies from the original request
-    cookies = request.cookies
+    # Forward the cookies from the original request. Sent as a raw header —
+    # the shared client's jar rejects every cookie (see ghost_client), so
+    # nothing from another reader's session can be attached here.
+    cookie_header = request.headers.get('cookie', '')
     
     try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(
-                f'{GHOST_URL}/members/api/member/',
-                cookies=cookies
-            )
+        http_client = ghost_client.get_client()
+        response = await http_client.get(
+            f'{GHOST_URL}/members/api/member/',
+            headers={'Cookie': cookie_header} if cookie_header else None,
+        )
             
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return None
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return None
     except Exception as e:
         logger.error(f"Ghost member fetch error: {e}")
         return None
 
 # Dynamic OG Image Generator for social sharing
+# The public post fields behind a card are cached per slug, so a crawler hit
+# on an already-rendered card is answered from og_card's cache without a
+# Content API round trip. Post webhooks drop the entry (this worker) and the
+# TTL bounds staleness everywhere else.
+OG_ARTICLE_CACHE_SIZE = int(os.environ.get('OG_ARTICLE_CACHE_SIZE', '2000'))
+OG_ARTICLE_CACHE_TTL = float(os.environ.get('OG_ARTICLE_CACHE_TTL', '300'))
+# A card rendered without its feature image (source fetch failed) is never
+# stored; browsers and crawlers may keep it only this long.
+OG_DEGRADED_MAX_AGE = 300
+
+og_article_cache = TTLCache(OG_ARTICLE_CACHE_SIZE, OG_ARTICLE_CACHE_TTL)
+
+async def _fetch_og_article(slug: str, fresh: bool = False) -> dict:
+    """Public post fields the card needs, via the Content API."""
+    if not fresh:
+        article = og_article_cache.get(slug)
+        if article is not None:
+            return article
+    response = await ghost_client.get_client().get(
+        f"{GHOST_URL}/ghost/api/content/posts/slug/{slug}/",
+        params={'key': GHOST_CONTENT_API_KEY, 'include': 'tags,authors'}
+    )
+    if response.status_code != 200:
+        raise Exception("Article not found")
+    data = response.json()
+    article = data.get('posts', [{}])[0] if data.get('posts') else None
+    if not article:
+        raise Exception("Article not found")
+    og_article_cache.set(slug, article)
+    return article
+
+async def _og_card_for(slug: str, article: dict, fmt: str = og_card.DEFAULT_FORMAT) -> tuple:
+    """(encoded card bytes, served_from_cache, complete) for this revision of
+    the post. `complete` is False when the feature image could not be
+    fetched; such a card is returned but not cached, so the next request
+    tries the image again.
+
+    Raises og_card.RenderQueueFull when the render pool is saturated.
+    """
+    # Serve a previous render of this exact revision if we have one
+    card_key = og_card.card_key(slug, article.get('updated_at'), fmt)
+    cached_card = await og_card.card_cache.get(card_key)
+    if cached_card is not None:
+        return cached_card, True, True
+
+    # Extract metadata
+    title = article.get('title', 'The State of Play')
+    feature_image_url = article.get('feature_image')
+
+    # Get category/tag
+    tags = article.get('tags', [])
+    category = None
+    if tags:
+        category = tags[0].get('name', '').upper()
+
+    # Determine if premium
+    is_premium = article.get('visibility') in ['paid', 'members']
+
+    # Feature image from the local source cache (downloaded at most once)
+    bg_path = None
+    if feature_image_url:
+        bg_path = await og_card.source_cache.fetch(feature_image_url)
+
+    authors = article.get('authors') or []
+    spec = {
+        'title': title,
+        'category': category,
+        'is_premium': is_premium,
+        'author_name': (authors[0] or {}).get('name') if authors else 'The State of Play',
+    }
+    # Composite off the event loop; under a burst of link previews the
+    # pool sheds load rather than queueing without bound.
+    card_bytes = await og_card.render(spec, bg_path, fmt)
+    complete = bg_path is not None or not feature_image_url
+    if complete:
+        await og_card.card_cache.put(card_key, card_bytes)
+    return card_bytes, False, complete
+
 @api_router.get("/og-image/{slug}")
-async def generate_og_image(slug: str):
-    """Generate a branded OG image for social media sharing - mobile optimized with logo"""
-    import httpx
+async def generate_og_image(slug: str, request: Request,
+                            fmt: Optional[str] = Query(None, alias='format')):
+    """Generate a branded OG image for social media sharing - mobile optimized with logo.
+
+    `?format=png|jpeg|webp|avif` picks the encoding; without it the Accept
+    header decides, falling back to PNG."""
     from fastapi.responses import Response, RedirectResponse
-    from PIL import Image, ImageDraw, ImageFont, ImageEnhance
-    from io import BytesIO
-    import textwrap
-    
-    LOGO_URL = "https://the-state-of-play.ghost.io/content/images/2025/09/TSOP-Logo-Final-Colour-4.png"
     
     try:
-        # Fetch article from Ghost
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{GHOST_URL}/ghost/api/content/posts/slug/{slug}/",
-                params={'key': GHOST_CONTENT_API_KEY, 'include': 'tags,authors'}
-            )
-            
-            if response.status_code != 200:
-                raise Exception("Article not found")
-            
-            data = response.json()
-            article = data.get('posts', [{}])[0] if data.get('posts') else None
-            
-            if not article:
-                raise Exception("Article not found")
-        
-        # Extract metadata
-        title = article.get('title', 'The State of Play')
-        excerpt = article.get('custom_excerpt') or article.get('excerpt') or ''
-        feature_image_url = article.get('feature_image')
-        
-        # Get category/tag
-        tags = article.get('tags', [])
-        category = None
-        if tags:
-            category = tags[0].get('name', '').upper()
-        
-        # Determine if premium
-        is_premium = article.get('visibility') in ['paid', 'members']
-        
-        # Image dimensions (1200x630 - standard OG size)
-        width, height = 1200, 630
-        
-        # Fetch feature image
-        bg_img = None
-        if feature_image_url:
-            try:
-                # Ghost CDN redirects /content/images/... to storage.ghost.io —
-                # must follow redirects or the feature image is silently dropped
-                # and the OG card renders on the plain dark background.
-                async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as img_client:
-                    img_response = await img_client.get(feature_image_url)
-                    if img_response.status_code == 200:
-                        bg_img = Image.open(BytesIO(img_response.content))
-                        bg_img = bg_img.convert('RGB')
-                        
-                        # Scale to cover
-                        img_ratio = bg_img.width / bg_img.height
-                        target_ratio = width / height
-                        
-                        if img_ratio > target_ratio:
-                            new_height = height
-                            new_width = int(height * img_ratio)
-                        else:
-                            new_width = width
-                            new_height = int(width / img_ratio)
-                        
-                        bg_img = bg_img.resize((new_width, new_height), Image.LANCZOS)
-                        
-                        # Center crop
-                        left = (new_width - width) // 2
-                        top = (new_height - height) // 2
-                        bg_img = bg_img.crop((left, top, left + width, top + height))
-                        
-                        # Darken for readability
-                        enhancer = ImageEnhance.Brightness(bg_img)
-                        bg_img = enhancer.enhance(0.4)
-            except Exception as e:
-                logger.error(f"Failed to fetch feature image: {e}")
-        
-        # Fallback to solid color
-        if bg_img is None:
-            bg_img = Image.new('RGB', (width, height), (20, 50, 100))
-        
-        img = bg_img.copy()
-        
-        # Add dark overlay
-        overlay = Image.new('RGBA', (width, height), (0, 0, 0, 130))
-        img = img.convert('RGBA')
-        img = Image.alpha_composite(img, overlay)
-        draw = ImageDraw.Draw(img)
-        
-        # Load editorial fonts (Fraunces for title, DM Sans for UI). These
-        # are variable fonts shipped in /app/backend/assets/fonts.
-        FONT_DIR = os.path.join(os.path.dirname(__file__), "assets", "fonts")
-        FRAUNCES = os.path.join(FONT_DIR, "Fraunces.ttf")
-        DMSANS = os.path.join(FONT_DIR, "DMSans.ttf")
-        try:
-            title_font = ImageFont.truetype(FRAUNCES, 60)
-            try:
-                title_font.set_variation_by_name('SemiBold')
-            except Exception:
-                pass
-            masthead_font = ImageFont.truetype(FRAUNCES, 22)
-            try:
-                masthead_font.set_variation_by_name('SemiBold')
-            except Exception:
-                pass
-            badge_font = ImageFont.truetype(DMSANS, 16)
-            try:
-                badge_font.set_variation_by_axes([14, 700])
-            except Exception:
-                pass
-            byline_font = ImageFont.truetype(DMSANS, 16)
-        except Exception as font_err:
-            logger.warning(f"Editorial fonts failed, falling back: {font_err}")
-            title_font = ImageFont.load_default()
-            masthead_font = ImageFont.load_default()
-            badge_font = ImageFont.load_default()
-            byline_font = ImageFont.load_default()
-        
-        # Colors
-        white = (255, 255, 255)
-        coral = (255, 100, 100)
-        blue = (35, 75, 160)
-        
-        # --- LOGO at top left ---
+        fmt_name = og_card.negotiate_format(fmt, request.headers.get('accept'))
+        article = await _fetch_og_article(slug)
         try:
-            # Ghost CDN redirects /content/images/... to storage.ghost.io —
-            # httpx does NOT follow redirects by default, which silently
-            # drops the logo. Explicitly enable follow_redirects.
-            async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as logo_client:
-                logo_response = await logo_client.get(LOGO_URL)
-                if logo_response.status_code == 200:
-                    logo = Image.open(BytesIO(logo_response.content))
-                    logo = logo.convert('RGBA')
-                    
-                    # Scale logo
-                    logo_height = 50
-                    logo_ratio = logo.width / logo.height
-                    logo_width = int(logo_height * logo_ratio)
-                    logo = logo.resize((logo_width, logo_height), Image.LANCZOS)
-                    
-                    img.paste(logo, (50, 40), logo)
-        except Exception as e:
-            logger.error(f"Failed to fetch logo: {e}")
-        
-        # --- BADGES at top right ---
-        badge_y = 45
-        badge_x = width - 50
-        
-        if category:
-            c_bbox = draw.textbbox((0, 0), category, font=badge_font)
-            c_w, c_h = c_bbox[2] - c_bbox[0], c_bbox[3] - c_bbox[1]
-            pad = 10
-            badge_x = badge_x - c_w - pad*2
-            
-            draw.rounded_rectangle(
-                [badge_x, badge_y, badge_x + c_w + pad*2, badge_y + c_h + pad*2],
-                radius=5,
-                fill=white
+            card_bytes, _, complete = await _og_card_for(slug, article, fmt_name)
+        except og_card.RenderQueueFull:
+            logger.warning(f"OG render queue full, shedding {slug}")
+            return Response(
+                content="OG image renderer busy, retry shortly",
+                status_code=503,
+                media_type="text/plain",
+                headers={"Retry-After": "5", "Cache-Control": "no-store"},
             )
-            draw.text((badge_x + pad, badge_y + pad), category, fill=blue, font=badge_font)
-            badge_x -= 12
-        
-        if is_premium:
-            premium_text = "PREMIUM"
-            p_bbox = draw.textbbox((0, 0), premium_text, font=badge_font)
-            p_w, p_h = p_bbox[2] - p_bbox[0], p_bbox[3] - p_bbox[1]
-            pad = 10
-            badge_x = badge_x - p_w - pad*2
-            
-            draw.rounded_rectangle(
-                [badge_x, badge_y, badge_x + p_w + pad*2, badge_y + p_h + pad*2],
-                radius=5,
-                fill=coral
-            )
-            draw.text((badge_x + pad, badge_y + pad), premium_text, fill=white, font=badge_font)
-        
-        # --- TITLE (pixel-measured wrap so Fraunces lays out cleanly) ---
-        max_text_width = width - 100  # 50px padding each side
-        words = title.split()
-        title_lines = []
-        current = ''
-        for w in words:
-            test = (current + ' ' + w).strip()
-            tb = draw.textbbox((0, 0), test, font=title_font)
-            if (tb[2] - tb[0]) <= max_text_width:
-                current = test
-            else:
-                if current:
-                    title_lines.append(current)
-                current = w
-        if current:
-            title_lines.append(current)
-        # Cap at 4 lines, ellipsise the last if truncated
-        if len(title_lines) > 4:
-            title_lines = title_lines[:4]
-            last = title_lines[-1].rstrip('.,;:')
-            while last and (draw.textbbox((0, 0), last + '…', font=title_font)[2] > max_text_width):
-                last = last[:-1].rstrip()
-            title_lines[-1] = (last + '…') if last else '…'
-
-        title_line_height = 70
-        title_block_h = title_line_height * len(title_lines)
-        # vertically center the title in the middle band of the canvas
-        title_start_y = max(170, (height - title_block_h) // 2 - 20)
-
-        for i, line in enumerate(title_lines):
-            draw.text((50, title_start_y + i * title_line_height), line, fill=white, font=title_font)
-
-        # --- BYLINE (bottom-left) ---
-        authors = article.get('authors') or []
-        author_name = (authors[0] or {}).get('name') if authors else 'The State of Play'
-        byline_text = f"{author_name.upper()}  ·  STATEOFPLAY.CLUB"
-        byline_y = height - 60
-        draw.text((50, byline_y), byline_text, fill=(220, 220, 220), font=byline_font)
-
-        # subtle accent rule above byline
-        draw.rectangle([50, byline_y - 14, 130, byline_y - 12], fill=coral)
-        
-        # Convert to RGB
-        img = img.convert('RGB')
-        
-        # Save
-        img_byte_arr = BytesIO()
-        img.save(img_byte_arr, format='PNG', optimize=True, quality=90)
-        img_byte_arr.seek(0)
         
+        max_age = 86400 if complete else OG_DEGRADED_MAX_AGE
+        headers = {
+            "Cache-Control": f"public, max-age={max_age}",
+            "Content-Disposition": f"inline; filename={slug}-og.{fmt_name}"
+        }
+        if not fmt:
+            headers["Vary"] = "Accept"
         return Response(
-            content=img_byte_arr.getvalue(),
-            media_type="image/png",
-            headers={
-                "Cache-Control": "public, max-age=86400",
-                "Content-Disposition": f"inline; filename={slug}-og.png"
-            }
+            content=card_bytes,
+            media_type=og_card.media_type(fmt_name),
+            headers=headers
         )
         
     except Exception as e:
@@ -854,25 +670,169 @@ async def generate_og_image(slug: str):
             status_code=302
         )
 
+# OG card pre-rendering
+# A new story's first crawler would otherwise pay the full render cost in
+# the middle of the share burst. Publish/edit webhooks render the card in
+# the background; the admin endpoints below do one slug or the archive.
+# Pre-renders go one at a time so live requests keep the pool's headroom.
+# One pending pre-render per slug (a burst of edits to a post re-renders it
+# once more at most) and at most OG_PRERENDER_MAX_PENDING slugs queued; the
+# rest are skipped and rendered by their first crawler instead.
+OG_PRERENDER_EVENTS = {'post.published', 'post.published.edited', 'post.edited'}
+OG_PRERENDER_ATTEMPTS = 5
+OG_PRERENDER_RETRY_DELAY = 5.0  # secs to wait when the render pool is full
+OG_PRERENDER_MAX_PENDING = int(os.environ.get('OG_PRERENDER_MAX_PENDING', '32'))
+
+_og_prerender_lock = asyncio.Lock()
+_og_prerender_tasks: set = set()
+_og_prerender_pending: dict = {}  # slug -> task
+_og_prerender_dirty: set = set()  # slugs edited again while their task was pending
+og_prerender_stats = {'scheduled': 0, 'coalesced': 0, 'skipped': 0,
+                      'rendered': 0, 'already_cached': 0, 'failed': 0}
+og_backfill_state = {'running': False, 'total': 0, 'done': 0, 'failed': 0,
+                     'started_at': None, 'finished_at': None}
+
+async def _prerender_og_format(slug: str, article: Optional[dict], fmt: str) -> str:
+    for attempt in range(OG_PRERENDER_ATTEMPTS):
+        try:
+            _, cached, complete = await _og_card_for(slug, article, fmt)
+        except og_card.RenderQueueFull:
+            await asyncio.sleep(OG_PRERENDER_RETRY_DELAY)
+            continue
+        # A card without its feature image was not cached; the first
+        # crawler will retry the image.
+        return ('already_cached' if cached else 'rendered') if complete else 'failed'
+    return 'failed'
+
+async def _prerender_og_card(slug: str) -> str:
+    """Render and cache the card for the post's current revision in every
+    format negotiate_format() can pick, so no unfurler meets a cold render.
+    Returns 'rendered', 'already_cached' or 'failed'; never raises."""
+    async with _og_prerender_lock:
+        try:
+            article = await _fetch_og_article(slug, fresh=True)
+            outcomes = [await _prerender_og_format(slug, article, fmt) for fmt in og_card.ENCODERS]
+        except Exception as e:
+            logger.warning(f"OG pre-render failed for {slug}: {e!r}")
+            outcomes = ['failed']
+    if 'failed' in outcomes:
+        outcome = 'failed'
+    else:
+        outcome = 'rendered' if 'rendered' in outcomes else 'already_cached'
+    og_prerender_stats[outcome] += 1
+    return outcome
+
+def _spawn_og_task(coro) -> None:
+    task = asyncio.ensure_future(coro)
+    _og_prerender_tasks.add(task)
+    task.add_done_callback(_og_prerender_tasks.discard)
+
+def _schedule_og_prerender(slug: str) -> None:
+    if slug in _og_prerender_pending:
+        # The pending task may already have read the old revision; have it
+        # go round once more rather than queue a second task.
+        _og_prerender_dirty.add(slug)
+        og_prerender_stats['coalesced'] += 1
+        return
+    if len(_og_prerender_pending) >= OG_PRERENDER_MAX_PENDING:
+        og_prerender_stats['skipped'] += 1
+        return
+    og_prerender_stats['scheduled'] += 1
+    task = asyncio.ensure_future(_prerender_pending_slug(slug))
+    _og_prerender_pending[slug] = task
+    _og_prerender_tasks.add(task)
+    task.add_done_callback(_og_prerender_tasks.discard)
+
+async def _prerender_pending_slug(slug: str) -> None:
+    try:
+        while True:
+            _og_prerender_dirty.discard(slug)
+            await _prerender_og_card(slug)
+            if slug not in _og_prerender_dirty:
+                break
+    finally:
+        _og_prerender_pending.pop(slug, None)
+        _og_prerender_dirty.discard(slug)
+
+async def _list_published_slugs() -> List[str]:
+    slugs = []
+    client = ghost_client.get_client()
+    page = 1
+    while page:
+        r = await client.get(
+            f"{GHOST_URL}/ghost/api/content/posts/",
+            params={'key': GHOST_CONTENT_API_KEY, 'limit': 100, 'page': page, 'fields': 'slug'},
+        )
+        if r.status_code != 200:
+            raise Exception(f"Ghost posts list HTTP {r.status_code}")
+        data = r.json()
+        slugs.extend(p['slug'] for p in data.get('posts', []) if p.get('slug'))
+        page = ((data.get('meta') or {}).get('pagination') or {}).get('next')
+    return slugs
+
+async def _og_backfill() -> None:
+    state = og_backfill_state
+    state.update(running=True, total=0, done=0, failed=0,
+                 started_at=datetime.now(timezone.utc).isoformat(), finished_at=None)
+    try:
+        slugs = await _list_published_slugs()
+        state['total'] = len(slugs)
+        for slug in slugs:
+            if await _prerender_og_card(slug) == 'failed':
+                state['failed'] += 1
+            state['done'] += 1
+    except Exception as e:
+        logger.error(f"OG backfill aborted: {e!r}")
+    finally:
+        state.update(running=False, finished_at=datetime.now(timezone.utc).isoformat())
+        logger.info(f"OG backfill finished: {state['done']}/{state['total']} posts, {state['failed']} failed")
+
+@api_router.post("/og-image/prerender/{slug}")
+async def prerender_og_image(slug: str, x_admin_key: Optional[str] = Header(None, alias='X-Admin-Key')):
+    """Admin-only. Render and cache one post's card now."""
+    _require_admin(x_admin_key)
+    return {"slug": slug, "status": await _prerender_og_card(slug)}
+
+@api_router.post("/og-image/backfill", status_code=202)
+async def backfill_og_images(x_admin_key: Optional[str] = Header(None, alias='X-Admin-Key')):
+    """Admin-only. Pre-render cards for the whole archive in the background.
+    Progress is reported under `og_prerender` in /api/metrics."""
+    _require_admin(x_admin_key)
+    if not og_backfill_state['running']:
+        og_backfill_state['running'] = True
+        _spawn_og_task(_og_backfill())
+    return og_backfill_state
+
 # OG Meta endpoint for social sharing
-@api_router.get("/og/{slug}")
-async def get_og_meta(slug: str, request: Request):
-    """Serve Open Graph meta tags for social-media crawlers.
+# Rendered crawler HTML per slug. A newsletter drop sends every link
+# unfurler at the same handful of slugs, so they are answered from memory
+# (with a precomputed ETag for 304s) and Ghost is only asked once per TTL.
+# Post webhooks drop the entry; unknown slugs are remembered briefly so bots
+# probing junk URLs cannot hammer the Content API.
+OG_META_CACHE_SIZE = int(os.environ.get('OG_META_CACHE_SIZE', '2000'))
+OG_META_CACHE_TTL = float(os.environ.get('OG_META_CACHE_TTL', '600'))
+OG_META_NEGATIVE_TTL = float(os.environ.get('OG_META_NEGATIVE_TTL', '30'))
+og_meta_cache = TTLCache(OG_META_CACHE_SIZE, OG_META_CACHE_TTL)  # slug -> (html bytes, etag)
+
+_HTML_ESCAPES = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#039;',
+})
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = (t.strip() for t in if_none_match.split(','))
+    return etag in (c[2:] if c.startswith('W/') else c for c in candidates)
 
-    Vercel routes incoming `/{slug}` requests here when the User-Agent matches
-    a known social-bot signature (see frontend/vercel.json). Humans never see
-    this endpoint — they fall through to the React SPA. The endpoint therefore
-    always returns OG-tag-rich HTML (never a redirect — that would loop).
-    """
-    import httpx
-    from fastapi.responses import HTMLResponse
+async def _build_og_meta(slug: str) -> tuple:
+    """(html, cache ttl or None to skip caching) for a slug."""
 
     def _escape(text):
         if not text:
             return ''
-        return (text.replace('&', '&amp;').replace('<', '&lt;')
-                    .replace('>', '&gt;').replace('"', '&quot;')
-                    .replace("'", '&#039;'))
+        return text.translate(_HTML_ESCAPES)
 
     article_url = f"https://www.stateofplay.club/{slug}"
     site_default_image = f"https://www.stateofplay.club/api/og-image/{slug}"
@@ -882,161 +842,251 @@ async def get_og_meta(slug: str, request: Request):
     description = "India's sports business publication. Reportage, analysis, and intelligence from sport's most consequential rooms."
     image = site_default_image
     published_time = ''
+    ttl = OG_META_NEGATIVE_TTL
 
     try:
-        async with httpx.AsyncClient(timeout=8.0) as client:
-            response = await client.get(
-                f"{GHOST_URL}/ghost/api/content/posts/slug/{slug}/",
-                params={'key': GHOST_CONTENT_API_KEY, 'include': 'authors'},
-            )
-            if response.status_code == 200:
-                data = response.json()
-                article = data.get('posts', [{}])[0] if data.get('posts') else None
-                if article:
-                    title = article.get('title') or title
-                    description = (
-                        article.get('custom_excerpt')
-                        or article.get('excerpt')
-                        or description
-                    )
-                    published_time = article.get('published_at') or ''
-                    # image stays as the dynamic OG card endpoint
+        client = ghost_client.get_client()
+        response = await client.get(
+            f"{GHOST_URL}/ghost/api/content/posts/slug/{slug}/",
+            params={'key': GHOST_CONTENT_API_KEY, 'include': 'authors'},
+            timeout=8.0,
+        )
+        if response.status_code == 200:
+            data = response.json()
+            article = data.get('posts', [{}])[0] if data.get('posts') else None
+            if article:
+                title = article.get('title') or title
+                description = (
+                    article.get('custom_excerpt')
+                    or article.get('excerpt')
+                    or description
+                )
+                published_time = article.get('published_at') or ''
+                ttl = OG_META_CACHE_TTL
+                # image stays as the dynamic OG card endpoint
+        elif response.status_code >= 500:
+            ttl = None  # Ghost trouble, not an unknown slug — don't remember it
     except Exception as e:
         logger.error(f"OG meta fetch failed for {slug}: {e}")
         # Fall through with defaults — DO NOT redirect (would loop).
+        ttl = None
 
+    title_html = _escape(title)
+    description_html = _escape(description)
     html_body = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width, initial-scale=1">
-  <title>{_escape(title)} | The State of Play</title>
-  <meta name="description" content="{_escape(description)}">
+  <title>{title_html} | The State of Play</title>
+  <meta name="description" content="{description_html}">
   <link rel="canonical" href="{article_url}">
   <meta property="og:type" content="article">
   <meta property="og:url" content="{article_url}">
-  <meta property="og:title" content="{_escape(title)}">
-  <meta property="og:description" content="{_escape(description)}">
+  <meta property="og:title" content="{title_html}">
+  <meta property="og:description" content="{description_html}">
   <meta property="og:image" content="{image}">
   <meta property="og:image:secure_url" content="{image}">
   <meta property="og:image:width" content="1200">
   <meta property="og:image:height" content="630">
-  <meta property="og:image:type" content="image/png">
   <meta property="og:site_name" content="The State of Play">
   <meta property="article:published_time" content="{published_time}">
   <meta name="twitter:card" content="summary_large_image">
   <meta name="twitter:site" content="@stateofplayclub">
-  <meta name="twitter:title" content="{_escape(title)}">
-  <meta name="twitter:description" content="{_escape(description)}">
+  <meta name="twitter:title" content="{title_html}">
+  <meta name="twitter:description" content="{description_html}">
   <meta name="twitter:image" content="{image}">
 </head>
 <body>
-  <h1>{_escape(title)}</h1>
-  <p>{_escape(description)}</p>
+  <h1>{title_html}</h1>
+  <p>{description_html}</p>
   <p><a href="{article_url}">Read the full article at The State of Play</a></p>
 </body>
 </html>'''
-    return HTMLResponse(content=html_body, status_code=200, headers={
+    return html_body, ttl
+
+@api_router.get("/og/{slug}")
+async def get_og_meta(slug: str, request: Request):
+    """Serve Open Graph meta tags for social-media crawlers.
+
+    Vercel routes incoming `/{slug}` requests here when the User-Agent matches
+    a known social-bot signature (see frontend/vercel.json). Humans never see
+    this endpoint — they fall through to the React SPA. The endpoint therefore
+    always returns OG-tag-rich HTML (never a redirect — that would loop).
+    """
+    import hashlib
+
+    entry = og_meta_cache.get(slug)
+    if entry is None:
+        html_body, ttl = await _build_og_meta(slug)
+        body = html_body.encode('utf-8')
+        entry = (body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+        if ttl is not None:
+            og_meta_cache.set(slug, entry, ttl=ttl)
+    body, etag = entry
+
+    headers = {
         'Cache-Control': 'public, max-age=300, s-maxage=3600',
-    })
+        'ETag': etag,
+    }
+    if _etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, status_code=200, media_type='text/html; charset=utf-8',
+                    headers=headers)
+
+# Ghost post webhooks — cache invalidation
+# Configure in Ghost Admin → Integrations → custom integration, one webhook
+# per event, each pointing at /api/ghost/webhook/<event>, all with the
+# secret in GHOST_WEBHOOK_SECRET. Ghost's payload does not name the event,
+# so it is carried in the path. Without a secret every delivery is refused.
+GHOST_WEBHOOK_SECRET = os.environ.get('GHOST_WEBHOOK_SECRET', '')
+GHOST_WEBHOOK_MAX_SKEW = 300  # secs a signed delivery stays valid (replay window)
+GHOST_POST_EVENTS = {
+    'post.published', 'post.published.edited', 'post.edited',
+    'post.unpublished', 'post.deleted',
+}
+
+def _verify_ghost_signature(body: bytes, header: str) -> bool:
+    """Ghost signs `body + timestamp` with HMAC-SHA256 and sends
+    `X-Ghost-Signature: sha256=<hex>, t=<ms>`. A timestamp more than
+    GHOST_WEBHOOK_MAX_SKEW from now is refused, so a captured delivery
+    cannot be replayed later."""
+    import hmac
+    import hashlib
+    parts = dict(p.strip().split('=', 1) for p in header.split(',') if '=' in p)
+    signature, ts = parts.get('sha256', ''), parts.get('t', '')
+    if not signature or not ts.isdigit():
+        return False
+    if abs(time.time() - int(ts) / 1000) > GHOST_WEBHOOK_MAX_SKEW:
+        return False
+    expected = hmac.new(
+        GHOST_WEBHOOK_SECRET.encode('utf-8'), body + ts.encode('utf-8'), hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+async def _on_ghost_post_event(event: str, current: dict, previous: dict) -> None:
+    """Fan-out for a Ghost post change. Must stay fast — Ghost gives up on a
+    webhook after a couple of seconds."""
+    slug = current.get('slug')
+    old_slug = previous.get('slug')
+    if slug:
+        ghost_client.invalidate_post(slug, current.get('updated_at'))
+        og_meta_cache.pop(slug)
+        og_article_cache.pop(slug)
+    if old_slug and old_slug != slug:
+        # Renamed or deleted — the previous slug must not keep serving.
+        ghost_client.invalidate_post(old_slug)
+        og_meta_cache.pop(old_slug)
+        og_article_cache.pop(old_slug)
+    await sitemap.apply_post_event(event, current, previous)
+    if slug and event in OG_PRERENDER_EVENTS and current.get('status') == 'published':
+        _schedule_og_prerender(slug)
+
+@api_router.post("/ghost/webhook/{event}")
+async def ghost_webhook(event: str, request: Request):
+    """Receive Ghost post webhooks and invalidate the caches keyed on them."""
+    body = await request.body()
+    if not GHOST_WEBHOOK_SECRET:
+        logger.warning(f"Ghost webhook {event} refused: GHOST_WEBHOOK_SECRET is not set")
+        raise HTTPException(status_code=401, detail="Webhook secret not configured")
+    if not _verify_ghost_signature(body, request.headers.get('X-Ghost-Signature', '')):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    if event not in GHOST_POST_EVENTS:
+        return {"status": "ignored", "event": event}
+    try:
+        import json
+        post = (json.loads(body or b'{}').get('post') or {})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    await _on_ghost_post_event(event, post.get('current') or {}, post.get('previous') or {})
+    return {"status": "ok", "event": event}
 
 # Razorpay Webhook for payment success
 class RazorpayWebhookPayload(BaseModel):
     model_config = ConfigDict(extra="allow")
 
+async def _process_razorpay_event(body: bytes) -> None:
+    """Queue consumer for Razorpay webhooks: record the payer for seamless
+    login. Raises ValueError for a payload that can never be processed."""
+    import json
+
+    payload = json.loads(body)
+    event = payload.get('event', '')
+    logger.debug(f"Razorpay webhook event type: {event}")
+
+    # Handle payment success events
+    if event not in ['payment.captured', 'payment.authorized', 'subscription.activated', 'payment_link.paid']:
+        logger.debug(f"Ignoring event type: {event}")
+        return
+
+    payment_entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
+    subscription_entity = payload.get('payload', {}).get('subscription', {}).get('entity', {})
+    payment_link_entity = payload.get('payload', {}).get('payment_link', {}).get('entity', {})
+
+    # Try to get email from various places
+    email = (
+        payment_entity.get('email') or
+        payment_entity.get('notes', {}).get('email') or
+        subscription_entity.get('notes', {}).get('email') or
+        payment_link_entity.get('notes', {}).get('email') or
+        payload.get('payload', {}).get('payment', {}).get('entity', {}).get('customer', {}).get('email')
+    )
+
+    if email:
+        email = email.lower().strip()
+        await payment_store.record(email)
+        # Reader's Ghost status is about to change — drop any cached
+        # (possibly "not found" / free) lookup for them.
+        ghost_client.invalidate_member(email)
+        logger.info(f"Payment recorded for: {email}")
+    else:
+        logger.warning(f"No email found in Razorpay {event} webhook")
+        logger.debug(f"Payment entity: {payment_entity}")
+
+razorpay_events = webhook_queue.WebhookQueue('razorpay_events', _process_razorpay_event)
+
 @api_router.post("/razorpay/webhook")
 async def razorpay_webhook(request: Request):
     """
     Handle Razorpay webhook for payment success.
-    Stores the email in recent_payments for seamless login.
+
+    Verifies the signature, queues the raw event (deduplicated by Razorpay's
+    event id) and acknowledges at once; `_process_razorpay_event` records the
+    email in payment_store for seamless login in the background. With
+    RAZORPAY_WEBHOOK_SECRET set, an unsigned or mis-signed delivery is
+    logged and acknowledged but never queued, so it cannot take the dedup
+    slot of the genuine event.
     """
     import hmac
     import hashlib
-    import json
-    
-    logger.info("=== RAZORPAY WEBHOOK RECEIVED ===")
-    
+
+    webhook_signature = request.headers.get('X-Razorpay-Signature', '')
+    webhook_secret = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+    body = await request.body()
+
+    # Razorpay resends an event with the same id; fall back to the body hash.
+    event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(body).hexdigest()
+
+    # Verify signature if webhook secret is configured
+    signature_ok = None
+    if webhook_secret:
+        expected_signature = hmac.new(webhook_secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        signature_ok = bool(webhook_signature) and hmac.compare_digest(expected_signature, webhook_signature)
+        if not signature_ok:
+            # 200 so Razorpay does not retry a delivery we will never accept;
+            # logged loudly in case the secret itself is misconfigured.
+            logger.error(f"Razorpay webhook signature verification FAILED for event {event_id}; not queued")
+            return {"status": "rejected", "event_id": event_id}
+    else:
+        logger.debug("Webhook signature verification skipped - secret not configured")
+
     try:
-        # Get the webhook signature
-        webhook_signature = request.headers.get('X-Razorpay-Signature', '')
-        webhook_secret = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
-        
-        logger.info(f"Webhook signature present: {bool(webhook_signature)}")
-        logger.info(f"Webhook secret configured: {bool(webhook_secret)}")
-        
-        # Get raw body for signature verification
-        body = await request.body()
-        body_str = body.decode('utf-8')
-        
-        logger.info(f"Webhook body length: {len(body_str)} bytes")
-        
-        # Verify signature if webhook secret is configured
-        if webhook_secret and webhook_signature:
-            expected_signature = hmac.new(
-                webhook_secret.encode('utf-8'),
-                body_str.encode('utf-8'),
-                hashlib.sha256
-            ).hexdigest()
-            
-            if not hmac.compare_digest(expected_signature, webhook_signature):
-                logger.warning("Razorpay webhook signature verification FAILED")
-                # Return 200 anyway - don't block legitimate webhooks if secret is misconfigured
-            else:
-                logger.info("Razorpay webhook signature verified successfully")
-        else:
-            logger.warning("Webhook signature verification skipped - secret not configured")
-        
-        # Parse the payload
-        payload = json.loads(body_str)
-        
-        event = payload.get('event', '')
-        logger.info(f"Razorpay webhook event type: {event}")
-        
-        # Handle payment success events
-        if event in ['payment.captured', 'payment.authorized', 'subscription.activated', 'payment_link.paid']:
-            payment_entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
-            subscription_entity = payload.get('payload', {}).get('subscription', {}).get('entity', {})
-            payment_link_entity = payload.get('payload', {}).get('payment_link', {}).get('entity', {})
-            
-            # Try to get email from various places
-            email = (
-                payment_entity.get('email') or 
-                payment_entity.get('notes', {}).get('email') or
-                subscription_entity.get('notes', {}).get('email') or
-                payment_link_entity.get('notes', {}).get('email') or
-                payload.get('payload', {}).get('payment', {}).get('entity', {}).get('customer', {}).get('email')
-            )
-            
-            logger.info(f"Extracted email from webhook: {email}")
-            
-            if email:
-                email = email.lower().strip()
-                recent_payments[email] = datetime.now(timezone.utc)
-                logger.info(f"Payment recorded successfully for: {email}")
-                
-                # Clean up old entries (older than 30 mins)
-                cutoff = datetime.now(timezone.utc) - timedelta(minutes=PAYMENT_VALID_MINUTES)
-                to_remove = [e for e, t in recent_payments.items() if t < cutoff]
-                for e in to_remove:
-                    del recent_payments[e]
-                
-                logger.info(f"Current recent_payments count: {len(recent_payments)}")
-            else:
-                logger.warning("No email found in webhook payload")
-                logger.debug(f"Payment entity: {payment_entity}")
-        else:
-            logger.info(f"Ignoring event type: {event}")
-        
-        logger.info("=== WEBHOOK PROCESSED SUCCESSFULLY ===")
-        return {"status": "ok", "event": event}
-        
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse webhook JSON: {e}")
-        return {"status": "error", "message": "Invalid JSON"}
+        queued = await razorpay_events.enqueue(event_id, body, signature_ok=signature_ok)
     except Exception as e:
-        logger.error(f"Razorpay webhook error: {e}", exc_info=True)
+        logger.error(f"Razorpay webhook enqueue error: {e!r}")
         # Return 200 anyway to prevent Razorpay from retrying endlessly
         return {"status": "error", "message": str(e)}
+    return {"status": "ok", "event_id": event_id, "duplicate": not queued}
 
 class CheckPaymentRequest(BaseModel):
     email: EmailStr
@@ -1055,46 +1105,28 @@ async def check_recent_payment(request: CheckPaymentRequest):
     email = request.email.lower().strip()
     
     # Check if email has a recent payment
-    if email in recent_payments:
-        payment_time = recent_payments[email]
-        cutoff = datetime.now(timezone.utc) - timedelta(minutes=PAYMENT_VALID_MINUTES)
-        
-        if payment_time > cutoff:
-            return CheckPaymentResponse(
-                paid=True,
-                email=email,
-                message="Payment confirmed"
-            )
+    if await payment_store.is_recent(email):
+        return CheckPaymentResponse(
+            paid=True,
+            email=email,
+            message="Payment confirmed"
+        )
     
     # Also check Ghost as fallback (in case webhook didn't fire)
     # This ensures we don't block legitimate paid users
     try:
-        import httpx
         if GHOST_ADMIN_API_KEY:
-            token = create_ghost_admin_token()
-            if token:
-                async with httpx.AsyncClient() as http_client:
-                    response = await http_client.get(
-                        f'{GHOST_URL}/ghost/api/admin/members/',
-                        params={'filter': f'email:{email}'},
-                        headers={'Authorization': f'Ghost {token}'}
+            member = await ghost_client.fetch_member(email)
+            if member:
+                status = member.get('status', 'free')
+                is_paid = status in ['paid', 'comped'] or len(member.get('subscriptions', [])) > 0
+
+                if is_paid:
+                    return CheckPaymentResponse(
+                        paid=True,
+                        email=email,
+                        message="Member verified via Ghost"
                     )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        members = data.get('members', [])
-                        
-                        if members:
-                            member = members[0]
-                            status = member.get('status', 'free')
-                            is_paid = status in ['paid', 'comped'] or len(member.get('subscriptions', [])) > 0
-                            
-                            if is_paid:
-                                return CheckPaymentResponse(
-                                    paid=True,
-                                    email=email,
-                                    message="Member verified via Ghost"
-                                )
     except Exception as e:
         logger.error(f"Ghost check error: {e}")
     
@@ -1115,6 +1147,54 @@ async def health_check():
     }
 
 
+ADMIN_KEY = os.environ.get('ADMIN_KEY', '')
+
+def _require_admin(x_admin_key: Optional[str]) -> None:
+    if not ADMIN_KEY:
+        raise HTTPException(status_code=503, detail='Admin key not configured on server')
+    if not x_admin_key or x_admin_key != ADMIN_KEY:
+        raise HTTPException(status_code=403, detail='Invalid admin key')
+
+@api_router.get("/metrics")
+async def get_metrics(x_admin_key: Optional[str] = Header(None, alias='X-Admin-Key')):
+    """Admin-only. Hit/miss counters for the in-process Ghost caches."""
+    _require_admin(x_admin_key)
+    return {
+        "ghost_admin_token": ghost_client.admin_tokens.stats(),
+        "member_cache": ghost_client.member_cache.stats(),
+        "ghost_single_flight": ghost_client.inflight.stats(),
+        "article_cache": ghost_client.post_cache.stats(),
+        "og_card_cache": og_card.card_cache.stats(),
+        "og_source_cache": og_card.source_cache.stats(),
+        "og_meta_cache": og_meta_cache.stats(),
+        "og_article_cache": og_article_cache.stats(),
+        "sitemap": sitemap.store.stats(),
+        "substack_feed": substack_feed.stats(),
+        "geoip": geoip.stats(),
+        "article_rate_limit": _article_limiter.stats(),
+        "recent_payments": payment_store.stats(),
+        "razorpay_webhook_queue": await razorpay_events.stats(),
+        "invoice_sequence": invoice_sequence.stats(),
+        "invoice_store": invoice_store.stats(),
+        "invoice_render_pool": invoice_render_stats(),
+        "og_render_pool": og_card.pool_stats(),
+        "og_prerender": {**og_prerender_stats, "backfill": og_backfill_state},
+    }
+
+@api_router.post("/geo/reload")
+async def reload_geoip(x_admin_key: Optional[str] = Header(None, alias='X-Admin-Key')):
+    """Admin-only. Re-open GEOIP_DB_PATH after the file has been replaced."""
+    _require_admin(x_admin_key)
+    return await geoip.reload()
+
+@api_router.post("/og-image/reload-assets")
+async def reload_og_assets(x_admin_key: Optional[str] = Header(None, alias='X-Admin-Key')):
+    """Admin-only. Re-fetch the OG logo and restart the render workers so
+    they reload fonts and logo (e.g. after a rebrand)."""
+    _require_admin(x_admin_key)
+    return {"asset_tag": await og_card.reload_assets(force=True)}
+
+
 # ════════════════════════════════════════════════════════════════════════
 # GST Tax Invoice — self-serve PDF generator
 # ════════════════════════════════════════════════════════════════════════
@@ -1125,7 +1205,9 @@ from invoice_generator import (
     fiscal_year as inv_fiscal_year,
     validate_gstin as inv_validate_gstin,
     compute_tax as inv_compute_tax,
-    build_invoice_pdf,
+    render as render_invoice_pdf,
+    render_stats as invoice_render_stats,
+    shutdown as shutdown_invoice_renderer,
 )
 
 
@@ -1154,62 +1236,6 @@ class InvoiceGenerateRequest(BaseModel):
     issue_date: Optional[str] = None   # ISO date 'YYYY-MM-DD'; default = payment date
 
 
-def _fy_bounds(d: datetime) -> tuple[datetime, datetime]:
-    """Return (fy_start, fy_end_exclusive) for the Indian fiscal year containing d."""
-    y = d.year if d.month >= 4 else d.year - 1
-    fy_start = datetime(y, 4, 1, tzinfo=timezone.utc)
-    fy_end = datetime(y + 1, 4, 1, tzinfo=timezone.utc)
-    return fy_start, fy_end
-
-
-async def _ghost_seq_for_member(member_id: str, member_created_at: datetime) -> int:
-    """1-based chronological position of this member among 'paid-via-razorpay'
-    members in the current FY, ordered by created_at ascending. Deterministic
-    and sequential within the FY — no DB required. Returns 0 on failure."""
-    if not GHOST_ADMIN_API_KEY or not member_id:
-        return 0
-
-    fy_start, fy_end = _fy_bounds(member_created_at)
-    import httpx
-    token = create_ghost_admin_token()
-    members: list[dict] = []
-    page = 1
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            while True:
-                r = await client.get(
-                    f"{GHOST_URL}/ghost/api/admin/members/",
-                    params={
-                        "filter": (
-                            f"label:paid-via-razorpay+"
-                            f"created_at:>='{fy_start.strftime('%Y-%m-%d %H:%M:%S')}'+"
-                            f"created_at:<'{fy_end.strftime('%Y-%m-%d %H:%M:%S')}'"
-                        ),
-                        "limit": 100,
-                        "page": page,
-                        "order": "created_at asc",
-                        "include": "labels",
-                    },
-                    headers={"Authorization": f"Ghost {token}"},
-                )
-                if r.status_code != 200:
-                    break
-                payload = r.json()
-                members.extend(payload.get("members", []))
-                pages = (payload.get("meta", {}).get("pagination") or {}).get("pages") or 1
-                if page >= pages:
-                    break
-                page += 1
-    except Exception as e:
-        logger.warning(f"Ghost FY member listing failed: {e!r}")
-        return 0
-
-    for i, m in enumerate(members):
-        if m.get("id") == member_id:
-            return i + 1
-    return 0
-
-
 @api_router.post("/invoice/generate")
 async def generate_gst_invoice(req: InvoiceGenerateRequest):
     """Generate a GST tax invoice PDF for a paid member.
@@ -1239,24 +1265,15 @@ async def generate_gst_invoice(req: InvoiceGenerateRequest):
     if not GHOST_ADMIN_API_KEY:
         raise HTTPException(status_code=503, detail="Member verification unavailable")
 
-    import httpx
     member = None
     last_err = None
-    token = create_ghost_admin_token()
     for attempt in range(3):
         try:
-            async with httpx.AsyncClient(timeout=10.0) as http_client:
-                r = await http_client.get(
-                    f"{GHOST_URL}/ghost/api/admin/members/",
-                    params={"filter": f"email:{req.email}", "include": "subscriptions,labels"},
-                    headers={"Authorization": f"Ghost {token}"},
-                )
-            if r.status_code == 200:
-                members = r.json().get("members", [])
-                if members:
-                    member = members[0]
-                break
-            last_err = f"HTTP {r.status_code}"
+            member = await ghost_client.fetch_member(req.email)
+            break
+        except ghost_client.GhostUpstreamError as e:
+            last_err = str(e)
+            logger.warning(f"Ghost lookup for invoice attempt {attempt+1} failed: {e!r}")
         except Exception as e:
             last_err = repr(e)
             logger.warning(f"Ghost lookup for invoice attempt {attempt+1} failed: {last_err}")
@@ -1333,14 +1350,40 @@ async def generate_gst_invoice(req: InvoiceGenerateRequest):
             )
         issued_at = override
 
-    # ─── 6. invoice number — Ghost-derived sequential ─────────
+    # ─── 6. invoice number — FY-sequential (see invoice_sequence.py) ─────
     fy = inv_fiscal_year(issued_at)
-    seq = await _ghost_seq_for_member(member.get("id"), payment_dt)
+    seq = await invoice_sequence.seq_for_member(
+        member.get("id"), payment_dt, labelled="paid-via-razorpay" in labels,
+    )
     if seq <= 0:
         # Defensive fallback — should never normally fire
         seq = abs(hash(member.get("id") or req.email)) % 9999 + 1
     invoice_number = f"TSOP/{fy}/{seq:04d}"
 
+    # ─── 7. render PDF (or reuse the stored one) ──────────────
+    buyer_state_name = (
+        "International" if req.is_international
+        else INDIAN_STATES.get(req.state_code or "", "—")
+    )
+    invoice_data = {
+        "invoice_number": invoice_number,
+        "issued_at": issued_at,
+        "buyer": {
+            "name": req.legal_name,
+            "gstin": gstin,
+            "address": req.address,
+            "state_name": buyer_state_name,
+            "state_code": req.state_code or "—",
+            "is_international": req.is_international,
+        },
+        "period_start": sub_start.strftime("%d %b %Y"),
+        "period_end": sub_end.strftime("%d %b %Y"),
+        "razorpay_ref": rzp_ref,
+        "taxable_value": taxable_value,
+        "tax": tax,
+    }
+    artifact = invoice_store.artifact_key(invoice_data)
+
     # Optional persistence (only if Mongo is wired) — for auditing only
     if db is not None:
         try:
@@ -1357,34 +1400,15 @@ async def generate_gst_invoice(req: InvoiceGenerateRequest):
                     "taxable_value": taxable_value,
                     "total": tax["total"],
                     "issued_at": issued_at.isoformat(),
+                    "artifact": artifact,
+                    "artifact_store": invoice_store.backend(),
                 }},
                 upsert=True,
             )
         except Exception as e:
             logger.warning(f"Invoice persistence failed (non-fatal): {e!r}")
 
-    # ─── 6. render PDF ────────────────────────────────────────
-    buyer_state_name = (
-        "International" if req.is_international
-        else INDIAN_STATES.get(req.state_code or "", "—")
-    )
-    pdf_bytes = build_invoice_pdf({
-        "invoice_number": invoice_number,
-        "issued_at": issued_at,
-        "buyer": {
-            "name": req.legal_name,
-            "gstin": gstin,
-            "address": req.address,
-            "state_name": buyer_state_name,
-            "state_code": req.state_code or "—",
-            "is_international": req.is_international,
-        },
-        "period_start": sub_start.strftime("%d %b %Y"),
-        "period_end": sub_end.strftime("%d %b %Y"),
-        "razorpay_ref": rzp_ref,
-        "taxable_value": taxable_value,
-        "tax": tax,
-    })
+    pdf_bytes = await invoice_store.get_or_render(invoice_data, render_invoice_pdf, key=artifact)
 
     safe_num = invoice_number.replace("/", "-")
     return Response(
@@ -1568,12 +1592,12 @@ async def generate_team_gst_invoice(req: TeamInvoiceGenerateRequest):
     seq = _team_invoice_seq(account.get("account_id") or "")
     invoice_number = f"TSOP-T/{fy}/{seq:04d}"
 
-    # ─── 7. render PDF ────────────────────────────────────────
+    # ─── 7. render PDF (or reuse the stored one) ──────────────
     buyer_state_name = (
         "International" if req.is_international
         else INDIAN_STATES.get(req.state_code or "", "—")
     )
-    pdf_bytes = build_invoice_pdf({
+    pdf_bytes = await invoice_store.get_or_render({
         "invoice_number": invoice_number,
         "issued_at": issued_at,
         "buyer": {
@@ -1590,7 +1614,7 @@ async def generate_team_gst_invoice(req: TeamInvoiceGenerateRequest):
         "taxable_value": taxable_value,
         "tax": tax,
         "description_override": f"The State of Play \u2014 {plan_name} ({account.get('seats') or '—'} seats, annual)",
-    })
+    }, render_invoice_pdf)
 
     safe_num = invoice_number.replace("/", "-")
     return Response(
@@ -1610,75 +1634,56 @@ async def root_health_check():
     }
 
 # ─── SEO: sitemap.xml + robots.txt ────────────────────────────────
-@api_router.get("/sitemap.xml")
-async def sitemap_xml():
-    """Dynamic XML sitemap. Lists static routes + every published Ghost post."""
-    import httpx
-    from fastapi.responses import Response as FastResponse
+def _accepts_gzip(request: Request) -> bool:
+    for part in request.headers.get('accept-encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*') and params.replace(' ', '') not in ('q=0', 'q=0.0'):
+            return True
+    return False
+
+async def _serve_sitemap(request: Request, name: str) -> Response:
+    """Serve a pre-gzipped sitemap document, decompressing only for the
+    rare client that does not accept gzip."""
+    import gzip
+    await sitemap.store.ensure_loaded()
+    doc = sitemap.store.document(name)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Sitemap not found")
+    gz_body, etag = doc
+    gzipped = _accepts_gzip(request)
+    if gzipped:
+        # Each representation gets its own strong ETag (RFC 9110 §8.8.3).
+        etag = etag[:-1] + '-gz"'
+    headers = {'Cache-Control': 'public, max-age=3600', 'ETag': etag, 'Vary': 'Accept-Encoding'}
+    if _etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers['Content-Encoding'] = 'gzip'
+        return Response(content=gz_body, media_type='application/xml', headers=headers)
+    return Response(content=gzip.decompress(gz_body), media_type='application/xml', headers=headers)
 
-    SITE = "https://www.stateofplay.club"
-    static_paths = [
-        ("/",            "1.0", "daily"),
-        ("/state-of-play","0.9", "daily"),
-        ("/archive",     "0.8", "daily"),
-        ("/left-field",  "0.8", "weekly"),
-        ("/outfield",    "0.7", "weekly"),
-        ("/about",       "0.6", "monthly"),
-        ("/contact",     "0.5", "monthly"),
-        ("/teams",       "0.6", "monthly"),
-        ("/partnerships","0.6", "monthly"),
-        ("/membership",  "0.7", "monthly"),
-        ("/terms",       "0.3", "yearly"),
-        ("/privacy",     "0.3", "yearly"),
-    ]
-
-    posts = []
+@api_router.get("/sitemap.xml")
+async def sitemap_xml(request: Request):
+    """Sitemap index of /sitemap-pages.xml and one /sitemap-posts-YYYY.xml per
+    year (or, with SITEMAP_INDEX=0, one flat sitemap of everything).
+
+    Served from the incrementally maintained store in sitemap.py, so a
+    crawler hit never pages through Ghost."""
+    return await _serve_sitemap(request, sitemap.INDEX if sitemap.SITEMAP_INDEX else sitemap.FLAT)
+
+@api_router.get("/sitemap-{shard}.xml")
+async def sitemap_shard(shard: str, request: Request):
+    """Child sitemap referenced from the index: `pages` or `posts-YYYY`."""
+    return await _serve_sitemap(request, shard)
+
+@api_router.post("/sitemap/rebuild")
+async def rebuild_sitemap(x_admin_key: Optional[str] = Header(None, alias='X-Admin-Key')):
+    """Admin-only. Re-walk Ghost and replace the stored sitemap."""
+    _require_admin(x_admin_key)
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            page = 1
-            while True:
-                r = await client.get(
-                    f"{GHOST_URL}/ghost/api/content/posts/",
-                    params={
-                        'key': GHOST_CONTENT_API_KEY,
-                        'limit': 100,
-                        'page': page,
-                        'fields': 'slug,updated_at,published_at',
-                        'filter': 'status:published+visibility:[public,paid,members]',
-                    },
-                )
-                if r.status_code != 200:
-                    break
-                data = r.json()
-                posts.extend(data.get('posts', []))
-                meta = (data.get('meta') or {}).get('pagination') or {}
-                if not meta.get('next'):
-                    break
-                page = meta['next']
-                if page > 10:
-                    break
+        return {"posts": await sitemap.store.rebuild()}
     except Exception as e:
-        logger.error(f"sitemap ghost fetch failed: {e}")
-
-    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
-             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
-    for path, prio, freq in static_paths:
-        lines.append(
-            f'<url><loc>{SITE}{path}</loc><changefreq>{freq}</changefreq><priority>{prio}</priority></url>')
-    for p in posts:
-        slug = p.get('slug')
-        if not slug:
-            continue
-        lastmod = p.get('updated_at') or p.get('published_at') or ''
-        lastmod_tag = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
-        lines.append(
-            f'<url><loc>{SITE}/{slug}</loc>{lastmod_tag}<changefreq>monthly</changefreq><priority>0.7</priority></url>')
-    lines.append('</urlset>')
-    return FastResponse(
-        content='\n'.join(lines),
-        media_type='application/xml',
-        headers={'Cache-Control': 'public, max-age=3600'},
-    )
+        raise HTTPException(status_code=502, detail=f"Ghost fetch failed: {e}")
 
 
 @api_router.get("/robots.txt")
@@ -1761,7 +1766,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_ghost_client():
+    await ghost_client.startup()
+
+@app.on_event("startup")
+async def startup_og_renderer():
+    await og_card.startup()
+
+@app.on_event("startup")
+async def startup_geoip():
+    await geoip.startup()
+
+@app.on_event("startup")
+async def startup_substack_feed():
+    await substack_feed.startup()
+
+@app.on_event("startup")
+async def startup_payment_store():
+    payment_store.init(db)
+    razorpay_events.init(db)
+    razorpay_events.start()
+
+@app.on_event("startup")
+async def startup_invoice_sequence():
+    invoice_sequence.init(db)
+    invoice_store.init(db)
+
+@app.on_event("startup")
+async def startup_sitemap():
+    sitemap.init(db)
+    await sitemap.startup()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     if client:
         client.close()
+
+@app.on_event("shutdown")
+async def shutdown_ghost_client():
+    await ghost_client.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_substack_feed():
+    await substack_feed.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_invoice_pool():
+    shutdown_invoice_renderer()
+
+@app.on_event("shutdown")
+async def shutdown_webhook_queue():
+    await razorpay_events.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_sitemap():
+    await sitemap.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_og_renderer():
+    for task in list(_og_prerender_tasks):
+        task.cancel()
+    og_card.shutdown()
@@ -0,0 +1,519 @@
+"""
+sitemap.py — incrementally maintained sitemaps for /api/sitemap.xml.
+
+The sitemap used to be rebuilt on every request by paging through the Ghost
+Content API (and silently stopped after 1,000 posts). Instead, every
+published post's slug, lastmod and publication year are kept here:
+
+  * built once from Ghost when the store is empty (and re-synced every
+    SITEMAP_RESYNC_SECONDS to catch any missed webhook),
+  * updated one post at a time from Ghost post webhooks via `upsert()` /
+    `remove()` — the webhook only names the slug; what is listed is
+    re-read from the Content API, never taken from the payload,
+  * persisted — Mongo collection `sitemap_posts` when Mongo is configured,
+    otherwise a JSON file at SITEMAP_STORE_PATH — so a restart serves the
+    last known sitemap immediately.
+
+The persisted store is the shared copy; each worker's memory is a cache of
+it. A webhook is handled by one worker only, so before serving, a worker
+checks (at most every SITEMAP_REFRESH_SECONDS) whether the store changed
+since it last read it — a version counter in `sitemap_state`, or the JSON
+file's mtime — and reloads if so. File writes are read-modify-write under
+an flock, so two workers' webhooks never overwrite each other.
+
+Documents are served as a sitemap index (SITEMAP_INDEX, the default):
+
+    /sitemap.xml               <sitemapindex> of the shards below
+    /sitemap-pages.xml         static routes
+    /sitemap-posts-YYYY.xml    posts first published in YYYY
+
+With SITEMAP_INDEX=0, /sitemap.xml is the single flat <urlset> instead.
+Each document is gzip-encoded once, streamed line by line into the
+compressor, and re-encoded only when a post in it changes; an edit touches
+one year's shard and the index.
+
+Configuration (all optional):
+  - SITEMAP_STORE_PATH       JSON fallback store   (default /tmp/tsop-sitemap.json)
+  - SITEMAP_RESYNC_SECONDS   full re-sync interval (default 86400; 0 disables)
+  - SITEMAP_INDEX            serve an index + shards (default 1)
+  - SITEMAP_REFRESH_SECONDS  how often to check the store for other
+                             workers' changes (default 5)
+"""
+from __future__ import annotations
+
+import os
+import gzip
+import json
+import time
+import fcntl
+import asyncio
+import hashlib
+import logging
+from io import BytesIO
+from typing import Iterable, Optional
+
+import ghost_client
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+GHOST_URL = os.environ.get('GHOST_URL', 'https://the-state-of-play.ghost.io')
+GHOST_CONTENT_API_KEY = os.environ.get('GHOST_CONTENT_API_KEY', '')
+
+SITEMAP_STORE_PATH = os.environ.get('SITEMAP_STORE_PATH', '/tmp/tsop-sitemap.json')
+SITEMAP_RESYNC_SECONDS = float(os.environ.get('SITEMAP_RESYNC_SECONDS', '86400'))
+SITEMAP_INDEX = os.environ.get('SITEMAP_INDEX', '1').lower() not in ('0', 'false', 'no')
+SITEMAP_REFRESH_SECONDS = float(os.environ.get('SITEMAP_REFRESH_SECONDS', '5'))
+
+SITE = 'https://www.stateofplay.club'
+STATIC_PATHS = [
+    ("/",            "1.0", "daily"),
+    ("/state-of-play","0.9", "daily"),
+    ("/archive",     "0.8", "daily"),
+    ("/left-field",  "0.8", "weekly"),
+    ("/outfield",    "0.7", "weekly"),
+    ("/about",       "0.6", "monthly"),
+    ("/contact",     "0.5", "monthly"),
+    ("/teams",       "0.6", "monthly"),
+    ("/partnerships","0.6", "monthly"),
+    ("/membership",  "0.7", "monthly"),
+    ("/terms",       "0.3", "yearly"),
+    ("/privacy",     "0.3", "yearly"),
+]
+LISTED_VISIBILITIES = {'public', 'paid', 'members'}
+
+INDEX = 'index'   # document names accepted by document()
+FLAT = 'all'
+PAGES = 'pages'
+_XML_DECL = '<?xml version="1.0" encoding="UTF-8"?>'
+_URLSET_OPEN = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+
+
+def url_line(slug: str, lastmod: Optional[str]) -> str:
+    lastmod_tag = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+    return f'<url><loc>{SITE}/{slug}</loc>{lastmod_tag}<changefreq>monthly</changefreq><priority>0.7</priority></url>'
+
+
+_STATIC_LINES = [
+    f'<url><loc>{SITE}{path}</loc><changefreq>{freq}</changefreq><priority>{prio}</priority></url>'
+    for path, prio, freq in STATIC_PATHS
+]
+
+
+def _year(published_at: Optional[str], lastmod: Optional[str]) -> str:
+    stamp = published_at or lastmod or ''
+    return stamp[:4] if stamp[:4].isdigit() else 'undated'
+
+
+def _encode(lines: Iterable[str]) -> tuple:
+    """(gzip bytes, ETag) of the newline-joined lines, without ever holding
+    the uncompressed document. mtime=0 keeps the output deterministic."""
+    buf = BytesIO()
+    digest = hashlib.sha1()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as gz:
+        for line in lines:
+            chunk = (line + '\n').encode('utf-8')
+            digest.update(chunk)
+            gz.write(chunk)
+    return buf.getvalue(), '"' + digest.hexdigest()[:20] + '"'
+
+
+class SitemapStore:
+    """slug -> (lastmod, year) for every listed post, a year -> slugs
+    index, and the encoded documents."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = None
+        self.posts: dict = {}
+        self.shards: dict = {}  # year -> set of slugs
+        self.loaded = False
+        self._encoded: dict = {}  # document name -> (gzip bytes, etag)
+        self._rebuilding: Optional[dict] = None  # webhook changes seen mid-rebuild
+        self._rebuild_lock = asyncio.Lock()
+        self._load_task: Optional[asyncio.Future] = None
+        self._version = None  # store version this worker's memory reflects
+        self._checked_at = 0.0
+        self.rebuilds = 0
+        self.updates = 0
+        self.reloads = 0
+        self.encodes = 0
+
+    # ── in-memory model ──
+    def _replace_all(self, posts: dict) -> None:
+        self.posts = posts
+        self.shards = {}
+        for slug, (_, year) in posts.items():
+            self.shards.setdefault(year, set()).add(slug)
+        self._encoded = {}
+
+    def _touch(self, year: str) -> None:
+        for name in (f'posts-{year}', INDEX, FLAT):
+            self._encoded.pop(name, None)
+
+    def _set(self, slug: str, entry: tuple) -> None:
+        old = self.posts.get(slug)
+        if old is not None and old[1] != entry[1]:
+            self._drop(slug)
+        self.posts[slug] = entry
+        self.shards.setdefault(entry[1], set()).add(slug)
+        self._touch(entry[1])
+
+    def _drop(self, slug: str) -> None:
+        _, year = self.posts.pop(slug)
+        slugs = self.shards.get(year)
+        if slugs is not None:
+            slugs.discard(slug)
+            if not slugs:
+                del self.shards[year]
+        self._touch(year)
+
+    # ── persistence ──
+    async def _load(self) -> dict:
+        """Read the shared store, noting the version it was read at."""
+        if self.db is not None:
+            self._version = await self._store_version()
+            return {
+                d['_id']: (d.get('lastmod') or '', d.get('year') or _year(None, d.get('lastmod')))
+                async for d in self.db.sitemap_posts.find({})
+            }
+        self._version = await asyncio.to_thread(self._file_version)
+        return await asyncio.to_thread(self._read_file)
+
+    async def _store_version(self):
+        if self.db is not None:
+            doc = await self.db.sitemap_state.find_one({'_id': 'posts'})
+            return doc['version'] if doc else 0
+        return await asyncio.to_thread(self._file_version)
+
+    async def _bump_version(self) -> None:
+        from pymongo import ReturnDocument
+        doc = await self.db.sitemap_state.find_one_and_update(
+            {'_id': 'posts'}, {'$inc': {'version': 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+        # If another worker bumped it in between, leave ours behind so the
+        # next refresh picks their change up.
+        if self._version is not None and doc['version'] == self._version + 1:
+            self._version = doc['version']
+
+    def _file_version(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_file(self) -> dict:
+        try:
+            with open(self.path) as f:
+                raw = json.load(f).get('posts', {})
+        except (FileNotFoundError, ValueError):
+            return {}
+        posts = {}
+        for slug, value in raw.items():
+            if isinstance(value, str):  # written before year sharding
+                value = (value, _year(None, value))
+            posts[slug] = tuple(value)
+        return posts
+
+    def _write_file(self, posts: dict) -> int:
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'posts': posts}, f)
+        os.replace(tmp, self.path)
+        return os.stat(self.path).st_mtime_ns
+
+    def _locked(self, update) -> tuple:
+        """Run `update(posts) -> posts` on the file's current contents under
+        an exclusive lock. Returns (posts written, whether the file had
+        changed since this worker last read it)."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(f'{self.path}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stale = self._file_version() != self._version
+            posts = update(self._read_file() if stale else dict(self.posts))
+            self._version = self._write_file(posts)
+        return posts, stale
+
+    async def _persist_one(self, slug: str, entry: Optional[tuple]) -> None:
+        try:
+            if self.db is None:
+                def update(posts: dict) -> dict:
+                    if entry is None:
+                        posts.pop(slug, None)
+                    else:
+                        posts[slug] = entry
+                    return posts
+                posts, stale = await asyncio.to_thread(self._locked, update)
+                if stale:  # another worker wrote since we last read
+                    self._replace_all(posts)
+                    self.reloads += 1
+                return
+            if entry is None:
+                await self.db.sitemap_posts.delete_one({'_id': slug})
+            else:
+                await self.db.sitemap_posts.update_one(
+                    {'_id': slug}, {'$set': {'lastmod': entry[0], 'year': entry[1]}}, upsert=True)
+            await self._bump_version()
+        except Exception as e:
+            logger.warning(f'sitemap persist failed for {slug} (non-fatal): {e!r}')
+
+    async def _persist_all(self) -> None:
+        try:
+            if self.db is None:
+                posts = dict(self.posts)
+                await asyncio.to_thread(self._locked, lambda _: posts)
+                return
+            from pymongo import UpdateOne
+            slugs = list(self.posts)
+            if slugs:
+                await self.db.sitemap_posts.bulk_write(
+                    [UpdateOne({'_id': s}, {'$set': {'lastmod': m, 'year': y}}, upsert=True)
+                     for s, (m, y) in self.posts.items()],
+                    ordered=False,
+                )
+            await self.db.sitemap_posts.delete_many({'_id': {'$nin': slugs}})
+            await self._bump_version()
+        except Exception as e:
+            logger.warning(f'sitemap persist failed (non-fatal): {e!r}')
+
+    # ── building ──
+    async def _fetch_all(self) -> dict:
+        posts = {}
+        client = ghost_client.get_client()
+        page = 1
+        while page:
+            r = await client.get(
+                f'{GHOST_URL}/ghost/api/content/posts/',
+                params={
+                    'key': GHOST_CONTENT_API_KEY,
+                    'limit': 100,
+                    'page': page,
+                    'fields': 'slug,updated_at,published_at',
+                    'filter': 'status:published+visibility:[public,paid,members]',
+                },
+            )
+            if r.status_code != 200:
+                raise RuntimeError(f'Ghost posts HTTP {r.status_code} on page {page}')
+            data = r.json()
+            for p in data.get('posts', []):
+                if p.get('slug'):
+                    lastmod = p.get('updated_at') or p.get('published_at') or ''
+                    posts[p['slug']] = (lastmod, _year(p.get('published_at'), lastmod))
+            page = ((data.get('meta') or {}).get('pagination') or {}).get('next')
+        return posts
+
+    async def rebuild(self) -> int:
+        """Replace the store with a full walk of Ghost. Returns post count."""
+        async with self._rebuild_lock:
+            self._rebuilding = {}
+            try:
+                posts = await self._fetch_all()
+                # Webhooks that landed while we were paging are newer than
+                # what Ghost returned for those slugs.
+                for slug, entry in self._rebuilding.items():
+                    if entry is None:
+                        posts.pop(slug, None)
+                    else:
+                        posts[slug] = entry
+            finally:
+                self._rebuilding = None
+            self._replace_all(posts)
+            self.loaded = True
+            self.rebuilds += 1
+            await self._persist_all()
+            logger.info(f'sitemap rebuilt: {len(posts)} posts in {len(self.shards)} shards')
+            return len(posts)
+
+    async def ensure_loaded(self) -> None:
+        """Load the persisted store, or build it from Ghost if there is none;
+        once loaded, pick up other workers' changes. Concurrent callers
+        share the one load."""
+        if self.loaded:
+            await self._refresh()
+            return
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self._load_or_build())
+        await asyncio.shield(self._load_task)
+
+    async def _load_or_build(self) -> None:
+        try:
+            posts = await self._load()
+        except Exception as e:
+            logger.warning(f'sitemap load failed: {e!r}')
+            posts = {}
+        if posts:
+            self._replace_all(posts)
+            self.loaded = True
+            return
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.error(f'sitemap ghost fetch failed: {e}')
+            self._load_task = None  # let the next request try again
+
+    async def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < SITEMAP_REFRESH_SECONDS or self._rebuild_lock.locked():
+            return
+        self._checked_at = now
+        updates = self.updates
+        try:
+            if await self._store_version() == self._version:
+                return
+            posts = await self._load()
+        except Exception as e:
+            logger.warning(f'sitemap refresh failed (serving cached copy): {e!r}')
+            return
+        if self.updates != updates:
+            # A webhook landed mid-read; the snapshot may predate it. Keep
+            # memory and re-read on the next check.
+            self._version = None
+            return
+        if posts:
+            self._replace_all(posts)
+            self.reloads += 1
+
+    # ── incremental updates (Ghost webhooks) ──
+    async def upsert(self, slug: str, lastmod: Optional[str], published_at: Optional[str] = None) -> None:
+        lastmod = lastmod or ''
+        entry = (lastmod, _year(published_at, lastmod))
+        if self._rebuilding is not None:
+            self._rebuilding[slug] = entry
+        if self.posts.get(slug) == entry:
+            return
+        self._set(slug, entry)
+        self.updates += 1
+        await self._persist_one(slug, entry)
+
+    async def remove(self, slug: str) -> None:
+        if self._rebuilding is not None:
+            self._rebuilding[slug] = None
+        if slug not in self.posts:
+            return
+        self._drop(slug)
+        self.updates += 1
+        await self._persist_one(slug, None)
+
+    # ── serving ──
+    def _lines(self, name: str) -> Optional[Iterable[str]]:
+        if name == INDEX:
+            return self._index_lines()
+        if name == FLAT:
+            return self._urlset(_STATIC_LINES, self._post_lines(sorted(self.posts)))
+        if name == PAGES:
+            return self._urlset(_STATIC_LINES)
+        if name.startswith('posts-') and name[6:] in self.shards:
+            return self._urlset(self._post_lines(sorted(self.shards[name[6:]])))
+        return None
+
+    def _urlset(self, *groups: Iterable[str]) -> Iterable[str]:
+        yield _XML_DECL
+        yield _URLSET_OPEN
+        for group in groups:
+            yield from group
+        yield '</urlset>'
+
+    def _post_lines(self, slugs: Iterable[str]) -> Iterable[str]:
+        for slug in slugs:
+            yield url_line(slug, self.posts[slug][0])
+
+    def _index_lines(self) -> Iterable[str]:
+        yield _XML_DECL
+        yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        yield f'<sitemap><loc>{SITE}/sitemap-{PAGES}.xml</loc></sitemap>'
+        for year in sorted(self.shards, reverse=True):
+            lastmod = max((self.posts[s][0] for s in self.shards[year]), default='')
+            lastmod_tag = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+            yield f'<sitemap><loc>{SITE}/sitemap-posts-{year}.xml</loc>{lastmod_tag}</sitemap>'
+        yield '</sitemapindex>'
+
+    def document(self, name: str) -> Optional[tuple]:
+        """(gzip bytes, ETag) for INDEX, FLAT, PAGES or 'posts-YYYY'; None
+        for a shard that does not exist. Encoded at most once per change."""
+        cached = self._encoded.get(name)
+        if cached is not None:
+            return cached
+        lines = self._lines(name)
+        if lines is None:
+            return None
+        self._encoded[name] = _encode(lines)
+        self.encodes += 1
+        return self._encoded[name]
+
+    def stats(self) -> dict:
+        return {
+            'posts': len(self.posts),
+            'shards': len(self.shards),
+            'loaded': self.loaded,
+            'backend': 'mongo' if self.db is not None else 'file',
+            'rebuilds': self.rebuilds,
+            'updates': self.updates,
+            'reloads': self.reloads,
+            'encodes': self.encodes,
+            'encoded_bytes': sum(len(gz) for gz, _ in self._encoded.values()),
+        }
+
+
+store = SitemapStore(SITEMAP_STORE_PATH)
+_resync_task: Optional[asyncio.Task] = None
+
+
+def init(db_handle) -> None:
+    store.db = db_handle
+
+
+async def _fetch_listed(slug: str) -> Optional[dict]:
+    """The post as the Content API serves it, or None if it is not published
+    (404). Raises on any other answer, so a Ghost outage changes nothing."""
+    r = await ghost_client.get_client().get(
+        f'{GHOST_URL}/ghost/api/content/posts/slug/{slug}/',
+        params={'key': GHOST_CONTENT_API_KEY, 'fields': 'slug,updated_at,published_at,visibility'},
+    )
+    if r.status_code == 404:
+        return None
+    if r.status_code != 200:
+        raise RuntimeError(f'Ghost post HTTP {r.status_code} for {slug}')
+    posts = r.json().get('posts') or []
+    return posts[0] if posts else None
+
+
+async def apply_post_event(event: str, current: dict, previous: dict) -> None:
+    """Reflect one Ghost post webhook in the sitemap. The payload only says
+    which slugs to look at; each is re-read from Ghost and listed or
+    dropped according to what Ghost returns."""
+    for slug in {current.get('slug'), previous.get('slug')} - {None, ''}:
+        try:
+            post = await _fetch_listed(slug)
+        except Exception as e:
+            # Left as is; the periodic resync catches up.
+            logger.warning(f'sitemap {event} for {slug} skipped: {e!r}')
+            continue
+        if post is not None and post.get('slug') == slug \
+                and post.get('visibility', 'public') in LISTED_VISIBILITIES:
+            lastmod = post.get('updated_at') or post.get('published_at')
+            await store.upsert(slug, lastmod, post.get('published_at'))
+        else:
+            await store.remove(slug)
+
+
+async def _resync_loop() -> None:
+    while True:
+        await asyncio.sleep(SITEMAP_RESYNC_SECONDS)
+        try:
+            await store.rebuild()
+        except Exception as e:
+            logger.error(f'sitemap resync failed: {e!r}')
+
+
+async def startup() -> None:
+    """Load (or build) in the background so boot is not held up by Ghost."""
+    global _resync_task
+    asyncio.ensure_future(store.ensure_loaded())
+    if SITEMAP_RESYNC_SECONDS > 0:
+        _resync_task = asyncio.ensure_future(_resync_loop())
+
+
+async def shutdown() -> None:
+    global _resync_task
+    if _resync_task is not None:
+        _resync_task.cancel()
+        _resync_task = None
@@ -0,0 +1,134 @@
+"""
+substack_feed.py — in-memory, stale-while-revalidate cache of The Left Field
+Substack feed behind /api/substack/feed.
+
+`articles()` always answers from memory. Once the copy is older than
+SUBSTACK_FEED_REFRESH_SECONDS, the request that notices schedules one
+background refresh and is still answered with the stale copy. Refreshes are
+conditional (If-None-Match / If-Modified-Since), so an unchanged feed costs
+Substack a 304, and feedparser runs in a worker thread. Only the very first
+request after boot, before the startup warm-up lands, waits for Substack.
+A failed refresh keeps serving the last good copy.
+
+Configuration (all optional):
+  - SUBSTACK_FEED_URL              feed to mirror
+  - SUBSTACK_FEED_REFRESH_SECONDS  age before a background refresh (default 300)
+"""
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+SUBSTACK_FEED_URL = os.environ.get('SUBSTACK_FEED_URL', 'https://theleftfield.substack.com/feed')
+SUBSTACK_FEED_REFRESH_SECONDS = float(os.environ.get('SUBSTACK_FEED_REFRESH_SECONDS', '300'))
+MAX_ARTICLES = 15
+
+# ─── Module state ────────────────────────────────────────────────────────────
+_client: Optional[httpx.AsyncClient] = None
+_articles: Optional[list] = None
+_etag: Optional[str] = None
+_last_modified: Optional[str] = None
+_checked_at = 0.0
+_refresh_task: Optional[asyncio.Future] = None
+stats_counters = {'served': 0, 'refreshes': 0, 'not_modified': 0, 'errors': 0}
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=10.0, follow_redirects=True)
+    return _client
+
+
+def _parse(content: bytes) -> list:
+    """feedparser + mapping to the shape the frontend expects. Blocking."""
+    import feedparser
+    feed = feedparser.parse(content)
+
+    articles = []
+    for entry in feed.entries[:MAX_ARTICLES]:
+        articles.append({
+            "id": entry.get('id', entry.get('link', '')),
+            "title": entry.get('title', ''),
+            "subtitle": entry.get('summary', '')[:200],
+            "author": entry.get('author', 'The Left Field'),
+            "external_url": entry.get('link', ''),
+            "created_at": entry.get('published', ''),
+            "image_url": None
+        })
+    return articles
+
+
+async def _refresh() -> None:
+    global _articles, _etag, _last_modified, _checked_at
+    headers = {}
+    if _articles is not None:
+        if _etag:
+            headers['If-None-Match'] = _etag
+        if _last_modified:
+            headers['If-Modified-Since'] = _last_modified
+    try:
+        r = await _get_client().get(SUBSTACK_FEED_URL, headers=headers)
+        if r.status_code == 304:
+            stats_counters['not_modified'] += 1
+        elif r.status_code == 200:
+            _articles = await asyncio.to_thread(_parse, r.content)
+            _etag = r.headers.get('etag')
+            _last_modified = r.headers.get('last-modified')
+            stats_counters['refreshes'] += 1
+        else:
+            raise RuntimeError(f'HTTP {r.status_code}')
+    except Exception as e:
+        stats_counters['errors'] += 1
+        logger.error(f"Substack feed error: {e}")
+    # Also after a failure, so a Substack outage is retried once per
+    # interval rather than on every request.
+    _checked_at = time.monotonic()
+
+
+def _start_refresh() -> asyncio.Future:
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.ensure_future(_refresh())
+    return _refresh_task
+
+
+async def articles() -> list:
+    """The cached feed; never waits on Substack once a copy exists."""
+    stale = not _checked_at or time.monotonic() - _checked_at > SUBSTACK_FEED_REFRESH_SECONDS
+    refreshing = _refresh_task is not None and not _refresh_task.done()
+    if _articles is None and (stale or refreshing):
+        await asyncio.shield(_start_refresh())
+    elif stale:
+        _start_refresh()
+    stats_counters['served'] += 1
+    return _articles or []
+
+
+async def startup() -> None:
+    _start_refresh()  # warm in the background; boot does not wait on Substack
+
+
+async def shutdown() -> None:
+    global _client
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def stats() -> dict:
+    return {
+        **stats_counters,
+        'articles': len(_articles or []),
+        'age_seconds': round(time.monotonic() - _checked_at, 1) if _checked_at else None,
+    }
@@ -0,0 +1,176 @@
+"""caching.py primitives: eviction, expiry, coalescing and invalidation."""
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import caching  # noqa: E402
+from caching import Generations, SingleFlight, SizedLRUCache, TTLCache  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: now[0])
+    return now
+
+
+# ─── TTLCache ───────────────────────────────────────────────────────────
+class TestTTLCache:
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1  # 'b' is now the LRU entry
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert (cache.get('a'), cache.get('c')) == (1, 3)
+        assert cache.stats()['evictions'] == 1
+
+    def test_per_entry_ttl(self, clock):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set('long', 1)
+        cache.set('short', 2, ttl=5)
+        clock[0] += 10
+        assert cache.get('short') is None
+        assert cache.get('long') == 1
+        assert len(cache) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+# ─── SizedLRUCache ──────────────────────────────────────────────────────
+class TestSizedLRUCache:
+    def test_evicts_by_bytes_oldest_first(self):
+        cache = SizedLRUCache(max_bytes=100, max_entry_bytes=60)
+        cache.set('a', 'A', 40)
+        cache.set('b', 'B', 40)
+        cache.get('a')
+        cache.set('c', 'C', 40)
+        assert cache.peek('b') is None
+        assert cache.bytes == 80
+        assert cache.stats()['evictions'] == 1
+
+    def test_oversized_value_is_not_cached(self):
+        cache = SizedLRUCache(max_bytes=100)
+        cache.set('small', 's', 10)
+        assert cache.set('huge', 'h', 26) is False  # default cap is a quarter
+        assert cache.peek('huge') is None
+        assert cache.peek('small') == 's'
+
+    def test_replacing_a_key_reaccounts_its_size(self):
+        cache = SizedLRUCache(max_bytes=100)
+        cache.set('a', 'v1', 20)
+        cache.set('a', 'v2', 5)
+        assert cache.bytes == 5 and len(cache) == 1
+
+    def test_ttl_expiry(self, clock):
+        cache = SizedLRUCache(max_bytes=100, ttl=30)
+        cache.set('a', 'A', 10)
+        clock[0] += 31
+        assert cache.get('a') is None
+        assert cache.bytes == 0
+
+    def test_peek_leaves_counters_and_order(self):
+        cache = SizedLRUCache(max_bytes=100, max_entry_bytes=60)
+        cache.set('a', 'A', 40)
+        cache.set('b', 'B', 40)
+        assert cache.peek('a') == 'A'
+        cache.set('c', 'C', 40)
+        assert cache.peek('a') is None  # peek did not make 'a' recent
+        assert (cache.hits, cache.misses) == (0, 0)
+
+
+# ─── SingleFlight ───────────────────────────────────────────────────────
+class TestSingleFlight:
+    def test_concurrent_callers_share_one_call(self):
+        async def body():
+            flight = SingleFlight()
+            calls = []
+
+            async def fetch():
+                calls.append(1)
+                await asyncio.sleep(0.01)
+                return 'value'
+
+            results = await asyncio.gather(*(flight.do('k', fetch) for _ in range(5)))
+            assert results == ['value'] * 5
+            assert len(calls) == 1
+            assert flight.stats() == {'in_flight': 0, 'calls': 5, 'coalesced': 4}
+        asyncio.run(body())
+
+    def test_error_reaches_every_waiter_and_is_not_remembered(self):
+        async def body():
+            flight = SingleFlight()
+            attempts = []
+
+            async def failing():
+                attempts.append(1)
+                await asyncio.sleep(0.01)
+                raise RuntimeError('upstream down')
+
+            results = await asyncio.gather(*(flight.do('k', failing) for _ in range(3)),
+                                           return_exceptions=True)
+            assert all(isinstance(r, RuntimeError) for r in results)
+            assert len(attempts) == 1
+
+            async def ok():
+                return 'recovered'
+            assert await flight.do('k', ok) == 'recovered'
+        asyncio.run(body())
+
+    def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        async def body():
+            flight = SingleFlight()
+            gate = asyncio.Event()
+
+            async def fetch():
+                await gate.wait()
+                return 'value'
+
+            first = asyncio.ensure_future(flight.do('k', fetch))
+            second = asyncio.ensure_future(flight.do('k', fetch))
+            await asyncio.sleep(0)
+            first.cancel()
+            gate.set()
+            assert await second == 'value'
+        asyncio.run(body())
+
+    def test_forget_starts_a_fresh_call(self):
+        async def body():
+            flight = SingleFlight()
+            gate = asyncio.Event()
+            values = iter(['old', 'new'])
+
+            async def fetch():
+                value = next(values)
+                await gate.wait()
+                return value
+
+            stale = asyncio.ensure_future(flight.do('k', fetch))
+            await asyncio.sleep(0)
+            flight.forget('k')
+            fresh = asyncio.ensure_future(flight.do('k', fetch))
+            gate.set()
+            assert (await stale, await fresh) == ('old', 'new')
+        asyncio.run(body())
+
+
+# ─── Generations ────────────────────────────────────────────────────────
+class TestGenerations:
+    def test_invalidate_during_fetch_marks_it_stale(self):
+        gens = Generations()
+        g = gens.begin('k')
+        gens.invalidate('k')
+        assert gens.end('k', g) is False
+        assert gens.end('k', gens.begin('k')) is True
+        assert gens.discarded == 1
+
+    def test_idle_keys_are_not_tracked(self):
+        gens = Generations()
+        gens.invalidate('k')  # nothing in flight: a no-op
+        g1, g2 = gens.begin('k'), gens.begin('k')
+        gens.end('k', g1)
+        gens.end('k', g2)
+        assert gens._active == {}
@@ -0,0 +1,84 @@
+"""geoip.py: CSV range tables compiled to .bin and looked up in-process."""
+import os
+import sys
+import asyncio
+import ipaddress
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import geoip  # noqa: E402
+
+# DB-IP style (addresses) and IP2Location style (integers) rows, mixed with
+# IPv6, a header and rows the compiler must skip.
+CSV_ROWS = '\n'.join([
+    'ip_start,ip_end,country_code,country_name',
+    '1.0.0.0,1.0.0.255,AU,Australia',
+    '49.32.0.0,49.47.255.255,IN,India',
+    f'{int(ipaddress.ip_address("8.8.8.0"))},{int(ipaddress.ip_address("8.8.8.255"))},US,United States',
+    '2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,US,United States',
+    '2400:1a00::,2400:1a00:ffff:ffff:ffff:ffff:ffff:ffff,NP,',
+    '5.5.5.0,5.5.5.255,-,Unknown',
+    'garbage',
+]) + '\n'
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'ranges.csv'
+    path.write_text(CSV_ROWS)
+    return str(path)
+
+
+class TestRangeTable:
+    def test_compile_and_lookup_round_trip(self, csv_path, tmp_path):
+        bin_path = str(tmp_path / 'ranges.bin')
+        assert geoip.compile_csv(csv_path, bin_path) == (3, 2)
+        table = geoip.RangeTable(bin_path)
+        try:
+            def code(ip):
+                hit = table.lookup(ipaddress.ip_address(ip))
+                return hit and hit['country_code']
+            assert code('49.36.1.2') == 'IN'
+            assert code('1.0.0.0') == 'AU' and code('1.0.0.255') == 'AU'
+            assert code('8.8.8.8') == 'US'
+            assert code('2001:4860:4860::8888') == 'US'
+            assert code('2400:1a00::1') == 'NP'
+            assert code('1.0.1.0') is None   # gap between ranges
+            assert code('5.5.5.5') is None   # '-' rows are dropped
+            assert table.lookup(ipaddress.ip_address('49.36.1.2'))['country'] == 'India'
+            assert table.lookup(ipaddress.ip_address('2400:1a00::1'))['country'] == 'NP'
+        finally:
+            table.close()
+
+    def test_rejects_foreign_files(self, tmp_path):
+        path = tmp_path / 'bogus.bin'
+        path.write_bytes(b'\0' * 64)
+        with pytest.raises(ValueError):
+            geoip.RangeTable(str(path))
+
+
+class TestModuleLookup:
+    def test_reload_compiles_csv_and_serves_lookups(self, csv_path, monkeypatch):
+        monkeypatch.setattr(geoip, '_reader', None)  # restored afterwards
+
+        async def body():
+            assert (await geoip.reload(csv_path))['loaded'] is True
+            assert os.path.exists(f'{csv_path}.bin')
+            assert geoip.lookup('49.36.1.2')['country_code'] == 'IN'
+            assert geoip.lookup('::ffff:49.36.1.2')['country_code'] == 'IN'
+            assert geoip.lookup('10.0.0.1') is None      # private
+            assert geoip.lookup('not-an-ip') is None
+
+            # A newer CSV is recompiled on reload; a broken path keeps the
+            # current table serving.
+            with open(csv_path, 'a') as f:
+                f.write('10.10.0.0,10.10.255.255,ZZ,Nowhere\n')
+                f.write('9.9.9.0,9.9.9.255,CH,Switzerland\n')
+            os.utime(csv_path, (os.path.getmtime(f'{csv_path}.bin') + 5,) * 2)
+            await geoip.reload(csv_path)
+            assert geoip.lookup('9.9.9.9')['country_code'] == 'CH'
+            result = await geoip.reload(csv_path + '.missing')
+            assert result['loaded'] is True and 'error' in result
+            assert geoip.lookup('9.9.9.9')['country_code'] == 'CH'
+        asyncio.run(body())
@@ -0,0 +1,145 @@
+"""ghost_client: shared-client cookie isolation and cache invalidation races.
+
+Runs in-process: Ghost is replaced by an httpx.MockTransport on the shared
+client, and server.py is driven through FastAPI's TestClient.
+"""
+import os
+import sys
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('JWT_SECRET', 'test-secret')
+import ghost_client  # noqa: E402
+import server  # noqa: E402
+
+
+def _install_ghost(handler):
+    client = ghost_client._build_client()
+    client._transport = httpx.MockTransport(handler)
+    ghost_client._client = client
+    return client
+
+
+# ─── /api/ghost/member cookie isolation ─────────────────────────────────
+class TestMemberProxyCookies:
+    def test_cookieless_call_sends_no_cookie(self):
+        upstream_cookies = []
+
+        def ghost(request):
+            upstream_cookies.append(request.headers.get('cookie'))
+            cookie = request.headers.get('cookie') or ''
+            if 'ghost-members-ssr=reader-a' in cookie:
+                return httpx.Response(
+                    200, json={'email': 'a@example.com'},
+                    headers={'set-cookie': 'ghost-members-ssr=reader-a; Path=/; HttpOnly'},
+                )
+            return httpx.Response(401, json={})
+
+        _install_ghost(ghost)
+        api = TestClient(server.app)
+        r = api.get('/api/ghost/member', headers={'Cookie': 'ghost-members-ssr=reader-a'})
+        assert r.json() == {'email': 'a@example.com'}
+
+        api.cookies.clear()
+        r = api.get('/api/ghost/member')
+        assert r.json() is None
+        assert upstream_cookies[-1] is None
+        assert len(ghost_client.get_client().cookies.jar) == 0
+
+
+# ─── invalidation during an in-flight fetch ─────────────────────────────
+def _gated_ghost(responses, gate):
+    """Ghost stand-in that answers from `responses` (popped in order) once
+    `gate` is set, so a test can act while a call is in flight."""
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await gate.wait()
+        return responses.pop(0)
+
+    return handler, calls
+
+
+class TestMemberInvalidationRace:
+    def test_invalidate_during_fetch_is_not_undone(self, monkeypatch):
+        monkeypatch.setattr(ghost_client, 'admin_token', lambda: 'token')
+
+        async def body():
+            ghost_client.member_cache.clear()
+            gate = asyncio.Event()
+            free = httpx.Response(200, json={'members': [{'email': 'r@example.com', 'status': 'free'}]})
+            paid = httpx.Response(200, json={'members': [{'email': 'r@example.com', 'status': 'paid'}]})
+            handler, calls = _gated_ghost([free, paid], gate)
+            _install_ghost(handler)
+
+            stale = asyncio.ensure_future(ghost_client.fetch_member('r@example.com'))
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            ghost_client.invalidate_member('r@example.com')  # payment recorded mid-fetch
+            gate.set()
+            assert (await stale)['status'] == 'free'
+            assert (await ghost_client.fetch_member('r@example.com'))['status'] == 'paid'
+            assert len(calls) == 2
+        asyncio.run(body())
+
+
+class TestPostInvalidationRace:
+    def test_webhook_during_fetch_is_not_undone(self, monkeypatch):
+        monkeypatch.setattr(ghost_client, 'admin_token', lambda: 'token')
+
+        async def body():
+            ghost_client.post_cache.clear()
+            gate = asyncio.Event()
+            v1 = httpx.Response(200, json={'posts': [{'slug': 's', 'updated_at': 'v1', 'html': 'old'}]})
+            v2 = httpx.Response(200, json={'posts': [{'slug': 's', 'updated_at': 'v2', 'html': 'new'}]})
+            handler, calls = _gated_ghost([v1, v2], gate)
+            _install_ghost(handler)
+
+            stale = asyncio.ensure_future(ghost_client.fetch_post('s'))
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            ghost_client.invalidate_post('s', updated_at='v2')  # post.edited mid-fetch
+            gate.set()
+            assert (await stale)['html'] == 'old'
+            assert (await ghost_client.fetch_post('s'))['html'] == 'new'
+            assert len(calls) == 2
+        asyncio.run(body())
+
+    def test_invalidate_does_not_touch_lru_counters(self):
+        ghost_client.post_cache.clear()
+        ghost_client.post_cache.set('s', {'updated_at': 'v1'}, 10)
+        before = ghost_client.post_cache.stats()
+        ghost_client.invalidate_post('s', updated_at='v1')
+        assert ghost_client.post_cache.stats() == before
+        ghost_client.invalidate_post('s', updated_at='v2')
+        assert ghost_client.post_cache.peek('s') is None
+
+
+# ─── /api/ghost/article-content overlap ─────────────────────────────────
+class TestArticleContentConcurrency:
+    def test_member_check_and_article_fetch_overlap(self, monkeypatch):
+        monkeypatch.setattr(server, 'GHOST_ADMIN_API_KEY', 'id:' + '00' * 32)
+        monkeypatch.setattr(server, 'create_ghost_admin_token', lambda: 'token')
+        monkeypatch.setattr(ghost_client, 'admin_token', lambda: 'token')
+        ghost_client.member_cache.clear()
+        ghost_client.post_cache.clear()
+        events = {}
+
+        async def ghost(request):
+            post_seen = events.setdefault('post', asyncio.Event())
+            if '/members/' in request.url.path:
+                # Only answers once the article request is already out.
+                await asyncio.wait_for(post_seen.wait(), timeout=2)
+                return httpx.Response(200, json={'members': [{'email': 'p@example.com', 'status': 'paid'}]})
+            post_seen.set()
+            return httpx.Response(200, json={'posts': [{'slug': 'overlap', 'html': '<p>x</p>', 'title': 'T'}]})
+
+        _install_ghost(ghost)
+        r = TestClient(server.app).post('/api/ghost/article-content',
+                                        json={'slug': 'overlap', 'email': 'p@example.com'})
+        assert r.status_code == 200 and r.json()['html'] == '<p>x</p>'
+        assert 'member;dur=' in r.headers['server-timing'] and 'article;dur=' in r.headers['server-timing']
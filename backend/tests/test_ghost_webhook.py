@@ -0,0 +1,70 @@
+"""/api/ghost/webhook/{event}: signature, replay window and cache fan-out.
+
+Runs in-process through FastAPI's TestClient; the Content API lookups the
+sitemap makes are answered by an httpx.MockTransport.
+"""
+import os
+import sys
+import json
+import hmac
+import time
+import hashlib
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('JWT_SECRET', 'test-secret')
+import ghost_client  # noqa: E402
+import server  # noqa: E402
+
+SECRET = 'webhook-test-secret'
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(server, 'GHOST_WEBHOOK_SECRET', SECRET)
+    client = ghost_client._build_client()
+    client._transport = httpx.MockTransport(lambda request: httpx.Response(404, json={}))
+    monkeypatch.setattr(ghost_client, '_client', client)
+    return TestClient(server.app)
+
+
+def _signed(payload, ts_ms=None, secret=SECRET):
+    body = json.dumps(payload).encode('utf-8')
+    ts = str(int(time.time() * 1000) if ts_ms is None else ts_ms)
+    signature = hmac.new(secret.encode('utf-8'), body + ts.encode('utf-8'), hashlib.sha256).hexdigest()
+    return body, {'X-Ghost-Signature': f'sha256={signature}, t={ts}',
+                  'Content-Type': 'application/json'}
+
+
+def _edit(slug):
+    return {'post': {'current': {'slug': slug, 'updated_at': 'v2'}, 'previous': {}}}
+
+
+class TestGhostWebhook:
+    def test_signed_delivery_invalidates(self, api):
+        server.og_meta_cache.set('wh-post', (b'<html>', '"e"'))
+        body, headers = _signed(_edit('wh-post'))
+        r = api.post('/api/ghost/webhook/post.edited', content=body, headers=headers)
+        assert r.status_code == 200
+        assert server.og_meta_cache.get('wh-post') is None
+
+    def test_bad_signature_refused(self, api):
+        server.og_meta_cache.set('wh-post', (b'<html>', '"e"'))
+        body, headers = _signed(_edit('wh-post'), secret='wrong')
+        r = api.post('/api/ghost/webhook/post.edited', content=body, headers=headers)
+        assert r.status_code == 401
+        assert server.og_meta_cache.get('wh-post') is not None
+
+    @pytest.mark.parametrize('skew', [-3600, 3600])
+    def test_stale_or_future_timestamp_refused(self, api, skew):
+        body, headers = _signed(_edit('wh-post'), ts_ms=int((time.time() + skew) * 1000))
+        r = api.post('/api/ghost/webhook/post.edited', content=body, headers=headers)
+        assert r.status_code == 401
+
+    def test_refused_without_a_secret(self, api, monkeypatch):
+        monkeypatch.setattr(server, 'GHOST_WEBHOOK_SECRET', '')
+        r = api.post('/api/ghost/webhook/post.edited', json=_edit('wh-post'))
+        assert r.status_code == 401
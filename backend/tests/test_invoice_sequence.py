@@ -0,0 +1,281 @@
+"""invoice_sequence.py: FY invoice serials against a stand-in Mongo.
+
+Ghost's members endpoint is an httpx.MockTransport that honours the
+created_at filter, ordering and pagination; the two collections are small
+in-memory stand-ins that enforce the same unique keys as Mongo (`_id`, and
+`(fy, seq)` on entries), so duplicate-key handling is exercised for real.
+"""
+import os
+import re
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('JWT_SECRET', 'test-secret')
+import ghost_client  # noqa: E402
+import invoice_sequence  # noqa: E402
+
+FY_START = datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+
+# ─── Stand-ins ──────────────────────────────────────────────────────────
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, unique=()):
+        self.docs = {}
+        self.unique = unique  # extra unique compound key, e.g. ('fy', 'seq')
+
+    def _matches(self, doc, query):
+        for key, cond in query.items():
+            if isinstance(cond, dict) and '$in' in cond:
+                if doc.get(key) not in cond['$in']:
+                    return False
+            elif doc.get(key) != cond:
+                return False
+        return True
+
+    async def create_index(self, *args, **kwargs):
+        return 'ok'
+
+    async def find_one(self, query, projection=None, sort=None):
+        docs = [d for d in self.docs.values() if self._matches(d, query)]
+        if sort:
+            field, direction = sort[0]
+            docs.sort(key=lambda d: d[field], reverse=direction < 0)
+        return dict(docs[0]) if docs else None
+
+    def find(self, query, projection=None):
+        return _Cursor([dict(d) for d in self.docs.values() if self._matches(d, query)])
+
+    async def insert_one(self, doc):
+        if doc['_id'] in self.docs:
+            raise DuplicateKeyError('E11000 duplicate key error index: _id_', 11000,
+                                    {'keyPattern': {'_id': 1}})
+        if self.unique and any(all(d.get(k) == doc.get(k) for k in self.unique)
+                               for d in self.docs.values()):
+            raise DuplicateKeyError('E11000 duplicate key error index: fy_1_seq_1', 11000,
+                                    {'keyPattern': {k: 1 for k in self.unique}})
+        self.docs[doc['_id']] = dict(doc)
+
+    async def insert_many(self, docs, ordered=True):
+        errors = []
+        for doc in docs:
+            try:
+                await self.insert_one(doc)
+            except DuplicateKeyError as e:
+                errors.append(e.details)
+        if errors:
+            raise BulkWriteError({'writeErrors': errors})
+
+    def _apply(self, doc, update):
+        for key, value in update.get('$inc', {}).items():
+            doc[key] = doc.get(key, 0) + value
+        for key, value in update.get('$max', {}).items():
+            if key not in doc or value > doc[key]:
+                doc[key] = value
+        for key, value in update.get('$set', {}).items():
+            doc[key] = value
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query['_id'])
+        if doc is None:
+            if not upsert:
+                return
+            doc = self.docs[query['_id']] = {'_id': query['_id'], **update.get('$setOnInsert', {})}
+        self._apply(doc, update)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        await self.update_one(query, update, upsert=upsert)
+        return dict(self.docs[query['_id']])
+
+
+class FakeGhost:
+    """Members with created_at, answering the label/created_at filter."""
+
+    def __init__(self):
+        self.members = []
+        self.requests = 0
+
+    def add(self, member_id, created_at):
+        self.members.append({'id': member_id, 'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%S.000Z')})
+
+    def __call__(self, request):
+        self.requests += 1
+        bounds = dict(re.findall(r"created_at:(>=|<)'([^']+)'", request.url.params['filter']))
+        lo = datetime.strptime(bounds['>='], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        hi = datetime.strptime(bounds['<'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        rows = sorted((m for m in self.members
+                       if lo <= invoice_sequence._parse_created(m['created_at']) < hi),
+                      key=lambda m: m['created_at'])
+        limit, page = int(request.url.params['limit']), int(request.url.params['page'])
+        pages = max(1, -(-len(rows) // limit))
+        return httpx.Response(200, json={
+            'members': rows[(page - 1) * limit:page * limit],
+            'meta': {'pagination': {'page': page, 'pages': pages}},
+        })
+
+
+@pytest.fixture
+def ghost(monkeypatch):
+    fake = FakeGhost()
+    client = ghost_client._build_client()
+    client._transport = httpx.MockTransport(fake)
+    monkeypatch.setattr(ghost_client, '_client', client)
+    monkeypatch.setattr(ghost_client, 'GHOST_ADMIN_API_KEY', 'id:secret')
+    monkeypatch.setattr(ghost_client, 'admin_token', lambda: 'token')
+    return fake
+
+
+@pytest.fixture
+def db(monkeypatch):
+    handle = {
+        invoice_sequence.ENTRIES_COLLECTION: FakeCollection(unique=('fy', 'seq')),
+        invoice_sequence.FY_COLLECTION: FakeCollection(),
+    }
+    monkeypatch.setattr(invoice_sequence, '_db', handle)
+    monkeypatch.setattr(invoice_sequence, '_fy_locks', {})
+    monkeypatch.setattr(invoice_sequence, 'stats_counters', dict(invoice_sequence.stats_counters))
+    return handle
+
+
+def _at(days, hours=0):
+    return FY_START + timedelta(days=days, hours=hours)
+
+
+def _seq(member_id, created_at, labelled=True):
+    return asyncio.run(invoice_sequence.seq_for_member(member_id, created_at, labelled))
+
+
+# ─── Tests ──────────────────────────────────────────────────────────────
+class TestBackfill:
+    def test_matches_the_old_full_scan(self, ghost, db, monkeypatch):
+        # 150 members spans two Ghost pages; some share a day.
+        members = [(f'm{i:03d}', _at(i // 2, hours=i % 2)) for i in range(150)]
+        for member_id, created in members:
+            ghost.add(member_id, created)
+
+        monkeypatch.setattr(invoice_sequence, '_db', None)
+        old = {m: asyncio.run(invoice_sequence._scan_position(m, c)) for m, c in members[::7]}
+        monkeypatch.setattr(invoice_sequence, '_db', db)
+
+        new = {m: _seq(m, c) for m, c in members[::7]}
+        assert new == old
+        assert old['m000'] == 1 and old['m147'] == 148
+        assert invoice_sequence.stats_counters['backfills'] == 1
+        state = asyncio.run(db[invoice_sequence.FY_COLLECTION].find_one({'_id': '2025-26'}))
+        assert state['last_seq'] == 150
+
+    def test_last_seq_follows_stored_rows(self, ghost, db):
+        # A row beyond what Ghost lists (appended by another worker) must
+        # not be reissued after the backfill.
+        asyncio.run(db[invoice_sequence.ENTRIES_COLLECTION].insert_one(
+            {'_id': '2025-26:late', 'fy': '2025-26', 'member_id': 'late', 'seq': 3}))
+        ghost.add('a', _at(1))
+        ghost.add('b', _at(2))
+        assert _seq('a', _at(1)) == 1
+        assert _seq('c', _at(3)) == 4
+
+
+class TestCatchUp:
+    def test_missed_payments_are_appended_in_order(self, ghost, db):
+        for i in range(3):
+            ghost.add(f'm{i}', _at(i))
+        assert _seq('m2', _at(2)) == 3
+
+        # Two payments whose webhooks/invoices never came through.
+        ghost.add('m3', _at(10))
+        ghost.add('m4', _at(11))
+        assert _seq('m4', _at(11)) == 5
+        assert _seq('m3', _at(10)) == 4
+        assert invoice_sequence.stats_counters['catch_ups'] == 1
+        assert invoice_sequence.stats_counters['hits'] == 1
+
+    def test_late_label_gets_next_serial_without_renumbering(self, ghost, db):
+        ghost.add('m0', _at(0))
+        ghost.add('m1', _at(5))
+        assert _seq('m1', _at(5)) == 2
+        ghost.add('early', _at(2))  # labelled now, created before m1
+        assert _seq('early', _at(2)) == 3
+        assert _seq('m1', _at(5)) == 2
+
+
+class TestFiscalYearBoundary:
+    def test_serials_restart_each_fiscal_year(self, ghost, db):
+        march = datetime(2026, 3, 31, 23, 59, tzinfo=timezone.utc)
+        april = datetime(2026, 4, 1, 0, 0, tzinfo=timezone.utc)
+        ghost.add('m0', _at(0))
+        ghost.add('march', march)
+        ghost.add('april', april)
+        ghost.add('april2', april + timedelta(hours=1))
+        assert _seq('march', march) == 2
+        assert _seq('april', april) == 1
+        assert _seq('april2', april + timedelta(hours=1)) == 2
+        late = datetime(2026, 4, 2, tzinfo=timezone.utc)
+        assert _seq('new-fy', late) == 3  # appended in 2026-27, not 2025-26
+        fy_docs = db[invoice_sequence.FY_COLLECTION].docs
+        assert fy_docs['2025-26']['last_seq'] == 2
+        assert fy_docs['2026-27']['last_seq'] == 3
+
+
+class TestDuplicateKeys:
+    @pytest.mark.parametrize('details, on_id', [
+        ({'keyPattern': {'_id': 1}}, True),
+        ({'keyPattern': {'fy': 1, 'seq': 1}}, False),
+        ({'errmsg': 'E11000 duplicate key error collection: x index: _id_ dup key'}, True),
+        ({'errmsg': 'E11000 duplicate key error collection: x index: fy_1_seq_1 dup key'}, False),
+    ])
+    def test_clashed_on_id(self, details, on_id):
+        assert invoice_sequence._clashed_on_id(DuplicateKeyError('E11000', 11000, details)) is on_id
+
+    def test_seq_clash_catches_counter_up(self, db):
+        entries = db[invoice_sequence.ENTRIES_COLLECTION]
+        for i in (1, 2, 3):
+            asyncio.run(entries.insert_one(
+                {'_id': f'2025-26:m{i}', 'fy': '2025-26', 'member_id': f'm{i}', 'seq': i}))
+        db[invoice_sequence.FY_COLLECTION].docs['2025-26'] = {'_id': '2025-26', 'last_seq': 1}
+
+        assert asyncio.run(invoice_sequence._append('2025-26', 'new', _at(9))) == 4
+        assert invoice_sequence.stats_counters['seq_conflicts'] == 1
+        assert asyncio.run(invoice_sequence._append('2025-26', 'new2', _at(9))) == 5
+
+    def test_id_clash_returns_existing_serial(self, db):
+        asyncio.run(db[invoice_sequence.ENTRIES_COLLECTION].insert_one(
+            {'_id': '2025-26:m1', 'fy': '2025-26', 'member_id': 'm1', 'seq': 1}))
+        db[invoice_sequence.FY_COLLECTION].docs['2025-26'] = {'_id': '2025-26', 'last_seq': 1}
+        assert asyncio.run(invoice_sequence._append('2025-26', 'm1', _at(0))) == 1
+
+
+class TestLabelledCallers:
+    def test_labelled_and_unlabelled_lookups_agree(self, ghost, db):
+        ghost.add('m0', _at(0))
+        ghost.add('m1', _at(1))
+        assert _seq('m1', _at(1), labelled=False) == 2
+        assert _seq('m1', _at(1), labelled=True) == 2
+
+        ghost.add('m2', _at(2))
+        assert _seq('m2', _at(2), labelled=True) == 3
+        assert _seq('m2', _at(2), labelled=False) == 3
+
+    def test_unlabelled_unknown_member_does_not_consume_a_serial(self, ghost, db):
+        ghost.add('m0', _at(0))
+        assert _seq('stranger', _at(3), labelled=False) == 0
+        ghost.add('m1', _at(4))
+        assert _seq('m1', _at(4)) == 2
@@ -0,0 +1,91 @@
+"""og_card._load_background: draft decode, cover crop and the saved crop."""
+import os
+import sys
+
+import pytest
+from PIL import Image, JpegImagePlugin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('JWT_SECRET', 'test-secret')
+import og_card  # noqa: E402
+
+
+@pytest.fixture
+def drafts(monkeypatch):
+    """Record (requested size, decoded size) for every draft() call."""
+    calls = []
+    original = JpegImagePlugin.JpegImageFile.draft
+
+    def spy(self, mode, size):
+        result = original(self, mode, size)
+        calls.append((size, self.size))
+        return result
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, 'draft', spy)
+    return calls
+
+
+def _jpeg(path, size):
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    img.save(path, format='JPEG', quality=85)
+    return str(path)
+
+
+class TestLoadBackground:
+    def test_large_jpeg_is_draft_decoded_and_cropped(self, tmp_path, drafts):
+        source = _jpeg(tmp_path / 'wide.orig', (5000, 2000))
+        bg = og_card._load_background(source)
+        assert bg.size == (og_card.WIDTH, og_card.HEIGHT) and bg.mode == 'RGB'
+
+        # Cover scale is 630/2000, so at least 1576×631 is needed; libjpeg
+        # can go to 1/2 (2500×1000) but not 1/4 (1250×500).
+        [(requested, decoded)] = drafts
+        assert requested == (1576, 631)
+        assert decoded == (2500, 1000)
+
+    def test_crop_is_saved_and_reused(self, tmp_path, drafts):
+        source = _jpeg(tmp_path / 'post.orig', (3000, 3000))
+        first = og_card._load_background(source)
+        crop_path = og_card.derivative_path(source)
+        assert os.path.exists(crop_path)
+        with Image.open(crop_path) as crop:
+            assert crop.size == (og_card.WIDTH, og_card.HEIGHT)
+
+        os.remove(source)  # a second render must not need the original
+        second = og_card._load_background(source)
+        assert second.size == first.size
+        assert len(drafts) == 1
+
+    def test_small_image_skips_draft(self, tmp_path, drafts):
+        source = _jpeg(tmp_path / 'small.orig', (800, 400))
+        bg = og_card._load_background(source)
+        assert bg.size == (og_card.WIDTH, og_card.HEIGHT)
+        assert drafts == []
+
+    def test_non_jpeg_source(self, tmp_path):
+        source = str(tmp_path / 'logo.orig')
+        Image.new('RGBA', (2400, 1260), (200, 30, 30, 128)).save(source, format='PNG')
+        bg = og_card._load_background(source)
+        assert bg.size == (og_card.WIDTH, og_card.HEIGHT) and bg.mode == 'RGB'
+
+
+class TestNegotiateFormat:
+    @pytest.mark.parametrize('accept, expected', [
+        ('image/png;q=1, image/webp;q=0.1', 'png'),
+        ('image/webp;q=0.1, image/png', 'png'),
+        ('image/png;q=0.5, image/webp', 'webp'),
+        ('image/webp;q=0, image/jpeg;q=0.4', 'jpeg'),
+        ('image/webp,image/apng,image/*,*/*;q=0.8', 'webp'),   # Chrome
+        ('image/jpeg;q=0.9, image/webp;q=0.9', 'webp'),        # tie: cheaper first
+        ('image/*', 'png'),                                     # wildcard: default only
+        ('image/webp;q=0.5, */*', 'png'),
+        ('image/webp;q=oops', 'png'),
+        (None, 'png'),
+    ])
+    def test_accept_quality_values(self, accept, expected, monkeypatch):
+        monkeypatch.setattr(og_card, 'DEFAULT_FORMAT', 'png')
+        assert og_card.negotiate_format(None, accept) == expected
+
+    def test_explicit_format_wins(self):
+        assert og_card.negotiate_format('JPG', 'image/webp') == 'jpeg'
+        assert og_card.negotiate_format('bmp', 'image/webp') == 'webp'
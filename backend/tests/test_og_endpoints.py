@@ -81,6 +81,25 @@ def test_og_meta_unknown_slug_no_redirect(session):
     assert '<meta property="og:type" content="article">' in body
 
 
+def test_og_meta_etag_revalidation(session):
+    """Repeat crawler hits carry the ETag back and must get a bodyless 304."""
+    headers = {"User-Agent": BOT_UAS["slack"]}
+    r = session.get(f"{BASE_URL}/api/og/{REAL_SLUG}", headers=headers, allow_redirects=False, timeout=20)
+    assert r.status_code == 200
+    etag = r.headers.get("etag")
+    assert etag, f"expected an ETag header. Headers: {dict(r.headers)}"
+
+    r2 = session.get(
+        f"{BASE_URL}/api/og/{REAL_SLUG}",
+        headers={**headers, "If-None-Match": etag},
+        allow_redirects=False,
+        timeout=20,
+    )
+    assert r2.status_code == 304, f"expected 304 got {r2.status_code}"
+    assert r2.content == b""
+    assert r2.headers.get("etag") == etag
+
+
 # --- /api/og-image/{slug} ---
 def test_og_image_real_slug(session):
     """Dynamic 1200x630 PNG generation must return real PNG > 50KB."""
@@ -105,13 +124,62 @@ def test_og_image_unknown_slug_graceful(session):
 
 
 # --- /api/sitemap.xml ---
+def _shard_paths(index_xml):
+    """Backend paths of the child sitemaps listed in an index."""
+    import re
+    return [f"/api/sitemap-{name}.xml" for name in re.findall(r"<loc>[^<]*/sitemap-([\w-]+)\.xml</loc>", index_xml)]
+
+
 def test_sitemap_xml(session):
     r = session.get(f"{BASE_URL}/api/sitemap.xml", timeout=20)
     assert r.status_code == 200, f"expected 200 got {r.status_code}"
     ctype = r.headers.get("content-type", "")
     assert "xml" in ctype, f"expected xml got {ctype}"
+    assert "<sitemapindex" in r.text, "expected a sitemap index"
+    shards = _shard_paths(r.text)
+    assert "/api/sitemap-pages.xml" in shards, f"pages shard missing from index: {shards}"
+    assert any(p.startswith("/api/sitemap-posts-") for p in shards), f"no posts shard in index: {shards}"
+
+
+def test_sitemap_pages_shard(session):
+    r = session.get(f"{BASE_URL}/api/sitemap-pages.xml", timeout=20)
+    assert r.status_code == 200, f"expected 200 got {r.status_code}"
+    assert "<urlset" in r.text
     url_count = r.text.count("<url>")
-    assert url_count >= 12, f"expected at least 12 <url> entries, got {url_count}"
+    assert url_count >= 12, f"expected at least 12 static <url> entries, got {url_count}"
+
+
+def test_sitemap_posts_shards_listed_in_index(session):
+    index = session.get(f"{BASE_URL}/api/sitemap.xml", timeout=20).text
+    posts = [p for p in _shard_paths(index) if p.startswith("/api/sitemap-posts-")]
+    r = session.get(f"{BASE_URL}{posts[0]}", timeout=20)
+    assert r.status_code == 200, f"{posts[0]}: expected 200 got {r.status_code}"
+    assert "<url><loc>https://www.stateofplay.club/" in r.text
+
+
+def test_sitemap_unknown_shard_404(session):
+    r = session.get(f"{BASE_URL}/api/sitemap-posts-1999.xml", timeout=20)
+    assert r.status_code == 404, f"expected 404 got {r.status_code}"
+
+
+def test_sitemap_gzip_negotiation(session):
+    gz = session.get(f"{BASE_URL}/api/sitemap-pages.xml", headers={"Accept-Encoding": "gzip"},
+                     timeout=20, stream=True)
+    raw = gz.raw.read(decode_content=False)
+    assert gz.headers.get("content-encoding") == "gzip"
+    assert raw[:2] == b"\x1f\x8b", "expected a gzip body"
+    assert "Accept-Encoding" in gz.headers.get("vary", "")
+
+    plain = session.get(f"{BASE_URL}/api/sitemap-pages.xml", headers={"Accept-Encoding": "identity"}, timeout=20)
+    assert "content-encoding" not in plain.headers
+    assert plain.text.startswith("<?xml")
+    # Different representations must not share a strong validator.
+    assert gz.headers["etag"] != plain.headers["etag"]
+
+    again = session.get(f"{BASE_URL}/api/sitemap-pages.xml",
+                        headers={"Accept-Encoding": "identity", "If-None-Match": plain.headers["etag"]},
+                        timeout=20)
+    assert again.status_code == 304
 
 
 # --- /api/robots.txt ---
@@ -0,0 +1,105 @@
+"""Article rate limiter: bucket semantics on both backends.
+
+The Mongo backend runs against the local MongoDB used by the other suites
+(MONGO_URL / DB_NAME), so several limiter instances stand in for several
+uvicorn workers sharing one store.
+"""
+import os
+import sys
+import uuid
+import asyncio
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import rate_limit  # noqa: E402
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'test_database')
+
+BURST = 6.0
+REFILL = 0.1
+
+
+def _run(coro_fn):
+    async def wrapper():
+        client = AsyncIOMotorClient(MONGO_URL)
+        try:
+            return await coro_fn(client[DB_NAME])
+        finally:
+            client.close()
+    return asyncio.run(wrapper())
+
+
+def _key():
+    return f"TEST_{uuid.uuid4().hex[:8]}@example.com|203.0.113.7"
+
+
+# ─── In-memory backend ──────────────────────────────────────────────────
+class TestMemoryLimiter:
+    def test_burst_then_limited_then_refill(self):
+        limiter = rate_limit.TokenBucketLimiter(BURST, REFILL)
+        key = _key()
+        assert [limiter.allow(key, now=100.0) for _ in range(7)] == [True] * 6 + [False]
+        assert limiter.allow(key, now=110.0) is True
+        assert limiter.allow(key, now=110.0) is False
+
+    def test_idle_buckets_expire_and_cap_holds(self):
+        limiter = rate_limit.TokenBucketLimiter(BURST, REFILL, max_entries=10)
+        for i in range(25):
+            limiter.allow(f"k{i}", now=100.0)
+        assert len(limiter) == 10
+        assert limiter.stats()['evicted'] == 15
+        limiter.allow("late", now=100.0 + BURST / REFILL)
+        assert len(limiter) == 1
+
+    def test_unconfigured_mongo_falls_back_to_memory(self):
+        limiter = rate_limit.create_limiter('article', BURST, REFILL, db=None, backend='mongo')
+        assert limiter.backend == 'memory'
+
+
+# ─── MongoDB backend ────────────────────────────────────────────────────
+class TestMongoLimiter:
+    def test_workers_share_one_bucket(self):
+        async def body(db):
+            workers = [
+                rate_limit.create_limiter('article_test', BURST, REFILL, db=db, backend='mongo')
+                for _ in range(3)
+            ]
+            assert all(w.backend == 'mongo' for w in workers)
+            key = _key()
+            try:
+                results = [await workers[i % 3].check(key) for i in range(9)]
+                assert results == [True] * 6 + [False] * 3
+                assert sum(w.stats()['errors'] for w in workers) == 0
+            finally:
+                await db[rate_limit.MONGO_COLLECTION].delete_many({'_id': f'article_test:{key}'})
+        _run(body)
+
+    def test_concurrent_requests_never_exceed_burst(self):
+        async def body(db):
+            limiter = rate_limit.create_limiter('article_test', BURST, REFILL, db=db, backend='mongo')
+            key = _key()
+            try:
+                results = await asyncio.gather(*(limiter.check(key) for _ in range(20)))
+                assert sum(results) == int(BURST)
+            finally:
+                await db[rate_limit.MONGO_COLLECTION].delete_many({'_id': f'article_test:{key}'})
+        _run(body)
+
+    def test_bucket_documents_carry_ttl(self):
+        async def body(db):
+            limiter = rate_limit.create_limiter('article_test', BURST, REFILL, db=db, backend='mongo')
+            key = _key()
+            coll = db[rate_limit.MONGO_COLLECTION]
+            try:
+                assert await limiter.check(key) is True
+                doc = await coll.find_one({'_id': f'article_test:{key}'})
+                assert doc['tokens'] == pytest.approx(BURST - 1, abs=0.01)
+                assert doc['expires_at'] is not None
+                indexes = await coll.index_information()
+                assert any(ix.get('expireAfterSeconds') == 0 for ix in indexes.values())
+            finally:
+                await coll.delete_many({'_id': f'article_test:{key}'})
+        _run(body)
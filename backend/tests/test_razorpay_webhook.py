@@ -0,0 +1,56 @@
+"""/api/razorpay/webhook signature handling, in-process.
+
+A forged delivery carrying a genuine event id must not take the dedup slot
+of the real event. Runs through FastAPI's TestClient with the queue in
+memory (no Mongo).
+"""
+import os
+import sys
+import hmac
+import json
+import uuid
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('JWT_SECRET', 'test-secret')
+import server  # noqa: E402
+
+SECRET = 'razorpay-test-secret'
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv('RAZORPAY_WEBHOOK_SECRET', SECRET)
+    return TestClient(server.app)
+
+
+def _post(api, body, event_id, signature=None):
+    headers = {'Content-Type': 'application/json', 'X-Razorpay-Event-Id': event_id}
+    if signature is not None:
+        headers['X-Razorpay-Signature'] = signature
+    return api.post('/api/razorpay/webhook', content=body, headers=headers).json()
+
+
+def _sign(body):
+    return hmac.new(SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+class TestRazorpaySignature:
+    def test_forged_delivery_does_not_claim_the_event_id(self, api):
+        event_id = f'evt_TEST{uuid.uuid4().hex[:10]}'
+        genuine = json.dumps({'event': 'payment.captured', 'payload': {}}).encode('utf-8')
+        forged = json.dumps({'event': 'payment.captured', 'forged': True}).encode('utf-8')
+
+        assert _post(api, forged, event_id, signature='0' * 64)['status'] == 'rejected'
+        assert _post(api, forged, event_id)['status'] == 'rejected'  # unsigned
+        result = _post(api, genuine, event_id, signature=_sign(genuine))
+        assert result == {'status': 'ok', 'event_id': event_id, 'duplicate': False}
+
+    def test_signed_redelivery_is_a_duplicate(self, api):
+        event_id = f'evt_TEST{uuid.uuid4().hex[:10]}'
+        body = json.dumps({'event': 'payment.captured', 'payload': {}}).encode('utf-8')
+        assert _post(api, body, event_id, signature=_sign(body))['duplicate'] is False
+        assert _post(api, body, event_id, signature=_sign(body))['duplicate'] is True
@@ -0,0 +1,96 @@
+"""Razorpay webhook → /api/check-recent-payment via the shared payment store."""
+import os
+import json
+import time
+import uuid
+
+import requests
+from pymongo import MongoClient
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://preview-polish.preview.emergentagent.com').rstrip('/')
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'test_database')
+
+_client = MongoClient(MONGO_URL)
+_db = _client[DB_NAME]
+
+
+def _unique_email():
+    return f"TEST_pay_{uuid.uuid4().hex[:8]}@example.com"
+
+
+def _send_payment(email):
+    body = {
+        'event': 'payment.captured',
+        'payload': {'payment': {'entity': {'id': f"pay_TEST{uuid.uuid4().hex[:10]}", 'email': email}}},
+    }
+    return requests.post(
+        f"{BASE_URL}/api/razorpay/webhook",
+        data=json.dumps(body),
+        headers={'Content-Type': 'application/json'},
+        timeout=30,
+    )
+
+
+def _check(email):
+    return requests.post(f"{BASE_URL}/api/check-recent-payment", json={'email': email}, timeout=30)
+
+
+def _wait_paid(email, attempts=10):
+    # The webhook only queues the event; the consumer records it shortly after.
+    for _ in range(attempts):
+        d = _check(email).json()
+        if d['paid']:
+            return d
+        time.sleep(0.5)
+    return d
+
+
+class TestRecentPayments:
+    def test_webhook_then_check_is_paid(self):
+        email = _unique_email()
+        try:
+            r = _send_payment(email.upper())
+            assert r.status_code == 200
+            assert r.json()['status'] == 'ok'
+            d = _wait_paid(email)
+            assert d['paid'] is True
+            assert d['message'] == 'Payment confirmed'
+        finally:
+            _db.recent_payments.delete_many({'_id': email.lower()})
+
+    def test_redelivery_is_deduplicated(self):
+        email = _unique_email()
+        event_id = f"evt_TEST{uuid.uuid4().hex[:10]}"
+        body = json.dumps({'event': 'payment.captured', 'payload': {'payment': {'entity': {'email': email}}}})
+        headers = {'Content-Type': 'application/json', 'X-Razorpay-Event-Id': event_id}
+        try:
+            first = requests.post(f"{BASE_URL}/api/razorpay/webhook", data=body, headers=headers, timeout=30)
+            second = requests.post(f"{BASE_URL}/api/razorpay/webhook", data=body, headers=headers, timeout=30)
+            assert first.json() == {'status': 'ok', 'event_id': event_id, 'duplicate': False}
+            assert second.json()['duplicate'] is True
+            assert _wait_paid(email)['paid'] is True
+        finally:
+            _db.recent_payments.delete_many({'_id': email.lower()})
+            _db.razorpay_events.delete_many({'_id': event_id})
+
+    def test_unknown_email_not_paid(self):
+        d = _check(_unique_email()).json()
+        assert d['paid'] is False
+
+    def test_payment_persisted_with_ttl(self):
+        email = _unique_email()
+        try:
+            assert _send_payment(email).status_code == 200
+            doc = None
+            for _ in range(10):
+                doc = _db.recent_payments.find_one({'_id': email.lower()})
+                if doc:
+                    break
+                time.sleep(0.5)
+            assert doc is not None
+            assert doc['expires_at'] > doc['paid_at']
+            indexes = _db.recent_payments.index_information()
+            assert any(ix.get('expireAfterSeconds') == 0 for ix in indexes.values())
+        finally:
+            _db.recent_payments.delete_many({'_id': email.lower()})
@@ -200,4 +200,10 @@ class TestOgEndpointsStillWork:
                          headers={"User-Agent": MOZILLA_UA}, timeout=20)
         assert r.status_code == 200
         assert "xml" in r.headers.get("content-type", "")
-        assert "<url>" in r.text
+        # /sitemap.xml is an index; the static routes live in the pages shard.
+        assert "<sitemapindex" in r.text
+        assert "/sitemap-pages.xml</loc>" in r.text
+        shard = requests.get(f"{BASE_URL}/api/sitemap-pages.xml",
+                             headers={"User-Agent": MOZILLA_UA}, timeout=20)
+        assert shard.status_code == 200
+        assert "<url>" in shard.text
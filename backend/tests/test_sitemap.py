@@ -0,0 +1,156 @@
+"""sitemap.py: year shards, encoding and the shared file store, in-process."""
+import os
+import sys
+import gzip
+import asyncio
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghost_client  # noqa: E402
+import sitemap  # noqa: E402
+
+
+def _xml(doc):
+    gz, _ = doc
+    return gzip.decompress(gz).decode('utf-8')
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'sitemap.json')
+
+
+def _store(path, posts):
+    async def fill():
+        store = sitemap.SitemapStore(path)
+        for slug, lastmod, published in posts:
+            await store.upsert(slug, lastmod, published)
+        store.loaded = True
+        return store
+    return asyncio.run(fill())
+
+
+POSTS = [
+    ('ipl-auction', '2024-03-02T10:00:00.000Z', '2024-03-01T10:00:00.000Z'),
+    ('isl-rights', '2024-05-01T10:00:00.000Z', '2024-05-01T10:00:00.000Z'),
+    ('bcci-media', '2025-01-10T10:00:00.000Z', '2025-01-09T10:00:00.000Z'),
+]
+
+
+class TestShards:
+    def test_posts_are_sharded_by_publication_year(self, store_path):
+        store = _store(store_path, POSTS)
+        body = _xml(store.document('posts-2024'))
+        assert body.startswith('<?xml') and body.rstrip().endswith('</urlset>')
+        assert f'{sitemap.SITE}/ipl-auction' in body and f'{sitemap.SITE}/isl-rights' in body
+        assert 'bcci-media' not in body
+        assert store.document('posts-1999') is None
+
+    def test_index_lists_pages_and_every_year(self, store_path):
+        store = _store(store_path, POSTS)
+        index = _xml(store.document(sitemap.INDEX))
+        assert '<sitemapindex' in index
+        assert index.index('sitemap-posts-2025.xml') < index.index('sitemap-posts-2024.xml')
+        assert 'sitemap-pages.xml' in index
+        assert '<lastmod>2024-05-01T10:00:00.000Z</lastmod>' in index
+        assert _xml(store.document(sitemap.PAGES)).count('<url>') == len(sitemap.STATIC_PATHS)
+
+    def test_flat_document_has_everything(self, store_path):
+        store = _store(store_path, POSTS)
+        assert _xml(store.document(sitemap.FLAT)).count('<url>') == len(sitemap.STATIC_PATHS) + len(POSTS)
+
+    def test_edit_reencodes_only_its_shard(self, store_path):
+        store = _store(store_path, POSTS)
+        before = {name: store.document(name) for name in ('posts-2024', 'posts-2025', sitemap.INDEX)}
+        encodes = store.encodes
+
+        asyncio.run(store.upsert('bcci-media', '2025-02-01T00:00:00.000Z', '2025-01-09T10:00:00.000Z'))
+        assert store.document('posts-2024') is before['posts-2024']
+        assert store.document('posts-2025')[1] != before['posts-2025'][1]
+        assert store.document(sitemap.INDEX)[1] != before[sitemap.INDEX][1]
+        assert store.encodes == encodes + 2
+
+    def test_encoding_is_deterministic(self, store_path):
+        a = _store(store_path, POSTS).document('posts-2024')
+        b = _store(store_path + '.2', POSTS).document('posts-2024')
+        assert a == b
+
+    def test_removing_last_post_drops_the_shard(self, store_path):
+        store = _store(store_path, POSTS)
+        asyncio.run(store.remove('bcci-media'))
+        assert store.document('posts-2025') is None
+        assert 'posts-2025' not in _xml(store.document(sitemap.INDEX))
+
+
+class TestPostEvents:
+    @pytest.fixture
+    def ghost(self, monkeypatch):
+        """Content API stand-in serving the slugs in `published`."""
+        published = {}
+
+        def handler(request):
+            slug = request.url.path.rstrip('/').rsplit('/', 1)[-1]
+            if slug not in published:
+                return httpx.Response(404, json={'errors': [{'message': 'Resource not found'}]})
+            return httpx.Response(200, json={'posts': [{'slug': slug, **published[slug]}]})
+
+        client = ghost_client._build_client()
+        client._transport = httpx.MockTransport(handler)
+        monkeypatch.setattr(ghost_client, '_client', client)
+        return published
+
+    def test_unpublish_and_rename(self, store_path, monkeypatch, ghost):
+        store = _store(store_path, POSTS)
+        monkeypatch.setattr(sitemap, 'store', store)
+        ghost['ipl-auction-2024'] = {'updated_at': '2024-03-03', 'published_at': '2024-03-01',
+                                     'visibility': 'public'}
+
+        async def body():
+            await sitemap.apply_post_event('post.edited', {'slug': 'ipl-auction-2024'},
+                                           {'slug': 'ipl-auction'})
+            await sitemap.apply_post_event('post.unpublished', {'slug': 'isl-rights'}, {})
+        asyncio.run(body())
+        body = _xml(store.document('posts-2024'))
+        assert 'ipl-auction-2024' in body
+        assert '/ipl-auction<' not in body and 'isl-rights' not in body
+
+    def test_payload_is_not_trusted(self, store_path, monkeypatch, ghost):
+        store = _store(store_path, POSTS)
+        monkeypatch.setattr(sitemap, 'store', store)
+        ghost['isl-rights'] = {'updated_at': '2024-05-01T10:00:00.000Z',
+                               'published_at': '2024-05-01T10:00:00.000Z', 'visibility': 'public'}
+
+        async def body():
+            # An unknown slug claimed as published, and a live post claimed deleted.
+            await sitemap.apply_post_event(
+                'post.edited', {'slug': 'buy-cheap-pills', 'status': 'published'}, {})
+            await sitemap.apply_post_event('post.deleted', {}, {'slug': 'isl-rights'})
+        asyncio.run(body())
+        assert 'buy-cheap-pills' not in store.posts
+        assert 'isl-rights' in store.posts
+
+
+class TestFileStore:
+    def test_workers_merge_writes_and_pick_up_each_others_changes(self, store_path, monkeypatch):
+        monkeypatch.setattr(sitemap, 'SITEMAP_REFRESH_SECONDS', 0)
+
+        async def body():
+            a, b = sitemap.SitemapStore(store_path), sitemap.SitemapStore(store_path)
+            await a.upsert('one', '2024-01-01', '2024-01-01')
+            await a.ensure_loaded()
+            await b.ensure_loaded()
+            await a.upsert('two', '2024-02-01', '2024-02-01')
+            await b.upsert('three', '2023-01-01', '2023-01-01')  # b has not seen 'two'
+            await a.ensure_loaded()
+            return a, b
+        a, b = asyncio.run(body())
+        assert sorted(a.posts) == sorted(b.posts) == ['one', 'three', 'two']
+        assert sorted(sitemap.SitemapStore(store_path)._read_file()) == ['one', 'three', 'two']
+
+    def test_reads_pre_sharding_files(self, store_path):
+        with open(store_path, 'w') as f:
+            f.write('{"posts": {"old-post": "2023-06-01T00:00:00.000Z"}}')
+        posts = sitemap.SitemapStore(store_path)._read_file()
+        assert posts == {'old-post': ('2023-06-01T00:00:00.000Z', '2023')}
@@ -0,0 +1,180 @@
+"""webhook_queue.py: dedup, retry/backoff and lease reclaim.
+
+The in-memory backend runs in-process. The Mongo tests use the local
+MongoDB of the other suites (MONGO_URL / DB_NAME); two queue instances on
+one collection stand in for two uvicorn workers.
+"""
+import os
+import sys
+import uuid
+import asyncio
+from datetime import timedelta
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import webhook_queue  # noqa: E402
+from webhook_queue import WebhookQueue  # noqa: E402
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'test_database')
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(webhook_queue, 'WEBHOOK_RETRY_BASE_SECONDS', 0.01)
+    monkeypatch.setattr(webhook_queue, 'WEBHOOK_POLL_SECONDS', 0.01)
+
+
+async def _until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.005)
+
+
+# ─── In-memory backend ──────────────────────────────────────────────────
+class TestMemoryQueue:
+    def test_failed_handler_is_retried_until_it_succeeds(self):
+        async def body():
+            attempts = []
+
+            async def handler(raw):
+                attempts.append(raw)
+                if len(attempts) < 3:
+                    raise RuntimeError('downstream busy')
+
+            queue = WebhookQueue('test', handler)
+            queue.init(None)
+            queue.start()
+            try:
+                assert await queue.enqueue('evt-1', b'{}') is True
+                await _until(lambda: queue.counters['processed'] == 1)
+            finally:
+                await queue.shutdown()
+            assert len(attempts) == 3
+            assert queue.counters['retries'] == 2
+            stats = await queue.stats()
+            assert (stats['queued'], stats['processing'], stats['depth']) == (0, 0, 0)
+        asyncio.run(body())
+
+    def test_gives_up_after_max_attempts(self, monkeypatch):
+        monkeypatch.setattr(webhook_queue, 'WEBHOOK_MAX_ATTEMPTS', 3)
+
+        async def body():
+            calls = []
+
+            async def handler(raw):
+                calls.append(raw)
+                raise RuntimeError('always')
+
+            queue = WebhookQueue('test', handler)
+            queue.init(None)
+            queue.start()
+            try:
+                await queue.enqueue('evt-1', b'{}')
+                await _until(lambda: queue.counters['failed'] == 1)
+            finally:
+                await queue.shutdown()
+            assert len(calls) == 3 and queue.counters['retries'] == 2
+        asyncio.run(body())
+
+    def test_undecodable_payload_is_not_retried(self):
+        async def body():
+            calls = []
+
+            async def handler(raw):
+                calls.append(raw)
+                raise ValueError('bad json')
+
+            queue = WebhookQueue('test', handler)
+            queue.init(None)
+            queue.start()
+            try:
+                await queue.enqueue('evt-1', b'nope')
+                await _until(lambda: queue.counters['failed'] == 1)
+            finally:
+                await queue.shutdown()
+            assert len(calls) == 1 and queue.counters['retries'] == 0
+        asyncio.run(body())
+
+    def test_redelivery_is_dropped(self):
+        async def body():
+            queue = WebhookQueue('test', lambda raw: asyncio.sleep(0))
+            queue.init(None)
+            assert await queue.enqueue('evt-1', b'{}') is True
+            assert await queue.enqueue('evt-1', b'{}') is False
+            assert queue.counters['duplicates'] == 1
+            assert (await queue.stats())['queued'] == 1
+        asyncio.run(body())
+
+
+# ─── MongoDB backend ────────────────────────────────────────────────────
+def _run(coro_fn):
+    async def wrapper():
+        client = AsyncIOMotorClient(MONGO_URL)
+        name = f'test_webhook_queue_{uuid.uuid4().hex[:8]}'
+        try:
+            return await coro_fn(client[DB_NAME], name)
+        finally:
+            await client[DB_NAME].drop_collection(name)
+            client.close()
+    return asyncio.run(wrapper())
+
+
+class TestMongoQueue:
+    def test_expired_lease_is_reclaimed_by_another_worker(self):
+        async def body(db, name):
+            handled = []
+
+            async def handler(raw):
+                handled.append(raw)
+
+            crashed = WebhookQueue(name, handler)
+            crashed.init(db)
+            await crashed.enqueue('evt-1', b'payload')
+            event = await crashed._claim()  # leased, then the worker "dies"
+            assert event['status'] == webhook_queue.PROCESSING
+
+            survivor = WebhookQueue(name, handler)
+            survivor.init(db)
+            assert await survivor._claim() is None  # lease still held
+            stats = await survivor.stats()
+            assert (stats['queued'], stats['processing']) == (0, 1)
+
+            await db[name].update_one({'_id': 'evt-1'}, {'$set': {
+                'lease_until': webhook_queue._now() - timedelta(seconds=1)}})
+            reclaimed = await survivor._claim()
+            assert reclaimed['_id'] == 'evt-1' and reclaimed['attempts'] == 2
+            await survivor._process(reclaimed)
+            doc = await db[name].find_one({'_id': 'evt-1'})
+            assert doc['status'] == webhook_queue.DONE and 'body' not in doc
+            assert handled == [b'payload']
+        _run(body)
+
+    def test_retry_is_rescheduled_in_the_store(self):
+        async def body(db, name):
+            async def handler(raw):
+                raise RuntimeError('downstream busy')
+
+            queue = WebhookQueue(name, handler)
+            queue.init(db)
+            await queue.enqueue('evt-1', b'payload')
+            await queue._process(await queue._claim())
+            doc = await db[name].find_one({'_id': 'evt-1'})
+            assert doc['status'] == webhook_queue.PENDING
+            assert doc['attempts'] == 1 and 'downstream busy' in doc['error']
+            assert webhook_queue._aware(doc['next_attempt_at']) > webhook_queue._aware(doc['received_at'])
+            assert await queue._claim() is None  # not due yet
+        _run(body)
+
+    def test_redelivery_across_workers_is_dropped(self):
+        async def body(db, name):
+            first, second = WebhookQueue(name, None), WebhookQueue(name, None)
+            first.init(db)
+            second.init(db)
+            assert await first.enqueue('evt-1', b'{}') is True
+            assert await second.enqueue('evt-1', b'{}') is False
+            assert await db[name].count_documents({}) == 1
+        _run(body)
@@ -0,0 +1,271 @@
+"""
+webhook_queue.py — durable, deduplicated queue between a webhook's
+acknowledgement and the work it triggers.
+
+The endpoint only verifies and calls `enqueue(event_id, body)`, then
+answers; a background consumer decodes and handles the event later, so a
+burst of deliveries (a campaign launch) never slows the acknowledgement the
+provider is timing.
+
+  * Durable — with Mongo configured, events are inserted into the queue's
+    collection before the webhook returns, so a restart loses nothing and
+    any worker can process them. Without Mongo (or if the insert fails) the
+    event goes to an in-process heap instead.
+  * Idempotent — the provider's event id is the document `_id`, so a
+    redelivery of an event already queued or done is acknowledged and
+    dropped (`duplicates`).
+  * Retried — a handler exception reschedules the event with exponential
+    backoff (WEBHOOK_RETRY_BASE_SECONDS · 2^attempt, capped at 1 h) until
+    WEBHOOK_MAX_ATTEMPTS, then it is parked as `failed`. ValueError (an
+    undecodable payload) fails immediately. A worker that dies mid-event
+    leaves it `processing`; the lease expires and another worker takes it.
+  * Observable — `stats()` reports queued and processing counts (and
+    their sum as depth), the age of the oldest waiting event, and
+    enqueue→done lag.
+
+Finished events are kept for WEBHOOK_RETENTION_DAYS (TTL index) so late
+redeliveries are still recognised as duplicates.
+
+Configuration (all optional):
+  - WEBHOOK_MAX_ATTEMPTS         attempts before an event is parked (default 8)
+  - WEBHOOK_RETRY_BASE_SECONDS   first retry delay                  (default 5)
+  - WEBHOOK_LEASE_SECONDS        in-flight lease before reclaim     (default 120)
+  - WEBHOOK_POLL_SECONDS         idle poll for other workers' events (default 5)
+  - WEBHOOK_RETENTION_DAYS       how long done/failed ids are kept  (default 7)
+"""
+from __future__ import annotations
+
+import os
+import heapq
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '8'))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.environ.get('WEBHOOK_RETRY_BASE_SECONDS', '5'))
+WEBHOOK_LEASE_SECONDS = float(os.environ.get('WEBHOOK_LEASE_SECONDS', '120'))
+WEBHOOK_POLL_SECONDS = float(os.environ.get('WEBHOOK_POLL_SECONDS', '5'))
+WEBHOOK_RETENTION_DAYS = float(os.environ.get('WEBHOOK_RETENTION_DAYS', '7'))
+MAX_RETRY_DELAY = 3600.0
+SEEN_IDS_MAX = 10_000  # in-process dedup window when running without Mongo
+
+PENDING, PROCESSING, DONE, FAILED = 'pending', 'processing', 'done', 'failed'
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: datetime) -> datetime:
+    # pymongo hands back naive UTC datetimes unless the client is tz_aware.
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class WebhookQueue:
+    """One queue per provider; `handler(body: bytes)` does the work."""
+
+    def __init__(self, collection: str, handler: Callable[[bytes], Awaitable[None]]):
+        self.collection_name = collection
+        self.handler = handler
+        self._coll = None
+        self._indexed = False
+        self._heap: list = []          # (next_attempt_at, seq, event) — in-process events
+        self._seq = 0
+        self._seen: OrderedDict = OrderedDict()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight_local = 0      # in-process events being handled
+        self._last_lag: Optional[float] = None
+        self.counters = {'enqueued': 0, 'duplicates': 0, 'processed': 0,
+                         'retries': 0, 'failed': 0, 'store_errors': 0}
+
+    def init(self, db_handle) -> None:
+        self._coll = db_handle[self.collection_name] if db_handle is not None else None
+
+    async def _ensure_indexes(self) -> None:
+        if not self._indexed:
+            await self._coll.create_index([('status', 1), ('next_attempt_at', 1)])
+            await self._coll.create_index('expires_at', expireAfterSeconds=0)
+            self._indexed = True
+
+    # ─── Producer ────────────────────────────────────────────────────────────
+    async def enqueue(self, event_id: str, body: bytes, **fields) -> bool:
+        """Queue an event. Returns False if `event_id` was already seen."""
+        if event_id in self._seen:
+            self.counters['duplicates'] += 1
+            return False
+        now = _now()
+        event = {'_id': event_id, 'body': body, 'status': PENDING, 'attempts': 0,
+                 'received_at': now, 'next_attempt_at': now, **fields}
+        if self._coll is not None:
+            from pymongo.errors import DuplicateKeyError
+            try:
+                await self._ensure_indexes()
+                await self._coll.insert_one(event)
+            except DuplicateKeyError:
+                self._remember(event_id)
+                self.counters['duplicates'] += 1
+                return False
+            except Exception as e:
+                self.counters['store_errors'] += 1
+                logger.error(f'{self.collection_name}: enqueue of {event_id} fell back to memory: {e!r}')
+                self._push(event)
+        else:
+            self._push(event)
+        self._remember(event_id)
+        self.counters['enqueued'] += 1
+        self._wake.set()
+        return True
+
+    def _remember(self, event_id: str) -> None:
+        self._seen[event_id] = None
+        self._seen.move_to_end(event_id)
+        if len(self._seen) > SEEN_IDS_MAX:
+            self._seen.popitem(last=False)
+
+    def _push(self, event: dict) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (event['next_attempt_at'], self._seq, event))
+
+    # ─── Consumer ────────────────────────────────────────────────────────────
+    async def _claim(self) -> Optional[dict]:
+        now = _now()
+        if self._heap and self._heap[0][0] <= now:
+            event = heapq.heappop(self._heap)[2]
+            event['attempts'] += 1
+            event['local'] = True
+            return event
+        if self._coll is None:
+            return None
+        from pymongo import ReturnDocument
+        return await self._coll.find_one_and_update(
+            {'$or': [
+                {'status': PENDING, 'next_attempt_at': {'$lte': now}},
+                {'status': PROCESSING, 'lease_until': {'$lte': now}},
+            ]},
+            {'$set': {'status': PROCESSING, 'lease_until': now + timedelta(seconds=WEBHOOK_LEASE_SECONDS)},
+             '$inc': {'attempts': 1}},
+            sort=[('received_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _finish(self, event: dict, status: str, error: Optional[str] = None,
+                      retry_at: Optional[datetime] = None) -> None:
+        in_memory = event.get('local', False)
+        if retry_at is not None:
+            event['next_attempt_at'] = retry_at
+            if in_memory:
+                self._push(event)
+            else:
+                await self._coll.update_one({'_id': event['_id']}, {'$set': {
+                    'status': PENDING, 'next_attempt_at': retry_at, 'error': error}})
+            return
+        if in_memory:
+            return
+        done_at = _now()
+        # Failed events keep their body so they can be inspected and replayed.
+        unset = {'lease_until': '', 'body': ''} if status == DONE else {'lease_until': ''}
+        await self._coll.update_one({'_id': event['_id']}, {
+            '$set': {'status': status, 'error': error, 'done_at': done_at,
+                     'expires_at': done_at + timedelta(days=WEBHOOK_RETENTION_DAYS)},
+            '$unset': unset,
+        })
+
+    async def _process(self, event: dict) -> None:
+        event_id, attempts = event['_id'], event['attempts']
+        local = event.get('local', False)
+        self._in_flight_local += local
+        try:
+            await self.handler(bytes(event['body']))
+        except ValueError as e:
+            self.counters['failed'] += 1
+            logger.error(f'{self.collection_name}: {event_id} rejected: {e!r}')
+            await self._finish(event, FAILED, error=repr(e))
+        except Exception as e:
+            if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                self.counters['failed'] += 1
+                logger.error(f'{self.collection_name}: {event_id} failed after {attempts} attempts: {e!r}')
+                await self._finish(event, FAILED, error=repr(e))
+            else:
+                delay = min(MAX_RETRY_DELAY, WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                self.counters['retries'] += 1
+                logger.warning(f'{self.collection_name}: {event_id} attempt {attempts} failed, retrying in {delay:.0f}s: {e!r}')
+                await self._finish(event, PENDING, error=repr(e), retry_at=_now() + timedelta(seconds=delay))
+        else:
+            self.counters['processed'] += 1
+            self._last_lag = (_now() - _aware(event['received_at'])).total_seconds()
+            await self._finish(event, DONE)
+        finally:
+            self._in_flight_local -= local
+
+    def _next_wakeup(self) -> float:
+        timeout = WEBHOOK_POLL_SECONDS if self._coll is not None else MAX_RETRY_DELAY
+        if self._heap:
+            timeout = min(timeout, max(0.0, (self._heap[0][0] - _now()).total_seconds()))
+        return timeout
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                event = await self._claim()
+            except Exception as e:
+                self.counters['store_errors'] += 1
+                logger.error(f'{self.collection_name}: claim failed: {e!r}')
+                event = None
+            if event is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self._next_wakeup())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._process(event)
+            except Exception as e:
+                # Only the bookkeeping write can get here; the lease expiry
+                # hands the event back out.
+                self.counters['store_errors'] += 1
+                logger.error(f'{self.collection_name}: could not record outcome of {event["_id"]}: {e!r}')
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ─── Metrics ─────────────────────────────────────────────────────────────
+    async def stats(self) -> dict:
+        now = _now()
+        # Each event is counted once: in-process ones here, the rest from
+        # Mongo (whose PROCESSING count already covers this worker's leases).
+        queued = len(self._heap)
+        processing = self._in_flight_local
+        oldest = min((item[2]['received_at'] for item in self._heap), default=None)
+        if self._coll is not None:
+            waiting = {'status': {'$in': [PENDING, PROCESSING]}}
+            try:
+                queued += await self._coll.count_documents({'status': PENDING})
+                processing += await self._coll.count_documents({'status': PROCESSING})
+                doc = await self._coll.find_one(waiting, sort=[('received_at', 1)], projection={'received_at': 1})
+                if doc and (oldest is None or _aware(doc['received_at']) < oldest):
+                    oldest = _aware(doc['received_at'])
+            except Exception as e:
+                logger.error(f'{self.collection_name}: stats query failed: {e!r}')
+        return {
+            **self.counters,
+            'backend': 'mongo' if self._coll is not None else 'memory',
+            'queued': queued,
+            'processing': processing,
+            'depth': queued + processing,
+            'oldest_waiting_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+            'last_lag_seconds': round(self._last_lag, 3) if self._last_lag is not None else None,
+        }